@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import timedelta
 
-from app.core.database import get_db
+from app.core.database import get_db, get_async_db
 from app.core.security import verify_password, get_password_hash, create_access_token, decode_token
 from app.core.config import settings
 from app.models.models import User, Plan, Subscription, CreditTransaction, SubscriptionStatus
@@ -18,28 +20,40 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+
+def _token_user_id(token: str) -> int:
     payload = decode_token(token)
-    if payload is None:
-        raise credentials_exception
-    
-    user_id: int = int(payload.get("sub"))
-    if user_id is None:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    if payload is None or payload.get("sub") is None:
+        raise _credentials_exception()
+    return int(payload.get("sub"))
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> User:
+    """Authenticated user for sync routes (shares the route's get_db session)"""
+    user = db.query(User).filter(User.id == _token_user_id(token)).first()
     if user is None:
-        raise credentials_exception
-    
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Authenticated user for async routes (shares the route's get_async_db session)"""
+    user = (await db.execute(select(User).where(User.id == _token_user_id(token)))).scalar_one_or_none()
+    if user is None:
+        raise _credentials_exception()
     return user
 
 
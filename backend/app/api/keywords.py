@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 from app.core.database import get_db
 from app.api.auth import get_current_user
-from app.models.models import User, Keyword, RankResult, Project, ProjectMember
-from app.schemas.schemas import KeywordHistoryResponse, RankResultResponse
+from app.models.models import User, Keyword, Project, ProjectMember
+from app.schemas.schemas import KeywordHistoryResponse
+from app.services.serp_store import attach_serps
+from app.services.scheduling import get_now
+from app.services.history import page_results, MAX_PAGE_SIZE
+from app.services import rollups
 
 router = APIRouter(prefix="/keywords", tags=["Keywords"])
 
@@ -13,10 +18,21 @@ router = APIRouter(prefix="/keywords", tags=["Keywords"])
 @router.get("/{keyword_id}/history", response_model=KeywordHistoryResponse)
 def get_keyword_history(
     keyword_id: int,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    resolution: Optional[str] = Query(None, description="raw, day or week; picked from the range when omitted"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page (raw results)"),
+    limit: int = Query(30, ge=1, le=MAX_PAGE_SIZE),
+    include_serp: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get keyword ranking history with SERP results"""
+    """Get keyword ranking history, optionally with SERP results
+
+    Raw results are paged newest first: pass next_cursor back as `cursor`
+    for the following page. With a `from` range, short ranges return raw
+    results and longer ones daily or weekly rollups.
+    """
     
     # Check ownership or membership
     keyword = db.query(Keyword).join(Project).filter(
@@ -35,13 +51,31 @@ def get_keyword_history(
         if not member:
             raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get history (last 30 records)
-    results = db.query(RankResult).filter(
-        RankResult.keyword_id == keyword_id
-    ).order_by(RankResult.checked_at.desc()).limit(30).all()
+    if resolution is not None and resolution not in (rollups.RAW,) + rollups.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail="resolution must be raw, day or week")
+    
+    if resolution is None:
+        resolution = rollups.RAW if from_ is None or cursor else rollups.pick_resolution(from_, to or get_now())
+    if resolution != rollups.RAW:
+        if from_ is None:
+            raise HTTPException(status_code=400, detail="from is required for rollups")
+        return KeywordHistoryResponse(
+            keyword_id=keyword_id,
+            keyword=keyword.keyword,
+            resolution=resolution,
+            rollups=rollups.load_rollups(db, keyword_id, resolution, from_, to)
+        )
+    
+    try:
+        results, next_cursor = page_results(db, keyword_id, limit, cursor, from_, to, include_serp)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if include_serp:
+        results = attach_serps(db, results)
     
     return KeywordHistoryResponse(
         keyword_id=keyword_id,
         keyword=keyword.keyword,
-        history=results
+        history=results,
+        next_cursor=next_cursor
     )
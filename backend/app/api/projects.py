@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 from app.core.database import get_db
 from app.api.auth import get_current_user
-from app.models.models import User, Project, Keyword, ProjectMember, RankResult
+from app.models.models import User, Project, Keyword, ProjectMember, KeywordLatest
+from app.services.scheduling import get_now, reschedule_keyword
+from app.services.history import page_results, MAX_PAGE_SIZE
+from app.services.serp_store import attach_serps
+from app.services.rerank import rerank_project_job
 from app.schemas.schemas import (
     ProjectCreate, ProjectUpdate, ProjectResponse, ProjectMemberAdd,
     KeywordCreate, KeywordUpdate, KeywordResponse, KeywordWithResults,
@@ -113,6 +118,7 @@ def get_project(
 def update_project(
     project_id: int,
     project_update: ProjectUpdate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -124,6 +130,7 @@ def update_project(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    previous_target = project.subdomain or project.root_domain
     if project_update.name is not None:
         project.name = project_update.name
     if project_update.description is not None:
@@ -138,6 +145,10 @@ def update_project(
     db.commit()
     db.refresh(project)
     
+    # New target domain: re-rank stored history from saved SERPs (no API calls)
+    if (project.subdomain or project.root_domain) != previous_target:
+        background_tasks.add_task(rerank_project_job, project.id)
+    
     keywords_count = db.query(Keyword).filter(Keyword.project_id == project.id).count()
     
     return ProjectResponse(
@@ -193,33 +204,13 @@ def get_keywords(
         if not member:
             raise HTTPException(status_code=403, detail="Access denied")
     
-    keywords = db.query(Keyword).filter(Keyword.project_id == project_id).all()
+    # Latest rank per keyword from the keyword_latest read model (one row each, no rank_results scan)
+    rows = db.query(Keyword, KeywordLatest).outerjoin(
+        KeywordLatest, KeywordLatest.keyword_id == Keyword.id
+    ).filter(Keyword.project_id == project_id).all()
     
     result = []
-    for k in keywords:
-        try:
-            latest_result = db.query(RankResult).filter(
-                RankResult.keyword_id == k.id
-            ).order_by(RankResult.checked_at.desc()).first()
-        except:
-            latest_result = None
-        
-        try:
-            results_count = db.query(RankResult).filter(
-                RankResult.keyword_id == k.id
-            ).count()
-        except:
-            results_count = 0
-        
-        rank = None
-        url = None
-        if latest_result:
-            try:
-                rank = latest_result.rank
-                url = latest_result.url
-            except:
-                pass
-        
+    for k, latest in rows:
         result.append(KeywordWithResults(
             id=k.id,
             project_id=k.project_id,
@@ -229,9 +220,12 @@ def get_keywords(
             tracking_interval_hours=k.tracking_interval_hours,
             is_active=k.is_active,
             created_at=k.created_at,
-            results_count=results_count,
-            latest_rank=rank,
-            latest_url=url
+            results_count=latest.results_count if latest else 0,
+            latest_rank=latest.rank if latest else None,
+            latest_url=latest.url if latest else None,
+            latest_checked_at=latest.checked_at if latest else None,
+            previous_rank=latest.previous_rank if latest else None,
+            rank_delta=latest.rank_delta if latest else None
         ))
     
     return result
@@ -266,7 +260,8 @@ def create_keyword(
         keyword=keyword.keyword,
         country_code=keyword.country_code,
         language=keyword.language,
-        tracking_interval_hours=keyword.tracking_interval_hours
+        tracking_interval_hours=keyword.tracking_interval_hours,
+        next_due_at=get_now()  # 新关键词立即进入调度队列
     )
     db.add(db_keyword)
     db.commit()
@@ -306,17 +301,23 @@ def update_keyword(
         keyword.country_code = keyword_update.country_code
     if keyword_update.language is not None:
         keyword.language = keyword_update.language
+    reschedule = False
     if keyword_update.tracking_interval_hours is not None:
+        reschedule = keyword.tracking_interval_hours != keyword_update.tracking_interval_hours
         keyword.tracking_interval_hours = keyword_update.tracking_interval_hours
     if keyword_update.is_active is not None:
+        reschedule = reschedule or (keyword_update.is_active and not keyword.is_active)
         keyword.is_active = keyword_update.is_active
     
+    # 间隔变更或重新启用时重新计算下次追踪时间
+    if reschedule:
+        reschedule_keyword(db, keyword)
+    
     db.commit()
     db.refresh(keyword)
     
-    results_count = db.query(RankResult).filter(
-        RankResult.keyword_id == keyword.id
-    ).count()
+    latest = db.get(KeywordLatest, keyword.id)
+    results_count = latest.results_count if latest else 0
     
     return KeywordResponse(
         id=keyword.id,
@@ -367,9 +368,16 @@ def delete_keyword(
 @router.get("/keywords/{keyword_id}/results", response_model=List[RankResultResponse])
 def get_keyword_results(
     keyword_id: int,
+    response: Response,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    include_serp: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Results newest first; the next page's cursor is sent in the X-Next-Cursor header"""
     keyword = db.query(Keyword).join(Project).filter(
         Keyword.id == keyword_id,
         Project.user_id == current_user.id
@@ -378,11 +386,14 @@ def get_keyword_results(
     if not keyword:
         raise HTTPException(status_code=404, detail="Keyword not found")
     
-    results = db.query(RankResult).filter(
-        RankResult.keyword_id == keyword_id
-    ).order_by(RankResult.checked_at.desc()).limit(100).all()
+    try:
+        results, next_cursor = page_results(db, keyword_id, limit, cursor, from_, to, include_serp)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    return results
+    return attach_serps(db, results) if include_serp else results
 
 
 # ============ Share Project ============
@@ -1,12 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 import logging
 import os
 
-from app.core.database import get_db
-from app.api.auth import get_current_user
-from app.models.models import User, Keyword, RankResult, Subscription, CreditTransaction, SubscriptionStatus, ProjectMember
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.api.auth import get_current_user_async
+from app.models.models import User, Keyword, RankResult, ProjectMember
 from app.services.tracker import google_tracker
+from app.services.admission import INTERACTIVE
+from app.services.result_writer import result_writer, build_entry, store_results
+from app.services.serp_store import attach_serps, snapshot_stats
+from app.services.credits import deduct_credits, refund_credits
+from app.services.tracking_runs import enqueue_run, get_run, describe_run
 from app.schemas.schemas import RankResultResponse
 
 logger = logging.getLogger(__name__)
@@ -15,18 +23,52 @@ router = APIRouter(prefix="/tracking", tags=["Tracking"])
 
 
 @router.post("/process")
-async def process_due_keywords():
-    """定时任务：处理所有到期的关键词（供 Railway Cron 调用）"""
-    from app.services.scheduler import process_due_keywords as run_scheduler
+async def process_due_keywords(db: AsyncSession = Depends(get_async_db)):
+    """定时任务：启动一次到期关键词处理（供 Railway Cron 调用）
 
+    立即返回 job_id，处理在后台进行；已有运行中的任务时返回该任务而不是再启动一个，
+    重试的 Cron 调用不会造成并发运行。进度见 GET /process/{job_id}。
+    """
     try:
-        result = await run_scheduler()
-        return {"status": "success", "result": result}
+        run, created = await enqueue_run(db)
+        return {"status": "success", "created": created, "job": describe_run(run)}
     except Exception as e:
-        logger.error(f"定时任务执行失败: {e}")
+        logger.error(f"定时任务启动失败: {e}")
         return {"status": "error", "error": str(e)}
 
 
+@router.get("/process/{job_id}")
+async def process_progress(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """到期关键词处理任务的进度（计划数、已完成、失败、消耗积分、预计剩余时间）"""
+    run = await get_run(db, job_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return describe_run(run)
+
+
+@router.get("/stats")
+async def tracking_stats(db: AsyncSession = Depends(get_async_db)):
+    """追踪服务运行指标（Serper 连接池复用率、结果批量写入、派发速率、最近一次调度运行等）"""
+    from app.services.scheduler import last_run_stats, dispatch_meter, planned_dispatch_rate
+
+    return {
+        "dispatch": {
+            "smoothing": settings.SCHEDULER_SMOOTHING,
+            "planned_per_sec": round(await planned_dispatch_rate(db), 4),
+            "actual_per_sec": round(dispatch_meter.rate(), 4),
+            "window_seconds": dispatch_meter.window_seconds,
+            "dispatched_total": dispatch_meter.total,
+        },
+        "serper_pool": google_tracker.pool_stats(),
+        "serper_rate_limit": google_tracker.rate_limiter.snapshot(),
+        "serper_lanes": google_tracker.admission.snapshot(),
+        "serp_cache": google_tracker.cache.snapshot(),
+        "result_writer": result_writer.snapshot(),
+        "serp_snapshots": dict(snapshot_stats),
+        "last_run": last_run_stats,
+    }
+
+
 @router.post("/test-process")
 async def test_process_keywords():
     """测试用：每分钟追踪所有活跃关键词（不计入积分）"""
@@ -46,15 +88,17 @@ async def test_process_keywords():
 @router.post("/keywords/{keyword_id}/track", response_model=RankResultResponse)
 async def track_keyword(
     keyword_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Manually trigger tracking for a keyword"""
 
     # Get keyword and check ownership or membership
-    keyword = db.query(Keyword).join(Keyword.project).filter(
-        Keyword.id == keyword_id
-    ).first()
+    keyword = (await db.execute(
+        select(Keyword)
+        .options(selectinload(Keyword.project))
+        .where(Keyword.id == keyword_id)
+    )).scalar_one_or_none()
 
     if not keyword:
         raise HTTPException(status_code=404, detail="Keyword not found")
@@ -62,93 +106,53 @@ async def track_keyword(
     # Check if user is owner or member
     project = keyword.project
     if project.user_id != current_user.id:
-        member = db.query(ProjectMember).filter(
-            ProjectMember.project_id == project.id,
-            ProjectMember.user_id == current_user.id
-        ).first()
+        member = (await db.execute(
+            select(ProjectMember).where(
+                ProjectMember.project_id == project.id,
+                ProjectMember.user_id == current_user.id
+            )
+        )).scalars().first()
         if not member:
             raise HTTPException(status_code=403, detail="Access denied")
     
     if not keyword.is_active:
         raise HTTPException(status_code=400, detail="Keyword is inactive")
     
-    # Get project target URL
-    project = keyword.project
-    target_domain = project.subdomain or project.root_domain
-
-    # Check credits - 积分从项目所有者账户扣除
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == project.user_id,
-        Subscription.status == SubscriptionStatus.ACTIVE.value
-    ).first()
-
-    if not subscription or subscription.credits <= 0:
-        raise HTTPException(status_code=402, detail="项目所有者积分不足")
-    
-    # Track keyword
-    result = await google_tracker.track_keyword(
-        keyword=keyword.keyword,
-        country=keyword.country_code,
-        language=keyword.language
-    )
-    
-    if not result:
-        raise HTTPException(status_code=500, detail="Failed to track keyword")
-    
-    # Find rank for target domain
-    rank = None
-    url = None
-    title = None
-    snippet = None
-    
-    results = result.get("results", [])
-    
-    # 保存完整 SERP 结果（Top 10）
-    import json
-    serp_top10 = results[:10] if results else []
-    serp_results_json = json.dumps(serp_top10)
-    
-    for idx, r in enumerate(results, 1):
-        if target_domain and target_domain in r.get("domain", ""):
-            rank = idx
-            url = r.get("link")
-            title = r.get("title")
-            snippet = r.get("snippet")
-            break
-    
-    # If no match, keyword is not in top 100
-    if not rank:
-        # 只记录追踪，但不记录具体排名
-        pass
-    
-    # Calculate and deduct credits (always 1 credit per tracking)
+    # Deduct credits first - 积分从项目所有者账户扣除（UPDATE ... WHERE credits >= 1，并发请求不会超扣）
     credits_used = 1
-    
-    # Deduct credits
-    subscription.credits -= credits_used
-    
-    # Record transaction - 积分从项目所有者账户扣除
-    transaction = CreditTransaction(
-        user_id=project.user_id,
-        amount=-credits_used,
-        transaction_type="consume",
-        description=f"Tracked keyword: {keyword.keyword}"
-    )
-    db.add(transaction)
-    
-    # Save result
-    rank_result = RankResult(
-        keyword_id=keyword_id,
-        rank=rank,
-        url=url,
-        title=title,
-        snippet=snippet,
-        serp_results=serp_results_json,
-        credits_used=credits_used
-    )
-    db.add(rank_result)
-    
-    db.commit()
-    db.refresh(rank_result)
-    
-    return rank_result
+    owner_id = project.user_id
+    if await deduct_credits(db, owner_id, credits_used) is None:
+        raise HTTPException(status_code=402, detail="项目所有者积分不足")
+    await db.commit()
+
+    try:
+        # Track keyword
+        # Interactive lane: reserved provider capacity, background work yields
+        # A paid "track now" always goes upstream (max_age=0 skips the SERP cache)
+        result = await google_tracker.track_keyword(
+            keyword=keyword.keyword,
+            country=keyword.country_code,
+            language=keyword.language,
+            max_age=0,
+            lane=INTERACTIVE
+        )
+
+        if not result:
+            raise HTTPException(status_code=500, detail="Failed to track keyword")
+
+        # Same rows as the scheduler, written synchronously so the response has the result id
+        entry = build_entry(keyword, result, credits_used, description=f"Tracked keyword: {keyword.keyword}")
+        result_ids = await store_results(db, [entry])
+        if not result_ids:
+            raise HTTPException(status_code=404, detail="Keyword not found")
+        await db.commit()
+    except Exception:
+        # Nothing was stored - give the credit back (rollback expires ORM objects, use the saved id)
+        await db.rollback()
+        await refund_credits(db, owner_id, credits_used)
+        await db.commit()
+        raise
+
+    stored = await db.get(RankResult, result_ids[0])
+    await db.run_sync(attach_serps, [stored])
+    return stored
@@ -27,6 +27,78 @@ class Settings(BaseSettings):
     # Google Search (for keyword tracking)
     SERPER_API_KEY: str = os.getenv("SERPER_API_KEY", "")
 
+    # Serper HTTP connection pool (shared by every tracking path)
+    SERPER_HTTP2: bool = os.getenv("SERPER_HTTP2", "true").lower() == "true"
+    SERPER_MAX_CONNECTIONS: int = int(os.getenv("SERPER_MAX_CONNECTIONS", "50"))
+    SERPER_MAX_KEEPALIVE: int = int(os.getenv("SERPER_MAX_KEEPALIVE", "20"))
+    SERPER_KEEPALIVE_EXPIRY: float = float(os.getenv("SERPER_KEEPALIVE_EXPIRY", "60"))
+    SERPER_CONNECT_TIMEOUT: float = float(os.getenv("SERPER_CONNECT_TIMEOUT", "5"))
+    SERPER_READ_TIMEOUT: float = float(os.getenv("SERPER_READ_TIMEOUT", "30"))
+    SERPER_WRITE_TIMEOUT: float = float(os.getenv("SERPER_WRITE_TIMEOUT", "10"))
+    SERPER_POOL_TIMEOUT: float = float(os.getenv("SERPER_POOL_TIMEOUT", "10"))
+
+    # Serper quota: token bucket (requests/sec + burst) and in-flight limit per batch
+    SERPER_RATE_PER_SEC: float = float(os.getenv("SERPER_RATE_PER_SEC", "10"))
+    SERPER_RATE_BURST: float = float(os.getenv("SERPER_RATE_BURST", "20"))
+    SERPER_MAX_CONCURRENCY: int = int(os.getenv("SERPER_MAX_CONCURRENCY", "10"))
+    # Priority lanes: slots only "track now" requests may use, and their queue-wait target
+    SERPER_INTERACTIVE_RESERVED: int = int(os.getenv("SERPER_INTERACTIVE_RESERVED", "2"))
+    SERPER_INTERACTIVE_SLO_SECONDS: float = float(os.getenv("SERPER_INTERACTIVE_SLO_SECONDS", "2"))
+
+    # SERP cache in front of Serper (0 TTL disables; Redis tier uses REDIS_URL)
+    SERP_CACHE_TTL_SECONDS: float = float(os.getenv("SERP_CACHE_TTL_SECONDS", "600"))
+    SERP_CACHE_MAX_ENTRIES: int = int(os.getenv("SERP_CACHE_MAX_ENTRIES", "5000"))
+    SERP_CACHE_REDIS: bool = os.getenv("SERP_CACHE_REDIS", "false").lower() == "true"
+
+    # Stored SERP snapshots: longest delta chain before a full snapshot is written again
+    SERP_DELTA_MAX_CHAIN: int = int(os.getenv("SERP_DELTA_MAX_CHAIN", "8"))
+
+    # Scheduler (keywords.next_due_at queue)
+    SCHEDULER_POLL_SECONDS: int = int(os.getenv("SCHEDULER_POLL_SECONDS", "30"))
+    # Give each keyword a stable phase within its interval so due times are spread out, not bunched at :00
+    SCHEDULER_SMOOTHING: bool = os.getenv("SCHEDULER_SMOOTHING", "true").lower() == "true"
+    SCHEDULER_BATCH_SIZE: int = int(os.getenv("SCHEDULER_BATCH_SIZE", "500"))
+    SCHEDULER_RETRY_MINUTES: int = int(os.getenv("SCHEDULER_RETRY_MINUTES", "15"))
+    SCHEDULER_CONCURRENCY: int = int(os.getenv("SCHEDULER_CONCURRENCY", "10"))
+    # Claim and dispatch due keywords in weighted round-robin across owners (weights from Plan.scheduling_weight)
+    SCHEDULER_FAIR_SHARE: bool = os.getenv("SCHEDULER_FAIR_SHARE", "true").lower() == "true"
+    # Claimed keywords are leased for this long; a dead worker's keywords become claimable again after it
+    SCHEDULER_LEASE_SECONDS: int = int(os.getenv("SCHEDULER_LEASE_SECONDS", "600"))
+
+    # Celery planner: claimed keywords per track_keyword_chunk message
+    CELERY_CHUNK_SIZE: int = int(os.getenv("CELERY_CHUNK_SIZE", "50"))
+
+    # /api/tracking/process background runs: progress write interval, and when a silent run counts as dead
+    TRACKING_RUN_PROGRESS_SECONDS: float = float(os.getenv("TRACKING_RUN_PROGRESS_SECONDS", "5"))
+    TRACKING_RUN_STALE_SECONDS: int = int(os.getenv("TRACKING_RUN_STALE_SECONDS", "300"))
+
+    # Credits reserved per owner for a scheduling run; unsettled reservations are refunded after this
+    CREDIT_RESERVATION_TTL_MINUTES: int = int(os.getenv("CREDIT_RESERVATION_TTL_MINUTES", "60"))
+
+    # Write-behind buffer for RankResult / CreditTransaction rows
+    RESULT_WRITER_BATCH_SIZE: int = int(os.getenv("RESULT_WRITER_BATCH_SIZE", "200"))
+    RESULT_WRITER_FLUSH_SECONDS: float = float(os.getenv("RESULT_WRITER_FLUSH_SECONDS", "2"))
+    # Failed flushes an entry survives before its batch is bisected and unwritable rows are dead-lettered
+    RESULT_WRITER_MAX_ATTEMPTS: int = int(os.getenv("RESULT_WRITER_MAX_ATTEMPTS", "3"))
+
+    # Rank history retention: default for projects without ProjectSettings (0 keeps forever),
+    # rows per DELETE, pause between batches, and time budget per cleanup run (the next run resumes)
+    DATA_RETENTION_DAYS: int = int(os.getenv("DATA_RETENTION_DAYS", "365"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+    RETENTION_PAUSE_SECONDS: float = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.5"))
+    RETENTION_MAX_SECONDS: int = int(os.getenv("RETENTION_MAX_SECONDS", "1800"))
+
+    # rank_results monthly partitions (PostgreSQL, scripts/partition_rank_results.sql): months created
+    # ahead, months of history read first by history endpoints, and detach instead of drop on retention
+    RANK_RESULTS_PARTITIONS_AHEAD: int = int(os.getenv("RANK_RESULTS_PARTITIONS_AHEAD", "3"))
+    RANK_RESULTS_HOT_MONTHS: int = int(os.getenv("RANK_RESULTS_HOT_MONTHS", "3"))
+    RETENTION_DETACH_PARTITIONS: bool = os.getenv("RETENTION_DETACH_PARTITIONS", "false").lower() == "true"
+
+    # History ranges: raw results up to HISTORY_RAW_MAX_DAYS, daily rollups up to
+    # HISTORY_DAILY_MAX_DAYS, weekly rollups beyond
+    HISTORY_RAW_MAX_DAYS: int = int(os.getenv("HISTORY_RAW_MAX_DAYS", "7"))
+    HISTORY_DAILY_MAX_DAYS: int = int(os.getenv("HISTORY_DAILY_MAX_DAYS", "180"))
+
     # CORS
     CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173"]
 
@@ -5,11 +5,15 @@ from contextlib import asynccontextmanager
 import os
 
 from app.core.config import settings
-from app.core.database import Base, engine
+from app.core.database import Base, engine, async_engine, SessionLocal
 from app.core.logging import logger
 from app.core.logging_middleware import LoggingMiddleware
 from app.core.exception_handlers import global_exception_handler, http_exception_handler
 from app.api import auth, users, projects, tracking, keywords
+from app.services.tracker import google_tracker
+from app.services.result_writer import result_writer
+from app.services.tracking_runs import cancel_running_jobs
+from app.services.partitions import ensure_partitions
 
 
 @asynccontextmanager
@@ -18,6 +22,14 @@ async def lifespan(app: FastAPI):
     logger.info("Starting application...")
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created")
+    # Upcoming rank_results partitions (PostgreSQL after scripts/partition_rank_results.sql)
+    with SessionLocal() as db:
+        ensure_partitions(db)
+
+    # Shared Serper connection pool (API routes and APScheduler jobs run on this loop)
+    await google_tracker.startup()
+    # Time-based flusher for buffered tracking results
+    await result_writer.start()
 
     # 仅在本地开发时启动定时任务（ Railway 使用 Cron 调用 /api/tracking/process）
     if os.getenv("RUN_SCHEDULER", "false").lower() == "true":
@@ -34,6 +46,13 @@ async def lifespan(app: FastAPI):
         from app.services.scheduler import stop_scheduler
         stop_scheduler()
 
+    # Close the pools only after scheduled jobs have stopped using them;
+    # buffered results are written before the DB pool goes away
+    await cancel_running_jobs()
+    await result_writer.stop()
+    await google_tracker.aclose()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -49,6 +68,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset paging cursor of the keyword results endpoint (header, the body is a plain list)
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Logging middleware
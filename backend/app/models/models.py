@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Enum, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Enum, JSON, Index, LargeBinary, inspect
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -22,6 +22,18 @@ class TransactionType(str, enum.Enum):
     REFUND = "refund"      # Refund
 
 
+class ReservationStatus(str, enum.Enum):
+    ACTIVE = "active"      # Credits taken, run in progress
+    SETTLED = "settled"    # Unused credits refunded
+
+
+class RunStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -51,6 +63,7 @@ class Plan(Base):
     price = Column(Float, nullable=False)  # In local currency
     credits = Column(Integer, nullable=False)  # Credits included
     duration_days = Column(Integer, nullable=False)  # Monthly = 30
+    scheduling_weight = Column(Integer, default=1)  # Share of tracking capacity under contention (fair queueing)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -89,6 +102,30 @@ class CreditTransaction(Base):
     user = relationship("User", back_populates="transactions")
 
 
+class CreditReservation(Base):
+    """Credits taken up-front for a tracking run; the unused part is refunded on settle"""
+    __tablename__ = "credit_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Integer, nullable=False)  # Credits taken from the subscription
+    consumed = Column(Integer, default=0, nullable=False)  # Credits backed by stored results
+    refunded = Column(Integer, default=0, nullable=False)
+    status = Column(String(20), default=ReservationStatus.ACTIVE.value, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    settled_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Sweeper for reservations left behind by crashed runs
+        Index(
+            "ix_credit_reservations_active_expiry", "expires_at",
+            postgresql_where=(status == ReservationStatus.ACTIVE.value),
+            sqlite_where=(status == ReservationStatus.ACTIVE.value)
+        ),
+    )
+
+
 class Project(Base):
     __tablename__ = "projects"
 
@@ -132,15 +169,31 @@ class Keyword(Base):
     language = Column(String(10), default="en")
     tracking_interval_hours = Column(Integer, default=24)  # 1, 6, 12, 24 (小时); -1 表示每分钟
     is_active = Column(Boolean, default=True)
+    next_due_at = Column(DateTime(timezone=True), server_default=func.now())  # 下次到期追踪时间
+    leased_until = Column(DateTime(timezone=True))  # 调度租约到期时间，过期后可被其他 worker 重新领取
+    leased_by = Column(String(100))  # 持有租约的调度 worker
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     project = relationship("Project", back_populates="keywords")
     results = relationship("RankResult", back_populates="keyword", cascade="all, delete-orphan")
+    latest = relationship("KeywordLatest", back_populates="keyword", uselist=False, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # 调度队列：只索引活跃关键词，到期检查只扫描到期部分
+        Index(
+            "ix_keywords_next_due_active",
+            next_due_at,
+            postgresql_where=(is_active == True),
+            sqlite_where=(is_active == True),
+        ),
+    )
 
 
 class RankResult(Base):
+    # On PostgreSQL partitioned by month on checked_at (scripts/partition_rank_results.sql,
+    # app/services/partitions.py); ids stay unique through the shared sequence
     __tablename__ = "rank_results"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -150,9 +203,105 @@ class RankResult(Base):
     title = Column(Text)  # Page title
     snippet = Column(Text)  # Search snippet
     # Top 10 SERP results (JSON)
-    serp_results = Column(Text)  # JSON: [{"position":1,"url":"...","title":"...","domain":"..."},...]
+    serp_results = Column(Text)  # Legacy JSON: [{"position":1,"url":"...","title":"...","domain":"..."},...]
+    serp_blob = Column(LargeBinary)  # Compact top 10 SERP, superseded by serp_snapshot_id
+    serp_snapshot_id = Column(Integer, ForeignKey("serp_snapshots.id"))  # Shared SERP snapshot (app/services/serp_store.py)
     credits_used = Column(Integer, default=1)
     checked_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
     keyword = relationship("Keyword", back_populates="results")
+
+    # Filled in by serp_store.attach_serps; not a column
+    decoded_serp = None
+
+    @property
+    def serp_json(self):
+        """SERP as JSON text, the shape serp_results always had (None when the SERP was not loaded)"""
+        if self.decoded_serp is not None:
+            return self.decoded_serp
+        if "serp_results" in inspect(self).unloaded:
+            return None
+        return self.serp_results
+
+    __table_args__ = (
+        # Latest result per keyword (scheduler due check) and keyset history pages on (checked_at, id)
+        Index("ix_rank_results_keyword_checked_id", keyword_id, checked_at.desc(), id.desc()),
+        # Snapshot garbage collection after retention
+        Index("ix_rank_results_serp_snapshot", serp_snapshot_id),
+    )
+
+
+class SerpDomain(Base):
+    # Dictionary of domains seen in stored SERPs (RankResult.serp_blob refers to them by id)
+    __tablename__ = "serp_domains"
+
+    id = Column(Integer, primary_key=True)
+    domain = Column(String(255), nullable=False, unique=True)
+
+
+class SerpSnapshot(Base):
+    # Content-addressed SERP (sha256 of its entries), shared by every check that saw it;
+    # the payload is a full entry list or a delta against base_id
+    __tablename__ = "serp_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    hash = Column(String(64), nullable=False, unique=True)
+    base_id = Column(Integer, ForeignKey("serp_snapshots.id"), index=True)
+    depth = Column(Integer, nullable=False, default=0)  # deltas between this snapshot and a full one
+    payload = Column(LargeBinary, nullable=False)
+
+
+class KeywordLatest(Base):
+    # Read model: latest result per keyword, upserted with every RankResult insert
+    # (app/services/keyword_latest.py)
+    __tablename__ = "keyword_latest"
+
+    keyword_id = Column(Integer, ForeignKey("keywords.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer)
+    url = Column(Text)
+    checked_at = Column(DateTime(timezone=True))
+    previous_rank = Column(Integer)
+    rank_delta = Column(Integer)  # previous_rank - rank: positive means the keyword moved up
+    results_count = Column(Integer, nullable=False, default=0)
+    serp_snapshot_id = Column(Integer)  # Base for the next SERP delta of this keyword
+
+    # Relationships
+    keyword = relationship("Keyword", back_populates="latest")
+
+
+class RankRollup(Base):
+    # Daily / weekly aggregates of rank_results for long-range charts, folded in on every
+    # RankResult insert (app/services/rollups.py); kept after raw history expires
+    __tablename__ = "rank_rollups"
+
+    keyword_id = Column(Integer, ForeignKey("keywords.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(String(10), primary_key=True)  # day, week
+    period_start = Column(DateTime(timezone=True), primary_key=True)  # UTC midnight / Monday
+    checks = Column(Integer, nullable=False, default=0)
+    found = Column(Integer, nullable=False, default=0)  # checks where the target ranked
+    rank_min = Column(Integer)
+    rank_max = Column(Integer)
+    rank_sum = Column(Integer, nullable=False, default=0)  # avg = rank_sum / found
+    last_rank = Column(Integer)
+    last_checked_at = Column(DateTime(timezone=True))
+
+
+class TrackingRun(Base):
+    """One run of the due-keyword scheduler started through /api/tracking/process"""
+    __tablename__ = "tracking_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), default=RunStatus.QUEUED.value, nullable=False)
+    # Set while the run is queued/running; the unique constraint allows only one active run
+    lock_key = Column(String(50), unique=True)
+    planned = Column(Integer, default=0)  # Due keywords when the run started (grows if more are claimed)
+    done = Column(Integer, default=0)     # Keywords processed, including failures
+    failed = Column(Integer, default=0)
+    credits_used = Column(Integer, default=0)
+    stats = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
@@ -165,6 +165,9 @@ class KeywordResponse(KeywordBase):
 class KeywordWithResults(KeywordResponse):
     latest_rank: Optional[int] = None
     latest_url: Optional[str] = None
+    latest_checked_at: Optional[datetime] = None
+    previous_rank: Optional[int] = None
+    rank_delta: Optional[int] = None  # previous_rank - latest_rank: positive means moved up
 
 
 # ============ Rank Result Schemas ============
@@ -175,7 +178,7 @@ class RankResultResponse(BaseModel):
     url: Optional[str]
     title: Optional[str]
     snippet: Optional[str]
-    serp_results: Optional[str]  # JSON string of top 10 results
+    serp_results: Optional[str] = Field(None, validation_alias="serp_json")  # JSON string of top 10 results (when requested)
     credits_used: int
     checked_at: datetime
 
@@ -186,10 +189,23 @@ class RankResultResponse(BaseModel):
         }
 
 
+class RankRollupPoint(BaseModel):
+    period_start: datetime
+    checks: int
+    found_ratio: float  # share of checks where the target ranked
+    rank_min: Optional[int]
+    rank_max: Optional[int]
+    rank_avg: Optional[float]
+    last_rank: Optional[int]
+
+
 class KeywordHistoryResponse(BaseModel):
     keyword_id: int
     keyword: str
-    history: List[RankResultResponse]
+    resolution: str = "raw"  # raw, day, week
+    history: List[RankResultResponse] = []  # raw results, newest first
+    next_cursor: Optional[str] = None  # cursor of the next raw page, None on the last one
+    rollups: List[RankRollupPoint] = []  # day / week points, oldest first
 
 
 class ManualTrackRequest(BaseModel):
@@ -0,0 +1,134 @@
+"""
+Priority lanes for outbound provider calls
+
+Every Serper request, from any tracking path, is admitted through one
+controller before it takes a rate-limit token:
+
+- interactive: a user clicked "track now"; may use all slots
+- scheduled: due keywords from the scheduler / Celery
+- backfill: catch-up work (keywords overdue by more than an interval, test runs)
+
+`reserved_interactive` slots are never handed to background lanes, and a
+background request is not admitted while a higher lane has waiters, so
+background work yields as soon as interactive demand rises.
+"""
+import asyncio
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from app.services.metrics import percentile
+
+INTERACTIVE = "interactive"
+SCHEDULED = "scheduled"
+BACKFILL = "backfill"
+LANES = (INTERACTIVE, SCHEDULED, BACKFILL)  # highest priority first
+
+
+class PriorityAdmission:
+    def __init__(self, capacity: int, reserved_interactive: int, interactive_slo_seconds: float):
+        self.capacity = max(1, capacity)
+        self.reserved_interactive = max(0, min(reserved_interactive, self.capacity - 1))
+        self.interactive_slo_seconds = interactive_slo_seconds
+        self._in_use = 0
+        self._in_use_by_lane = Counter()
+        self._waiters: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self._waits: Dict[str, deque] = {lane: deque(maxlen=1000) for lane in LANES}
+        self.admitted = Counter()
+        self.slo_misses = 0
+
+    def _limit(self, lane: str) -> int:
+        if lane == INTERACTIVE:
+            return self.capacity
+        return self.capacity - self.reserved_interactive
+
+    def _can_admit(self, lane: str) -> bool:
+        if self._in_use >= self._limit(lane):
+            return False
+        # Yield to any higher lane that is already waiting
+        for higher in LANES[:LANES.index(lane)]:
+            if any(not waiter.done() for _, waiter in self._waiters[higher]):
+                return False
+        return True
+
+    def _take(self, lane: str, wait: float):
+        self._in_use += 1
+        self._in_use_by_lane[lane] += 1
+        self.admitted[lane] += 1
+        self._waits[lane].append(wait)
+        if lane == INTERACTIVE and wait > self.interactive_slo_seconds:
+            self.slo_misses += 1
+
+    def _wake(self):
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and waiters[0][1].done():
+                waiters.popleft()  # cancelled
+            while waiters and self._in_use < self._limit(lane):
+                queued_at, waiter = waiters.popleft()
+                if waiter.done():
+                    continue
+                self._take(lane, time.monotonic() - queued_at)
+                waiter.set_result(None)
+            if waiters:
+                # Lower lanes wait until this one drains
+                return
+
+    async def acquire(self, lane: str = SCHEDULED):
+        if lane not in self._waiters:
+            raise ValueError(f"Unknown lane: {lane}")
+        if not self._waiters[lane] and self._can_admit(lane):
+            self._take(lane, 0.0)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (time.monotonic(), waiter)
+        self._waiters[lane].append(entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as we were cancelled: hand the slot on
+                self.release(lane)
+            else:
+                try:
+                    self._waiters[lane].remove(entry)
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+
+    def release(self, lane: str = SCHEDULED):
+        self._in_use -= 1
+        self._in_use_by_lane[lane] -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = SCHEDULED):
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def snapshot(self) -> dict:
+        lanes = {}
+        for lane in LANES:
+            waits = list(self._waits[lane])
+            lanes[lane] = {
+                "in_flight": self._in_use_by_lane[lane],
+                "queued": sum(1 for _, waiter in self._waiters[lane] if not waiter.done()),
+                "admitted": self.admitted[lane],
+                "wait_p50": percentile(waits, 50),
+                "wait_p95": percentile(waits, 95),
+                "wait_max": max(waits) if waits else None,
+            }
+        return {
+            "capacity": self.capacity,
+            "reserved_interactive": self.reserved_interactive,
+            "in_flight": self._in_use,
+            "interactive_slo_seconds": self.interactive_slo_seconds,
+            "interactive_slo_misses": self.slo_misses,
+            "lanes": lanes,
+        }
@@ -0,0 +1,241 @@
+"""
+Credit accounting
+
+Deductions are single conditional UPDATE statements, so concurrent tracking
+for the same owner can never overdraw a subscription or lose an update the
+way a read-modify-write in Python can.
+
+Scheduled runs don't touch the subscription row per keyword: they reserve
+credits for a whole batch up-front (one UPDATE per owner), consume them in
+memory, record consumption on the run's own reservation row and refund the
+unused part when the run settles. Reservations left behind by a crashed run
+are refunded by `expire_reservations` once they pass `expires_at`.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update, insert
+from app.models.models import Subscription, SubscriptionStatus, CreditReservation, ReservationStatus
+from app.services.scheduling import get_now
+
+
+def _active_subscription_id(user_id: int):
+    return (
+        select(Subscription.id)
+        .where(
+            Subscription.user_id == user_id,
+            Subscription.status == SubscriptionStatus.ACTIVE.value
+        )
+        .order_by(Subscription.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+async def deduct_credits(db, user_id: int, amount: int) -> Optional[int]:
+    """Atomically take `amount` credits; returns the new balance or None if short
+
+    Runs UPDATE ... WHERE credits >= amount RETURNING credits. The caller owns
+    the transaction (an AsyncSession) and must commit.
+    """
+    stmt = (
+        update(Subscription)
+        .where(
+            Subscription.id == _active_subscription_id(user_id),
+            Subscription.credits >= amount
+        )
+        .values(credits=Subscription.credits - amount)
+        .returning(Subscription.credits)
+        .execution_options(synchronize_session=False)
+    )
+    return (await db.execute(stmt)).scalar()
+
+
+async def refund_credits(db, user_id: int, amount: int) -> Optional[int]:
+    """Atomically give back credits taken for work that did not happen"""
+    stmt = (
+        update(Subscription)
+        .where(Subscription.id == _active_subscription_id(user_id))
+        .values(credits=Subscription.credits + amount)
+        .returning(Subscription.credits)
+        .execution_options(synchronize_session=False)
+    )
+    return (await db.execute(stmt)).scalar()
+
+
+async def get_balance(db, user_id: int) -> Optional[int]:
+    """Current credits of the owner's active subscription (None if there is none)"""
+    return (await db.execute(
+        select(Subscription.credits).where(Subscription.id == _active_subscription_id(user_id))
+    )).scalar()
+
+
+async def reserve_credits(db, user_id: int, wanted: int, ttl_minutes: int) -> Optional[Tuple[int, int]]:
+    """Take up to `wanted` credits in one go; returns (reservation_id, granted) or None
+
+    Grants partially when the owner has fewer credits than asked for. The
+    caller commits.
+    """
+    amount = wanted
+    granted = 0
+    # The balance can move between the failed UPDATE and the re-read; retry a few times
+    for _ in range(3):
+        if amount <= 0:
+            break
+        if await deduct_credits(db, user_id, amount) is not None:
+            granted = amount
+            break
+        amount = min(wanted, await get_balance(db, user_id) or 0)
+    if not granted:
+        return None
+
+    reservation_id = (await db.execute(
+        insert(CreditReservation)
+        .values(
+            user_id=user_id,
+            amount=granted,
+            consumed=0,
+            refunded=0,
+            status=ReservationStatus.ACTIVE.value,
+            expires_at=get_now() + timedelta(minutes=ttl_minutes)
+        )
+        .returning(CreditReservation.id)
+    )).scalar()
+    return reservation_id, granted
+
+
+async def record_consumption(db, consumed: Dict[int, int]):
+    """Add stored usage to reservations (reservation_id -> credits), one UPDATE each"""
+    for reservation_id, amount in consumed.items():
+        if not amount:
+            continue
+        await db.execute(
+            update(CreditReservation)
+            .where(CreditReservation.id == reservation_id)
+            .values(consumed=CreditReservation.consumed + amount)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def settle_reservation(db, reservation_id: int, unused: int) -> int:
+    """Close a reservation and refund `unused` credits; no-op if already settled"""
+    owner = (await db.execute(
+        update(CreditReservation)
+        .where(
+            CreditReservation.id == reservation_id,
+            CreditReservation.status == ReservationStatus.ACTIVE.value
+        )
+        .values(status=ReservationStatus.SETTLED.value, refunded=unused, settled_at=get_now())
+        .returning(CreditReservation.user_id)
+        .execution_options(synchronize_session=False)
+    )).scalar()
+    if owner is None:
+        return 0
+    if unused:
+        await refund_credits(db, owner, unused)
+    return unused
+
+
+async def expire_reservations(db, now=None) -> int:
+    """Refund reservations whose run never settled them (e.g. the worker died)
+
+    Only usage already stored (consumed) is kept. Returns credits refunded.
+    """
+    now = now or get_now()
+    rows = (await db.execute(
+        update(CreditReservation)
+        .where(
+            CreditReservation.status == ReservationStatus.ACTIVE.value,
+            CreditReservation.expires_at <= now
+        )
+        .values(
+            status=ReservationStatus.SETTLED.value,
+            refunded=CreditReservation.amount - CreditReservation.consumed,
+            settled_at=now
+        )
+        .returning(CreditReservation.user_id, CreditReservation.refunded)
+        .execution_options(synchronize_session=False)
+    )).all()
+
+    refunds = defaultdict(int)
+    for user_id, refunded in rows:
+        refunds[user_id] += max(0, refunded)
+    for user_id, amount in refunds.items():
+        if amount:
+            await refund_credits(db, user_id, amount)
+    return sum(refunds.values())
+
+
+class CreditLedger:
+    """Run-scoped view of reserved credits
+
+    `reserve` tops up each owner's reservation for the next batch; `consume`
+    and `release` only touch memory, so parallel checks for one big account
+    never wait on its subscription row.
+    """
+
+    def __init__(self, ttl_minutes: int):
+        self.ttl_minutes = ttl_minutes
+        self._by_owner: Dict[int, List[int]] = defaultdict(list)  # user_id -> reservation ids
+        self._remaining: Dict[int, int] = {}  # reservation_id -> unused credits
+        self._expires: Dict[int, object] = {}
+        self.reserved = 0
+        self.consumed = 0
+        self.refunded = 0
+        self.denied = 0
+
+    def available(self, user_id: int) -> int:
+        now = get_now()
+        return sum(
+            self._remaining[reservation_id]
+            for reservation_id in self._by_owner.get(user_id, ())
+            if self._expires[reservation_id] > now
+        )
+
+    async def reserve(self, db, demand: Dict[int, int]):
+        """Make sure each owner has credits for `demand` more checks (caller commits)"""
+        for user_id, wanted in demand.items():
+            need = wanted - self.available(user_id)
+            if need <= 0:
+                continue
+            reservation = await reserve_credits(db, user_id, need, self.ttl_minutes)
+            if reservation is None:
+                continue
+            reservation_id, granted = reservation
+            self._by_owner[user_id].append(reservation_id)
+            self._remaining[reservation_id] = granted
+            # A little earlier than the DB expiry, so we stop using it before the sweeper can refund it
+            self._expires[reservation_id] = get_now() + timedelta(minutes=self.ttl_minutes) - timedelta(minutes=1)
+            self.reserved += granted
+
+    def consume(self, user_id: int, amount: int) -> Optional[int]:
+        """Take credits from the owner's reservations; returns the reservation id or None"""
+        now = get_now()
+        for reservation_id in self._by_owner.get(user_id, ()):
+            if self._remaining[reservation_id] >= amount and self._expires[reservation_id] > now:
+                self._remaining[reservation_id] -= amount
+                self.consumed += amount
+                return reservation_id
+        self.denied += 1
+        return None
+
+    def release(self, reservation_id: int, amount: int):
+        """Return credits for a check that produced no result"""
+        self._remaining[reservation_id] += amount
+        self.consumed -= amount
+
+    async def settle(self, db):
+        """Refund whatever is left of every reservation (caller commits)"""
+        for reservation_id, unused in self._remaining.items():
+            self.refunded += await settle_reservation(db, reservation_id, unused)
+        self._by_owner.clear()
+        self._remaining.clear()
+        self._expires.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "reserved": self.reserved,
+            "consumed": self.consumed,
+            "refunded": self.refunded,
+            "denied": self.denied,
+        }
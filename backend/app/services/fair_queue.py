@@ -0,0 +1,70 @@
+"""
+Weighted fair queue across tenants
+
+Deficit round-robin (DRR) over per-owner FIFO queues: every time an owner
+reaches the head of the round it earns `quantum * weight` credit and is
+served while its credit covers the next item's cost. One owner with a huge
+backlog therefore cannot delay a small owner by more than a round.
+"""
+from collections import defaultdict, deque
+from typing import Any, Dict, Hashable, Tuple
+
+
+class FairQueue:
+    def __init__(self, quantum: float = 1.0):
+        self.quantum = quantum
+        self._queues: Dict[Hashable, deque] = {}
+        self._weights: Dict[Hashable, float] = {}
+        self._deficit = defaultdict(float)
+        self._active = deque()  # owners with queued items, head = being served
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def set_weight(self, owner: Hashable, weight: float):
+        self._weights[owner] = max(weight, 0.001)
+
+    def _grant(self):
+        if self._active:
+            owner = self._active[0]
+            self._deficit[owner] += self.quantum * self._weights.get(owner, 1.0)
+
+    def push(self, owner: Hashable, item: Any, cost: float = 1.0):
+        queue = self._queues.get(owner)
+        if queue is None:
+            queue = self._queues[owner] = deque()
+            self._active.append(owner)
+            if len(self._active) == 1:
+                self._grant()
+        queue.append((cost, item))
+        self._size += 1
+
+    def pop(self) -> Tuple[Hashable, Any]:
+        """Next (owner, item) in weighted round-robin order; IndexError when empty"""
+        if not self._size:
+            raise IndexError("pop from an empty FairQueue")
+        while True:
+            owner = self._active[0]
+            queue = self._queues[owner]
+            cost, item = queue[0]
+            if self._deficit[owner] >= cost:
+                queue.popleft()
+                self._deficit[owner] -= cost
+                self._size -= 1
+                if not queue:
+                    # An idle owner doesn't bank credit for later
+                    del self._queues[owner]
+                    del self._deficit[owner]
+                    self._active.popleft()
+                    self._grant()
+                return owner, item
+            # Out of credit this round: next owner's turn
+            self._active.rotate(-1)
+            self._grant()
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self._size,
+            "owners": len(self._queues),
+        }
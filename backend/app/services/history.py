@@ -0,0 +1,89 @@
+"""
+Keyset pages of rank history
+
+Results are paged newest first on (checked_at, id), the order of
+ix_rank_results_keyword_checked_id. The cursor is the last row's
+(checked_at, id), so every page is one index range scan starting right
+after it, however deep the page, and a result written between two
+requests never shifts or repeats rows. A page is first read from the hot
+months below the cursor (partitions.hot_cutoff) and only falls back to
+older partitions when those don't fill it.
+"""
+import base64
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import defer
+
+from app.models.models import RankResult
+from app.services.partitions import hot_cutoff
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(result: RankResult) -> str:
+    raw = f"{result.checked_at.isoformat()}|{result.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(checked_at, id) of a cursor; ValueError when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        checked_at, result_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(checked_at), int(result_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def page_results(
+    db,
+    keyword_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_serp: bool = False,
+) -> Tuple[List[RankResult], Optional[str]]:
+    """One page of a keyword's results in [start, end], newest first; returns (results, next_cursor)
+
+    Without include_serp the SERP columns are not loaded at all.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # Naive bounds are UTC, like checked_at
+    if start is not None and start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end is not None and end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    query = db.query(RankResult).filter(RankResult.keyword_id == keyword_id)
+    if start is not None:
+        query = query.filter(RankResult.checked_at >= start)
+    if end is not None:
+        query = query.filter(RankResult.checked_at <= end)
+    position = None
+    if cursor is not None:
+        checked_at, result_id = decode_cursor(cursor)
+        position = checked_at
+        # The plain bound lets PostgreSQL prune partitions (row comparisons don't)
+        query = query.filter(
+            RankResult.checked_at <= checked_at,
+            tuple_(RankResult.checked_at, RankResult.id) < tuple_(checked_at, result_id)
+        )
+    if not include_serp:
+        query = query.options(
+            defer(RankResult.serp_results), defer(RankResult.serp_blob), defer(RankResult.serp_snapshot_id)
+        )
+    order = (RankResult.checked_at.desc(), RankResult.id.desc())
+
+    hot_start = hot_cutoff(position or end)
+    results = None
+    if start is None or start < hot_start:
+        results = query.filter(RankResult.checked_at >= hot_start).order_by(*order).limit(limit + 1).all()
+        if len(results) <= limit:
+            # Sparse history: the page reaches past the hot window
+            results = None
+    if results is None:
+        results = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = encode_cursor(results[limit - 1]) if len(results) > limit else None
+    return results[:limit], next_cursor
@@ -0,0 +1,169 @@
+"""
+keyword_latest read model
+
+One row per tracked keyword: latest rank, URL and check time, the previous
+rank, the change between them and how many results are stored. It is
+upserted by store_results in the same transaction as the RankResult
+inserts, so keyword lists and dashboards read one row per keyword instead
+of sorting rank_results. Retention keeps results_count in step with the
+rows it removes.
+
+Rebuild it from history (e.g. after a restore) with
+
+    python -m app.services.keyword_latest
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import select, delete, func, case, or_, bindparam
+
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.models.models import Keyword, RankResult, KeywordLatest
+
+logger = logging.getLogger(__name__)
+
+_table = KeywordLatest.__table__
+
+
+def keyword_layers(rows: List[dict]) -> List[List[dict]]:
+    """Split rows into layers holding at most one row per keyword, oldest first"""
+    by_keyword = defaultdict(list)
+    for row in rows:
+        by_keyword[row["keyword_id"]].append(row)
+    layers = defaultdict(list)
+    for keyword_rows in by_keyword.values():
+        keyword_rows.sort(key=lambda row: row["checked_at"])
+        for depth, row in enumerate(keyword_rows):
+            layers[depth].append(row)
+    return [layers[depth] for depth in sorted(layers)]
+
+
+def _upsert_statement(db, rows: List[dict]):
+    stmt = upsert_insert(db, _table).values([
+        {
+            "keyword_id": row["keyword_id"],
+            "rank": row.get("rank"),
+            "url": row.get("url"),
+            "checked_at": row["checked_at"],
+            "previous_rank": None,
+            "rank_delta": None,
+            "results_count": 1,
+            "serp_snapshot_id": row.get("serp_snapshot_id"),
+        }
+        for row in rows
+    ])
+    current = _table.c
+    new = stmt.excluded
+    # A result that arrives after a newer one (write-behind buffer) only counts
+    newer = or_(current.checked_at.is_(None), new.checked_at >= current.checked_at)
+    return stmt.on_conflict_do_update(
+        index_elements=[current.keyword_id],
+        set_={
+            "rank": case((newer, new.rank), else_=current.rank),
+            "url": case((newer, new.url), else_=current.url),
+            "checked_at": case((newer, new.checked_at), else_=current.checked_at),
+            "previous_rank": case((newer, current.rank), else_=current.previous_rank),
+            "rank_delta": case((newer, current.rank - new.rank), else_=current.rank_delta),
+            "results_count": current.results_count + 1,
+            "serp_snapshot_id": case((newer, new.serp_snapshot_id), else_=current.serp_snapshot_id),
+        }
+    )
+
+
+async def upsert_latest(db, rows: List[dict]):
+    """Fold new RankResult rows (keyword_id, rank, url, checked_at) into keyword_latest
+
+    The caller owns the transaction. Several rows for one keyword are applied
+    oldest first, one statement per layer, since a single multi-row upsert
+    may not touch the same key twice.
+    """
+    for layer in keyword_layers(rows):
+        await db.execute(_upsert_statement(db, layer))
+
+
+def decrement_counts(db, removed: Dict[int, int]):
+    """Subtract deleted history (keyword_id -> rows) from results_count (caller commits)"""
+    if not removed:
+        return
+    db.execute(
+        _table.update()
+        .where(_table.c.keyword_id == bindparam("removed_keyword_id"))
+        .values(results_count=case(
+            (_table.c.results_count > bindparam("removed"), _table.c.results_count - bindparam("removed")),
+            else_=0
+        )),
+        [{"removed_keyword_id": keyword_id, "removed": count} for keyword_id, count in removed.items()]
+    )
+
+
+def rebuild_keywords(db, keyword_ids: List[int]) -> int:
+    """Recompute the rows of `keyword_ids` from rank_results (caller commits)"""
+    ranked = (
+        select(
+            RankResult.keyword_id,
+            RankResult.rank,
+            RankResult.url,
+            RankResult.checked_at,
+            RankResult.serp_snapshot_id,
+            func.row_number().over(
+                partition_by=RankResult.keyword_id,
+                order_by=(RankResult.checked_at.desc(), RankResult.id.desc())
+            ).label("recency"),
+            func.count().over(partition_by=RankResult.keyword_id).label("results_count"),
+        )
+        .where(RankResult.keyword_id.in_(keyword_ids))
+        .subquery()
+    )
+    latest = {}
+    previous = {}
+    for row in db.execute(select(ranked).where(ranked.c.recency <= 2)):
+        (latest if row.recency == 1 else previous)[row.keyword_id] = row
+
+    db.execute(delete(KeywordLatest).where(KeywordLatest.keyword_id.in_(keyword_ids)))
+    rows = []
+    for keyword_id, row in latest.items():
+        previous_rank = previous[keyword_id].rank if keyword_id in previous else None
+        rows.append({
+            "keyword_id": keyword_id,
+            "rank": row.rank,
+            "url": row.url,
+            "checked_at": row.checked_at,
+            "previous_rank": previous_rank,
+            "rank_delta": previous_rank - row.rank if previous_rank is not None and row.rank is not None else None,
+            "results_count": row.results_count,
+            "serp_snapshot_id": row.serp_snapshot_id,
+        })
+    if rows:
+        db.execute(_table.insert(), rows)
+    return len(rows)
+
+
+def rebuild(db, batch_size: int = None) -> int:
+    """Recompute keyword_latest from rank_results; returns the number of rows written
+
+    Walks keywords in id order, `batch_size` per transaction, so it can run
+    next to live traffic and be restarted at any time.
+    """
+    batch_size = max(1, batch_size or settings.SCHEDULER_BATCH_SIZE)
+    written = 0
+    last_id = 0
+    while True:
+        keyword_ids = list(db.execute(
+            select(Keyword.id).where(Keyword.id > last_id).order_by(Keyword.id).limit(batch_size)
+        ).scalars())
+        if not keyword_ids:
+            break
+        last_id = keyword_ids[-1]
+        written += rebuild_keywords(db, keyword_ids)
+        db.commit()
+    logger.info(f"Rebuilt keyword_latest: {written} keywords")
+    return written
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as session:
+        print(f"keyword_latest rebuilt for {rebuild(session)} keywords")
@@ -0,0 +1,97 @@
+"""
+Lightweight in-process metrics for tracking runs
+"""
+import time
+from collections import Counter, defaultdict, deque
+from typing import Dict, Hashable, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty sample"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class RunStats:
+    """Throughput, latency and outcome counters for one tracking run"""
+
+    def __init__(self, concurrency: int = 1):
+        self.concurrency = concurrency
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.latencies: List[float] = []
+        self.outcomes = Counter()
+        self.counters = Counter()
+        self.waits: Dict[Hashable, List[float]] = defaultdict(list)  # queue wait per owner
+
+    def record(self, status: str, latency: float):
+        self.outcomes[status] += 1
+        self.latencies.append(latency)
+
+    def record_wait(self, owner: Hashable, wait: float):
+        self.waits[owner].append(wait)
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    @property
+    def completed(self) -> int:
+        return sum(self.outcomes.values())
+
+    @property
+    def failed(self) -> int:
+        return self.outcomes["failed"] + self.outcomes["error"]
+
+    def snapshot(self) -> dict:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "outcomes": dict(self.outcomes),
+            "counters": dict(self.counters),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_per_sec": round(self.completed / elapsed, 3) if elapsed > 0 else 0.0,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p95": percentile(self.latencies, 95),
+            "latency_p99": percentile(self.latencies, 99),
+            "latency_max": max(self.latencies) if self.latencies else None,
+            "owners": len(self.waits),
+            "wait_p95": percentile([w for waits in self.waits.values() for w in waits], 95),
+            # Worst owner's p95 wait: what fair queueing keeps bounded for small accounts
+            "owner_wait_p95_max": max(
+                (percentile(waits, 95) for waits in self.waits.values()), default=None
+            ),
+        }
+
+
+class RateMeter:
+    """Events per second over a sliding window (e.g. keywords dispatched)"""
+
+    def __init__(self, window_seconds: float = 900):
+        self.window_seconds = window_seconds
+        self.started = time.monotonic()
+        self._events = deque()  # (monotonic time, count)
+        self.total = 0
+
+    def _trim(self, now: float):
+        while self._events and self._events[0][0] < now - self.window_seconds:
+            self._events.popleft()
+
+    def record(self, count: int = 1):
+        now = time.monotonic()
+        self._events.append((now, count))
+        self.total += count
+        self._trim(now)
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        self._trim(now)
+        # A fresh process hasn't seen a full window yet
+        span = min(self.window_seconds, now - self.started)
+        if span <= 0:
+            return 0.0
+        return sum(count for _, count in self._events) / span
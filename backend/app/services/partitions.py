@@ -0,0 +1,127 @@
+"""
+Monthly partitions of rank_results
+
+On PostgreSQL, scripts/partition_rank_results.sql turns rank_results into a
+table range-partitioned by checked_at, one partition per UTC month
+(rank_results_yYYYYmMM) plus a DEFAULT catch-all. The ORM model is
+unchanged: inserts are routed by the database and ids still come from the
+same sequence.
+
+Here we keep future months created ahead of time and drop (or detach)
+whole months once they are past every project's retention, which turns
+cleanup of old history into a catalog operation instead of a DELETE.
+On other databases, or before the migration has run, these are no-ops.
+"""
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.keyword_latest import decrement_counts
+from app.services.scheduling import get_now
+from app.services.serp_store import delete_unreferenced_snapshots
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_NAME = re.compile(r"^rank_results_y(\d{4})m(\d{2})$")
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"rank_results_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(db) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'rank_results')"
+    )).scalar())
+
+
+def list_partitions(db) -> Dict[datetime, str]:
+    """Monthly partitions currently attached: month start -> table name"""
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'rank_results'::regclass"
+    )).scalars()
+    partitions = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)] = name
+    return partitions
+
+
+def ensure_partitions(db, months_ahead: int = None, now: Optional[datetime] = None) -> List[str]:
+    """Create this month's partition and the next `months_ahead`; returns the new table names"""
+    if not is_partitioned(db):
+        return []
+    months_ahead = settings.RANK_RESULTS_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    existing = list_partitions(db)
+    current = month_start(now or get_now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        name = partition_name(month)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF rank_results "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        created.append(name)
+    db.commit()
+    if created:
+        logger.info(f"Created rank_results partitions: {', '.join(created)}")
+    return created
+
+
+def drop_partitions_before(db, horizon: datetime, detach_only: bool = None) -> List[str]:
+    """Drop (or only detach) monthly partitions whose rows are all older than `horizon`
+
+    A dropped partition takes the SERP snapshots only its rows used with it.
+    Detached partitions still refer to theirs, so those are kept.
+    """
+    if not is_partitioned(db):
+        return []
+    detach_only = settings.RETENTION_DETACH_PARTITIONS if detach_only is None else detach_only
+    removed = []
+    for month, name in sorted(list_partitions(db).items()):
+        if add_months(month, 1) > horizon:
+            break
+        removed_counts = dict(db.execute(text(
+            f"SELECT keyword_id, count(*) FROM {name} GROUP BY keyword_id"
+        )).all())
+        snapshot_ids = [] if detach_only else list(db.execute(text(
+            f"SELECT DISTINCT serp_snapshot_id FROM {name} WHERE serp_snapshot_id IS NOT NULL"
+        )).scalars())
+        db.execute(text(f"ALTER TABLE rank_results DETACH PARTITION {name}"))
+        decrement_counts(db, removed_counts)
+        if not detach_only:
+            db.execute(text(f"DROP TABLE {name}"))
+            delete_unreferenced_snapshots(db, snapshot_ids)
+        db.commit()
+        removed.append(name)
+    if removed:
+        logger.info(f"{'Detached' if detach_only else 'Dropped'} rank_results partitions: {', '.join(removed)}")
+    return removed
+
+
+def hot_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Start of the hot window: the month of `now` and RANK_RESULTS_HOT_MONTHS before it"""
+    return add_months(month_start(now or get_now()), -settings.RANK_RESULTS_HOT_MONTHS)
+
@@ -0,0 +1,70 @@
+"""
+Token bucket rate limiter for outbound provider calls
+
+Keeps Serper traffic within the plan quota: `rate` tokens are added per
+second up to `burst`, and each request takes one token.
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens without waiting; False if the bucket is short"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            self.acquired += 1
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait until tokens are available and take them; returns seconds waited
+
+        Tokens are reserved before sleeping (the balance may go negative), so
+        concurrent callers queue up behind each other without needing a lock
+        and the bucket works from any event loop. A waiter that is cancelled
+        gives its tokens back, so later callers don't queue behind it.
+        """
+        self._refill()
+        self._tokens -= tokens
+        self.acquired += 1
+        if self._tokens >= 0:
+            return 0.0
+
+        wait = -self._tokens / self.rate
+        self.waited_seconds += wait
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self._refill()
+            self._tokens = min(self.burst, self._tokens + tokens)
+            self.acquired -= 1
+            raise
+        return wait
+
+    def snapshot(self) -> dict:
+        self._refill()
+        return {
+            "rate_per_sec": self.rate,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "acquired": self.acquired,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
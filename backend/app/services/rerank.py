@@ -0,0 +1,100 @@
+"""
+Re-rank stored history without provider calls
+
+SERP snapshots keep the full result list Serper returned (up to 100), so
+when a project's root_domain / subdomain changes, every stored check can be
+matched against the new target from storage alone. Results saved before
+full lists were kept only have their top 10: they are updated when the new
+target is in it, and otherwise counted as unresolved and left unchanged.
+keyword_latest and rank_rollups are rebuilt for the re-ranked keywords.
+"""
+import logging
+from typing import List
+
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import Project, Keyword, RankResult
+from app.services import keyword_latest, rollups
+from app.services.serp_store import decode_serps, RESPONSE_RESULTS
+from app.services.tracker import find_target
+
+logger = logging.getLogger(__name__)
+
+MATCH_FIELDS = ("rank", "url", "title", "snippet")
+
+
+def _rerank_keywords(db, keyword_ids: List[int], target: str, batch_size: int, report: dict):
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(
+                RankResult.id, RankResult.rank, RankResult.url, RankResult.title, RankResult.snippet,
+                RankResult.serp_snapshot_id, RankResult.serp_blob, RankResult.serp_results
+            )
+            .where(RankResult.keyword_id.in_(keyword_ids), RankResult.id > last_id)
+            .order_by(RankResult.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        serps = decode_serps(db, rows)
+        changes = []
+        for row in rows:
+            report["results"] += 1
+            serp = serps.get(row.id)
+            if serp is None:
+                report["unresolved"] += 1
+                continue
+            match = find_target(serp, target)
+            if match["rank"] is None and len(serp) <= RESPONSE_RESULTS:
+                # Only the top 10 was kept: the target may rank further down
+                report["unresolved"] += 1
+                continue
+            if tuple(getattr(row, field) for field in MATCH_FIELDS) != tuple(match[field] for field in MATCH_FIELDS):
+                changes.append({"id": row.id, **match})
+        if changes:
+            db.execute(update(RankResult), changes)
+            report["changed"] += len(changes)
+        db.commit()
+
+
+def rerank_project(db, project_id: int, batch_size: int = None) -> dict:
+    """Recompute rank/url/title/snippet of a project's stored results for its current target"""
+    batch_size = max(1, batch_size or settings.SCHEDULER_BATCH_SIZE)
+    project = db.get(Project, project_id)
+    if project is None:
+        raise ValueError(f"Project {project_id} not found")
+    target = project.subdomain or project.root_domain
+    report = {"project_id": project_id, "target": target, "results": 0, "changed": 0, "unresolved": 0}
+
+    keyword_ids = list(db.execute(
+        select(Keyword.id).where(Keyword.project_id == project_id).order_by(Keyword.id)
+    ).scalars())
+    for start in range(0, len(keyword_ids), batch_size):
+        chunk = keyword_ids[start:start + batch_size]
+        _rerank_keywords(db, chunk, target, batch_size, report)
+        # Read models follow the corrected history. Lock the keywords first (id order, like
+        # store_results): a flush for them waits, instead of landing between the rebuild's read and write
+        db.execute(select(Keyword.id).where(Keyword.id.in_(chunk)).order_by(Keyword.id).with_for_update())
+        keyword_latest.rebuild_keywords(db, chunk)
+        rollups.rebuild_keywords(db, chunk)
+        db.commit()
+
+    logger.info(
+        f"Re-ranked project {project_id} for {target}: {report['changed']} of {report['results']} "
+        f"results changed, {report['unresolved']} unresolved"
+    )
+    return report
+
+
+def rerank_project_job(project_id: int):
+    """Background entry point (own session), e.g. after a project's domain changed"""
+    with SessionLocal() as db:
+        try:
+            return rerank_project(db, project_id)
+        except Exception as e:
+            logger.error(f"Re-rank of project {project_id} failed: {e}")
@@ -0,0 +1,299 @@
+"""
+Write-behind buffer for tracking results
+
+The tracking pipeline hands finished checks to `result_writer` instead of
+committing one RankResult + CreditTransaction per keyword. Entries are
+flushed in batches (by size or age) with multi-row INSERTs in a single
+transaction. Credits were already taken (run reservation or a direct
+deduction), so a flush only records reservation usage, one UPDATE per
+reservation.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, insert, select, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import Keyword, RankResult, CreditTransaction, TransactionType
+from app.services.credits import record_consumption
+from app.services.keyword_latest import upsert_latest
+from app.services.rollups import upsert_rollups
+from app.services.serp_store import store_snapshots
+from app.services.metrics import percentile
+from app.services.scheduling import get_now, compute_next_due
+from app.services.tracker import find_target
+
+logger = logging.getLogger(__name__)
+
+RANK_RESULT_FIELDS = (
+    "keyword_id", "rank", "url", "title", "snippet",
+    "serp_snapshot_id", "credits_used", "checked_at",
+)
+
+
+def build_entry(
+    keyword: Keyword,
+    result: dict,
+    credits_used: int,
+    description: str,
+    reservation_id: Optional[int] = None
+) -> dict:
+    """Match the project's target domain in a SERP and describe the rows to write
+
+    keyword.project must be loaded. The check time is taken now, not at flush
+    time, so buffered entries keep accurate checked_at / next_due_at values.
+    """
+    project = keyword.project
+    results_list = result.get("results", [])
+    match = find_target(results_list, project.subdomain or project.root_domain)
+    checked_at = get_now()
+    return {
+        "keyword_id": keyword.id,
+        "user_id": project.user_id,
+        "rank": match["rank"],
+        "url": match["url"],
+        "title": match["title"],
+        "snippet": match["snippet"],
+        # Full SERP (up to 100 results) for the shared snapshot store
+        "serp": results_list,
+        "credits_used": credits_used,
+        "checked_at": checked_at,
+        "next_due_at": compute_next_due(keyword.tracking_interval_hours, checked_at, keyword.id),
+        "description": description,
+        "reservation_id": reservation_id,
+    }
+
+
+async def store_results(db, entries: List[dict]) -> List[int]:
+    """Persist tracking entries in one transaction (caller commits); returns RankResult ids
+
+    Each entry carries the RankResult columns plus user_id, next_due_at, a
+    transaction description and the reservation its credit came from. Used by the writer's flush and by the manual
+    track endpoint so both paths write identical rows; keyword_latest and rank_rollups are upserted in the same transaction.
+    Entries whose keyword was deleted while buffered only record the credits they used.
+    """
+    if not entries:
+        return []
+
+    all_entries = entries
+    # Row locks (in id order) until commit, so a read-model rebuild (rerank) can't interleave with this write
+    existing = set((await db.execute(
+        select(Keyword.id)
+        .where(Keyword.id.in_({entry["keyword_id"] for entry in entries}))
+        .order_by(Keyword.id)
+        .with_for_update()
+    )).scalars())
+    entries = [entry for entry in all_entries if entry["keyword_id"] in existing]
+    if len(entries) < len(all_entries):
+        logger.warning(f"Skipping {len(all_entries) - len(entries)} result(s) for deleted keywords")
+    if not entries:
+        await _record_credits(db, all_entries)
+        return []
+
+    # Shared SERP snapshots (content-addressed, delta against the keyword's previous one)
+    await db.run_sync(store_snapshots, entries)
+
+    ids = list((await db.execute(
+        insert(RankResult).returning(RankResult.id),
+        [{field: entry.get(field) for field in RANK_RESULT_FIELDS} for entry in entries]
+    )).scalars())
+
+    await upsert_latest(db, entries)
+    await upsert_rollups(db, entries)
+
+    # Bulk UPDATE by id (also releases the scheduling lease); later entries for the same keyword win.
+    # Core executemany, so a keyword deleted since the check above is simply not matched
+    next_due = {entry["keyword_id"]: entry["next_due_at"] for entry in entries if entry.get("next_due_at")}
+    if next_due:
+        await db.execute(
+            update(Keyword.__table__)
+            .where(Keyword.__table__.c.id == bindparam("b_id"))
+            .values(next_due_at=bindparam("b_next_due_at"), leased_until=None, leased_by=None),
+            [{"b_id": keyword_id, "b_next_due_at": due} for keyword_id, due in next_due.items()]
+        )
+
+    await _record_credits(db, all_entries)
+    return ids
+
+
+async def _record_credits(db, entries: List[dict]):
+    """CONSUME transactions and reservation usage for the credits the entries used"""
+    transactions = [
+        {
+            "user_id": entry["user_id"],
+            "amount": -entry["credits_used"],
+            "transaction_type": TransactionType.CONSUME.value,
+            "description": entry.get("description"),
+            "created_at": entry["checked_at"],
+        }
+        for entry in entries if entry.get("credits_used")
+    ]
+    if transactions:
+        await db.execute(insert(CreditTransaction), transactions)
+
+    consumed = defaultdict(int)
+    for entry in entries:
+        if entry.get("reservation_id") and entry.get("credits_used"):
+            consumed[entry["reservation_id"]] += entry["credits_used"]
+    await record_consumption(db, consumed)
+
+
+class ResultWriter:
+    def __init__(self, max_batch: int, flush_interval: float, max_attempts: int = 3):
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self._buffer: List[dict] = []
+        self._attempts: Dict[int, int] = {}
+        # Entries that could not be written on their own; kept for inspection, also logged
+        self.dead_letters = deque(maxlen=1000)
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+        self._task: Optional[asyncio.Task] = None
+        self._latencies = deque(maxlen=500)
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_failures = 0
+        self.dead_lettered = 0
+        self.last_flush_at: Optional[float] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    # ---------- buffering ----------
+    async def add(self, entry: dict):
+        """Queue one finished check; flushes immediately once the batch is full"""
+        self._buffer.append(entry)
+        if len(self._buffer) >= self.max_batch:
+            try:
+                await self.flush()
+            except Exception:
+                pass  # already logged; the entry stays buffered for up to max_attempts flushes
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def flush(self) -> int:
+        """Write everything buffered so far in one transaction; returns entries taken off the buffer
+
+        A failed batch is put back for the next flush. Entries that already failed
+        max_attempts times are written in bisected halves instead, so the rows that
+        still fail on their own go to dead_letters rather than blocking the rest.
+        """
+        async with self._get_lock():
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                await self._store(batch)
+            except Exception as e:
+                self.flush_failures += 1
+                for entry in batch:
+                    self._attempts[id(entry)] = self._attempts.get(id(entry), 0) + 1
+                retry = [entry for entry in batch if self._attempts[id(entry)] < self.max_attempts]
+                exhausted = [entry for entry in batch if self._attempts[id(entry)] >= self.max_attempts]
+                logger.error(f"Result flush failed ({len(retry)} entries kept, {len(exhausted)} out of retries): {e}")
+                if exhausted:
+                    for entry in exhausted:
+                        self._attempts.pop(id(entry), None)
+                    await self._bisect(exhausted)
+                if retry:
+                    # Keep the entries for the next attempt
+                    self._buffer[:0] = retry
+                    raise
+                return len(batch)
+
+            for entry in batch:
+                self._attempts.pop(id(entry), None)
+            self.flushes += 1
+            self.rows_flushed += len(batch)
+            self.last_flush_at = time.time()
+            self._latencies.append(time.monotonic() - started)
+            return len(batch)
+
+    async def _store(self, batch: List[dict]):
+        async with AsyncSessionLocal() as db:
+            await store_results(db, batch)
+            await db.commit()
+
+    async def _bisect(self, batch: List[dict]):
+        """Write batch in ever smaller transactions; single entries that still fail are dead-lettered"""
+        try:
+            await self._store(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                entry = batch[0]
+                self.dead_letters.append(entry)
+                self.dead_lettered += 1
+                logger.error(
+                    f"Dead-lettered result for keyword {entry.get('keyword_id')} checked at "
+                    f"{entry.get('checked_at')} ({entry.get('credits_used') or 0} credits used): {e}"
+                )
+                return
+            middle = len(batch) // 2
+            await self._bisect(batch[:middle])
+            await self._bisect(batch[middle:])
+            return
+        self.flushes += 1
+        self.rows_flushed += len(batch)
+        self.last_flush_at = time.time()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                pass  # already logged; retries are capped per entry
+
+    # ---------- lifecycle ----------
+    async def start(self):
+        """Start the time-based flusher on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        latencies = list(self._latencies)
+        return {
+            "pending": len(self._buffer),
+            "max_batch": self.max_batch,
+            "flush_interval": self.flush_interval,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "flush_failures": self.flush_failures,
+            "dead_lettered": self.dead_lettered,
+            "avg_batch": round(self.rows_flushed / self.flushes, 2) if self.flushes else 0.0,
+            "flush_latency_p50": percentile(latencies, 50),
+            "flush_latency_p95": percentile(latencies, 95),
+            "flush_latency_max": max(latencies) if latencies else None,
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+result_writer = ResultWriter(
+    max_batch=settings.RESULT_WRITER_BATCH_SIZE,
+    flush_interval=settings.RESULT_WRITER_FLUSH_SECONDS,
+    max_attempts=settings.RESULT_WRITER_MAX_ATTEMPTS
+)
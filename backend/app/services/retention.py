@@ -0,0 +1,173 @@
+"""
+Rank history retention
+
+Each project keeps results for its ProjectSettings.data_retention policy;
+projects without settings fall back to DATA_RETENTION_DAYS.
+
+Expired rows are deleted in bounded batches, each in its own short
+transaction with a pause in between, so cleanup never holds long locks or
+writes one huge burst of WAL. Rows are selected by cutoff only, so a run
+that is interrupted (time budget, worker restart) loses nothing: the next
+run simply continues with what is left.
+
+When rank_results is partitioned (see app.services.partitions), months that
+are past every project's retention are dropped as whole partitions first;
+the batched deletes then only handle projects with shorter policies.
+SERP snapshots are deleted together with the last results that used them;
+only those snapshots are checked, never the whole table. With
+RETENTION_DETACH_PARTITIONS snapshots are kept, since detached months still
+refer to them.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.models.models import Project, Keyword, RankResult
+from app.models.settings import ProjectSettings, DataRetention
+from app.services.keyword_latest import decrement_counts
+from app.services.partitions import drop_partitions_before
+from app.services.scheduling import get_now
+from app.services.serp_store import delete_unreferenced_snapshots
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = {
+    DataRetention.KEEP_FOREVER.value: None,
+    DataRetention.RETAIN_90_DAYS.value: 90,
+    DataRetention.RETAIN_180_DAYS.value: 180,
+    DataRetention.RETAIN_365_DAYS.value: 365,
+    DataRetention.RETAIN_2_YEARS.value: 730,
+}
+
+
+def retention_days(policy: Optional[str]) -> Optional[int]:
+    """Days of history a policy keeps; None keeps everything"""
+    if policy in RETENTION_DAYS:
+        return RETENTION_DAYS[policy]
+    return settings.DATA_RETENTION_DAYS if settings.DATA_RETENTION_DAYS > 0 else None
+
+
+def project_policies(db) -> Dict[int, Optional[str]]:
+    """project_id -> data_retention (None when the project has no settings row)"""
+    rows = db.execute(
+        select(Project.id, ProjectSettings.data_retention)
+        .outerjoin(ProjectSettings, ProjectSettings.project_id == Project.id)
+        .order_by(Project.id)
+    ).all()
+    return {project_id: policy for project_id, policy in rows}
+
+
+def partition_horizon(policies: Iterable[Optional[str]], now: datetime) -> Optional[datetime]:
+    """Oldest point any project still keeps; None when some project keeps everything"""
+    longest = 0
+    for policy in policies:
+        days = retention_days(policy)
+        if days is None:
+            return None
+        longest = max(longest, days)
+    return now - timedelta(days=longest)
+
+
+def delete_expired_batch(db, project_id: int, cutoff: datetime, batch_size: int) -> Tuple[int, int]:
+    """Delete up to `batch_size` of the project's results older than `cutoff` and commit
+
+    SERP snapshots used only by those results are deleted in the same transaction.
+    Returns (results deleted, snapshots deleted).
+    """
+    doomed = (
+        select(RankResult.id)
+        .where(
+            RankResult.keyword_id.in_(select(Keyword.id).where(Keyword.project_id == project_id)),
+            RankResult.checked_at < cutoff
+        )
+        .limit(batch_size)
+    )
+    rows = db.execute(
+        delete(RankResult)
+        # Repeat the cutoff so a partitioned table only scans the expired months
+        .where(RankResult.id.in_(doomed), RankResult.checked_at < cutoff)
+        .returning(RankResult.keyword_id, RankResult.serp_snapshot_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    decrement_counts(db, Counter(keyword_id for keyword_id, _ in rows))
+    # Detached partitions still refer to snapshots no attached row does; keep them all then
+    snapshot_ids = [] if settings.RETENTION_DETACH_PARTITIONS else [snapshot_id for _, snapshot_id in rows]
+    try:
+        snapshots = delete_unreferenced_snapshots(db, snapshot_ids, batch_size)
+        db.commit()
+    except IntegrityError:
+        # A writer reused one of the snapshots meanwhile; the next run retries the batch
+        db.rollback()
+        return 0, 0
+    return len(rows), snapshots
+
+
+def apply_retention(
+    db,
+    batch_size: int = None,
+    pause_seconds: float = None,
+    max_seconds: float = None,
+    now: Optional[datetime] = None,
+    sleep=time.sleep
+) -> dict:
+    """Delete every project's expired history; returns a per-project report
+
+    Stops early once `max_seconds` have passed (status "partial"); the next
+    run resumes where this one left off.
+    """
+    batch_size = max(1, batch_size or settings.RETENTION_BATCH_SIZE)
+    pause_seconds = settings.RETENTION_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+    max_seconds = settings.RETENTION_MAX_SECONDS if max_seconds is None else max_seconds
+    now = now or get_now()
+    started = time.monotonic()
+    out_of_time = False
+    projects = []
+
+    policies = project_policies(db)
+    horizon = partition_horizon(policies.values(), now)
+    partitions = drop_partitions_before(db, horizon) if horizon else []
+    snapshots_deleted = 0
+
+    for project_id, policy in policies.items():
+        days = retention_days(policy)
+        if days is None:
+            continue
+        cutoff = now - timedelta(days=days)
+        report = {"project_id": project_id, "retention_days": days, "deleted": 0, "batches": 0}
+        while True:
+            if time.monotonic() - started >= max_seconds:
+                out_of_time = True
+                break
+            deleted, snapshots = delete_expired_batch(db, project_id, cutoff, batch_size)
+            report["deleted"] += deleted
+            snapshots_deleted += snapshots
+            report["batches"] += 1
+            if deleted < batch_size:
+                break
+            sleep(pause_seconds)
+        if report["deleted"]:
+            projects.append(report)
+        if out_of_time:
+            break
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "status": "partial" if out_of_time else "success",
+        "deleted": sum(report["deleted"] for report in projects),
+        "elapsed_seconds": round(elapsed, 3),
+        "partitions_removed": partitions,
+        "snapshots_deleted": snapshots_deleted,
+        "projects": projects,
+    }
+    logger.info(
+        f"Retention cleanup {summary['status']}: {len(partitions)} partitions removed, "
+        f"{summary['deleted']} results deleted from {len(projects)} projects, "
+        f"{snapshots_deleted} SERP snapshots deleted in {elapsed:.1f}s"
+    )
+    return summary
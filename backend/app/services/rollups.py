@@ -0,0 +1,217 @@
+"""
+Daily / weekly rank rollups
+
+rank_rollups holds one row per keyword, resolution (day, week) and UTC
+period: checks, how many found the target, min / max / sum of those ranks
+and the last rank. store_results folds every new RankResult in with one
+upsert in the same transaction, so long-range charts read a few hundred
+aggregate rows instead of thousands of raw results. Rollups are not
+touched by retention, so charts outlive raw history.
+
+Rebuild them from rank_results (e.g. after a restore or a re-rank) with
+
+    python -m app.services.rollups
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, case, or_, bindparam
+
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.models.models import Keyword, RankResult, RankRollup
+from app.services.scheduling import get_now
+
+logger = logging.getLogger(__name__)
+
+RAW = "raw"
+DAY = "day"
+WEEK = "week"
+RESOLUTIONS = (DAY, WEEK)
+
+_table = RankRollup.__table__
+
+
+def period_start(checked_at: datetime, resolution: str) -> datetime:
+    """UTC midnight of the day, or of the Monday of the week, holding checked_at"""
+    if checked_at.tzinfo is None:
+        checked_at = checked_at.replace(tzinfo=timezone.utc)
+    start = checked_at.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == WEEK:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def aggregate(rows) -> Dict[Tuple[int, str, datetime], dict]:
+    """Fold (keyword_id, rank, checked_at) rows into rollup rows keyed by (keyword, resolution, period)"""
+    buckets = {}
+    for row in rows:
+        keyword_id, rank, checked_at = row["keyword_id"], row.get("rank"), row["checked_at"]
+        for resolution in RESOLUTIONS:
+            key = (keyword_id, resolution, period_start(checked_at, resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {
+                    "keyword_id": keyword_id,
+                    "resolution": resolution,
+                    "period_start": key[2],
+                    "checks": 0,
+                    "found": 0,
+                    "rank_min": None,
+                    "rank_max": None,
+                    "rank_sum": 0,
+                    "last_rank": None,
+                    "last_checked_at": None,
+                }
+            bucket["checks"] += 1
+            if rank is not None:
+                bucket["found"] += 1
+                bucket["rank_sum"] += rank
+                bucket["rank_min"] = rank if bucket["rank_min"] is None else min(bucket["rank_min"], rank)
+                bucket["rank_max"] = rank if bucket["rank_max"] is None else max(bucket["rank_max"], rank)
+            if bucket["last_checked_at"] is None or checked_at >= bucket["last_checked_at"]:
+                bucket["last_rank"] = rank
+                bucket["last_checked_at"] = checked_at
+    return buckets
+
+
+def _upsert_statement(db, rows: List[dict]):
+    stmt = upsert_insert(db, _table).values(rows)
+    current = _table.c
+    new = stmt.excluded
+    newer = or_(current.last_checked_at.is_(None), new.last_checked_at >= current.last_checked_at)
+    return stmt.on_conflict_do_update(
+        index_elements=[current.keyword_id, current.resolution, current.period_start],
+        set_={
+            "checks": current.checks + new.checks,
+            "found": current.found + new.found,
+            "rank_sum": current.rank_sum + new.rank_sum,
+            "rank_min": case(
+                (new.rank_min.is_(None), current.rank_min),
+                (or_(current.rank_min.is_(None), new.rank_min < current.rank_min), new.rank_min),
+                else_=current.rank_min
+            ),
+            "rank_max": case(
+                (new.rank_max.is_(None), current.rank_max),
+                (or_(current.rank_max.is_(None), new.rank_max > current.rank_max), new.rank_max),
+                else_=current.rank_max
+            ),
+            "last_rank": case((newer, new.last_rank), else_=current.last_rank),
+            "last_checked_at": case((newer, new.last_checked_at), else_=current.last_checked_at),
+        }
+    )
+
+
+async def upsert_rollups(db, rows: List[dict]):
+    """Fold new RankResult rows (keyword_id, rank, checked_at) into rank_rollups (caller commits)
+
+    Rows are pre-aggregated per period, so one statement never touches a key twice.
+    """
+    buckets = aggregate(rows)
+    if buckets:
+        await db.execute(_upsert_statement(db, list(buckets.values())))
+
+
+def rebuild_keywords(db, keyword_ids: List[int]) -> int:
+    """Recompute the rollups of `keyword_ids` from rank_results (caller commits)
+
+    Only periods from each keyword's oldest remaining result on are
+    replaced; older rollups, whose raw results retention already removed,
+    are kept.
+    """
+    results = db.execute(
+        select(RankResult.keyword_id, RankResult.rank, RankResult.checked_at)
+        .where(RankResult.keyword_id.in_(keyword_ids))
+        .execution_options(yield_per=settings.SCHEDULER_BATCH_SIZE)
+    )
+    buckets = aggregate(row._asdict() for row in results)
+    first = {}
+    for keyword_id, resolution, start in buckets:
+        if (keyword_id, resolution) not in first or start < first[keyword_id, resolution]:
+            first[keyword_id, resolution] = start
+    if first:
+        db.execute(
+            _table.delete().where(
+                _table.c.keyword_id == bindparam("rollup_keyword_id"),
+                _table.c.resolution == bindparam("rollup_resolution"),
+                _table.c.period_start >= bindparam("rollup_start"),
+            ),
+            [
+                {"rollup_keyword_id": keyword_id, "rollup_resolution": resolution, "rollup_start": start}
+                for (keyword_id, resolution), start in first.items()
+            ]
+        )
+        db.execute(_table.insert(), list(buckets.values()))
+    return len(buckets)
+
+
+def rebuild(db, batch_size: int = None) -> int:
+    """Recompute rank_rollups from rank_results; returns the number of rows written
+
+    Keywords are walked in id order, `batch_size` per transaction. The
+    period holding a keyword's oldest remaining result is rebuilt from what
+    retention left of it.
+    """
+    batch_size = max(1, batch_size or settings.SCHEDULER_BATCH_SIZE)
+    written = 0
+    last_id = 0
+    while True:
+        keyword_ids = list(db.execute(
+            select(Keyword.id).where(Keyword.id > last_id).order_by(Keyword.id).limit(batch_size)
+        ).scalars())
+        if not keyword_ids:
+            break
+        last_id = keyword_ids[-1]
+        written += rebuild_keywords(db, keyword_ids)
+        db.commit()
+    logger.info(f"Rebuilt rank_rollups: {written} rows")
+    return written
+
+
+def pick_resolution(start: datetime, end: datetime) -> str:
+    """Raw results for short ranges, daily rollups up to HISTORY_DAILY_MAX_DAYS, weekly beyond"""
+    days = (period_start(end, DAY) - period_start(start, DAY)).days
+    if days <= settings.HISTORY_RAW_MAX_DAYS:
+        return RAW
+    if days <= settings.HISTORY_DAILY_MAX_DAYS:
+        return DAY
+    return WEEK
+
+
+def load_rollups(
+    db, keyword_id: int, resolution: str, start: datetime, end: Optional[datetime] = None
+) -> List[dict]:
+    """Rollup points of a keyword overlapping [start, end], oldest first (naive bounds are UTC)"""
+    end = end or get_now()
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    rows = db.execute(
+        select(RankRollup)
+        .where(
+            RankRollup.keyword_id == keyword_id,
+            RankRollup.resolution == resolution,
+            RankRollup.period_start >= period_start(start, resolution),
+            RankRollup.period_start <= end,
+        )
+        .order_by(RankRollup.period_start)
+    ).scalars()
+    return [
+        {
+            "period_start": row.period_start,
+            "checks": row.checks,
+            "found_ratio": round(row.found / row.checks, 4) if row.checks else 0.0,
+            "rank_min": row.rank_min,
+            "rank_max": row.rank_max,
+            "rank_avg": round(row.rank_sum / row.found, 2) if row.found else None,
+            "last_rank": row.last_rank,
+        }
+        for row in rows
+    ]
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as session:
+        print(f"rank_rollups rebuilt: {rebuild(session)} rows")
@@ -1,181 +1,468 @@
 """
 定时任务服务 - 使用 APScheduler
 """
+import asyncio
 import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from datetime import datetime, timedelta, timezone
-from app.core.database import SessionLocal
-from app.models.models import Keyword, RankResult, Subscription, CreditTransaction, SubscriptionStatus
-from app.services.tracker import google_tracker
+from datetime import datetime, timedelta
+from typing import List
+from collections import Counter
+from sqlalchemy import select, update, or_, func
+from sqlalchemy.orm import selectinload
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import Keyword, Project, Plan, Subscription, SubscriptionStatus
+from app.services.tracker import google_tracker, query_key
+from app.services.scheduling import get_now, interval_minutes, worker_id, is_due, tracking_lane
+from app.services.admission import SCHEDULED, BACKFILL
+from app.services.result_writer import result_writer, build_entry
+from app.services.credits import CreditLedger, expire_reservations
+from app.services.metrics import RunStats, RateMeter
+from app.services.fair_queue import FairQueue
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
+# 最近一次调度运行的吞吐、延迟和失败统计（/api/tracking/stats）
+last_run_stats = {}
 
-def get_now():
-    """获取当前时间（带时区）"""
-    return datetime.now(timezone.utc)
+# 实际派发速率（最近 15 分钟领取的关键词数），与计划速率对比看调度是否平稳
+dispatch_meter = RateMeter(window_seconds=900)
 
 
-async def track_keyword_task(keyword_id: int):
-    """追踪单个关键词"""
-    db = SessionLocal()
-    try:
-        keyword = db.query(Keyword).filter(Keyword.id == keyword_id).first()
-        if not keyword or not keyword.is_active:
-            return {"status": "skipped", "reason": "inactive"}
+def _due_filter(now: datetime):
+    """已到期且未被其他 worker 持有有效租约（租约过期视为 worker 已退出）"""
+    return (
+        Keyword.is_active == True,
+        or_(Keyword.next_due_at <= now, Keyword.next_due_at.is_(None)),
+        or_(Keyword.leased_until.is_(None), Keyword.leased_until <= now)
+    )
 
-        # 获取项目信息
-        project = keyword.project
-        target_domain = project.subdomain or project.root_domain
 
-        # 检查用户积分
-        subscription = db.query(Subscription).filter(
-            Subscription.user_id == project.user_id,
-            Subscription.status == SubscriptionStatus.ACTIVE.value
-        ).first()
+async def claim_due_keywords(
+    db,
+    limit: int,
+    owner: str = None,
+    lease_seconds: int = None,
+    now: datetime = None,
+    fair: bool = None
+) -> List[int]:
+    """领取一批到期关键词并加租约，返回领取到的 ID（调用方负责提交）
+
+    PostgreSQL 上使用 SELECT ... FOR UPDATE SKIP LOCKED：并发领取的 worker
+    跳过彼此锁住的行，各自拿到不重叠的一批。租约到期未释放（worker 崩溃）
+    的关键词会被下一次领取重新拿到。
+
+    fair（默认 SCHEDULER_FAIR_SHARE）：按所有者加权轮转领取——每个所有者的
+    到期关键词按到期先后编号，编号除以套餐权重后从小到大取，大客户的积压
+    不会占满整批。
+    """
+    now = now or get_now()
+    lease_seconds = lease_seconds or settings.SCHEDULER_LEASE_SECONDS
+    fair = settings.SCHEDULER_FAIR_SHARE if fair is None else fair
+    due_order = (Keyword.next_due_at.asc().nulls_first(), Keyword.id)
+    if fair:
+        weights = _owner_weights_subquery()
+        ranked = (
+            select(
+                Keyword.id.label("id"),
+                Keyword.next_due_at.label("next_due_at"),
+                (
+                    func.row_number().over(partition_by=Project.user_id, order_by=due_order) * 1.0
+                    / func.coalesce(weights.c.weight, 1)
+                ).label("turn")
+            )
+            .join(Project, Keyword.project_id == Project.id)
+            .outerjoin(weights, weights.c.user_id == Project.user_id)
+            .where(*_due_filter(now))
+            .subquery()
+        )
+        candidates = (
+            select(ranked.c.id)
+            .order_by(ranked.c.turn, ranked.c.next_due_at.asc().nulls_first(), ranked.c.id)
+            .limit(limit)
+        )
+        # 窗口函数不能与 FOR UPDATE 同层：外层再按到期条件锁行，
+        # 并发 worker 已领取的行在重新检查条件时会被排除
+        due = (
+            select(Keyword.id)
+            .where(Keyword.id.in_(candidates), *_due_filter(now))
+            .with_for_update(skip_locked=True)
+        )
+    else:
+        due = (
+            select(Keyword.id)
+            .where(*_due_filter(now))
+            .order_by(*due_order)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+    stmt = (
+        update(Keyword)
+        .where(Keyword.id.in_(due))
+        .values(
+            leased_until=now + timedelta(seconds=lease_seconds),
+            leased_by=owner or worker_id(),
+            # 租约是调度内部状态，不算关键词被修改
+            updated_at=Keyword.updated_at
+        )
+        .returning(Keyword.id)
+        .execution_options(synchronize_session=False)
+    )
+    return sorted((await db.execute(stmt)).scalars())
 
-        if not subscription or subscription.credits <= 0:
-            return {"status": "skipped", "reason": "no_credits"}
 
-        # 追踪关键词
-        result = await google_tracker.track_keyword(
-            keyword=keyword.keyword,
-            country=keyword.country_code,
-            language=keyword.language
-        )
+async def count_due_keywords(db, now: datetime = None) -> int:
+    """当前可领取的到期关键词数量（走 next_due_at 部分索引）"""
+    return (await db.execute(
+        select(func.count(Keyword.id)).where(*_due_filter(now or get_now()))
+    )).scalar() or 0
 
-        if not result:
-            return {"status": "failed", "reason": "tracking_error"}
-
-        # 查找目标域名排名
-        results_list = result.get("results", [])
-        rank = None
-        url = None
-        title = None
-        snippet = None
-        credits_used = 1
-
-        # 保存完整 SERP 结果（Top 10）
-        import json
-        serp_top10 = results_list[:10] if results_list else []
-        serp_results_json = json.dumps(serp_top10)
-
-        for idx, r in enumerate(results_list, 1):
-            if target_domain and target_domain in r.get("domain", ""):
-                rank = idx
-                url = r.get("link")
-                title = r.get("title")
-                snippet = r.get("snippet")
-                break
 
-        # 如果没匹配到目标域名，不记录排名（不在前100名）
-        if not rank:
-            logger.info(f"关键词 {keyword.keyword} 未在前100名找到目标域名 {target_domain}")
-            # 仍记录一次追踪，但 rank 设为 null
-            rank = None
-
-        # 扣除积分
-        subscription.credits -= credits_used
-
-        # 保存结果
-        rank_result = RankResult(
-            keyword_id=keyword_id,
-            rank=rank,
-            url=url,
-            title=title,
-            snippet=snippet,
-            serp_results=serp_results_json,
-            credits_used=credits_used
+async def planned_dispatch_rate(db) -> float:
+    """计划派发速率（关键词/秒）：所有活跃关键词按各自追踪周期均匀分布时的速率"""
+    rows = await db.execute(
+        select(Keyword.tracking_interval_hours, func.count(Keyword.id))
+        .where(Keyword.is_active == True)
+        .group_by(Keyword.tracking_interval_hours)
+    )
+    return sum(count / (interval_minutes(hours) * 60) for hours, count in rows)
+
+
+async def defer_keywords(db, keyword_ids: List[int], minutes: int):
+    """追踪失败或积分不足时推迟重试并释放租约，避免每次轮询都重复选中（调用方负责提交）"""
+    if not keyword_ids:
+        return
+    await db.execute(
+        update(Keyword)
+        .where(Keyword.id.in_(keyword_ids))
+        .values(next_due_at=get_now() + timedelta(minutes=minutes), leased_until=None, leased_by=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _owner_weights_subquery():
+    """所有者的调度权重：有效订阅套餐的 scheduling_weight（多个订阅取最大）"""
+    return (
+        select(
+            Subscription.user_id.label("user_id"),
+            func.max(func.coalesce(Plan.scheduling_weight, 1)).label("weight")
         )
-        db.add(rank_result)
-
-        # 记录交易
-        transaction = CreditTransaction(
-            user_id=project.user_id,
-            amount=-credits_used,
-            transaction_type="consume",
-            description=f"Auto-track: {keyword.keyword}"
+        .join(Plan, Plan.id == Subscription.plan_id)
+        .where(Subscription.status == SubscriptionStatus.ACTIVE.value)
+        .group_by(Subscription.user_id)
+        .subquery()
+    )
+
+
+async def load_owners(db, keyword_ids: List[int]) -> dict:
+    """活跃关键词所属的项目所有者 {keyword_id: user_id}"""
+    rows = await db.execute(
+        select(Keyword.id, Project.user_id)
+        .join(Keyword.project)
+        .where(Keyword.id.in_(keyword_ids), Keyword.is_active == True)
+    )
+    return dict(rows.all())
+
+
+async def owner_weights(db, user_ids) -> dict:
+    """所有者的调度权重 {user_id: weight}，没有有效订阅的按 1 处理"""
+    weights = _owner_weights_subquery()
+    rows = await db.execute(select(weights.c.user_id, weights.c.weight).where(weights.c.user_id.in_(list(user_ids))))
+    found = {user_id: max(1, weight or 1) for user_id, weight in rows}
+    return {user_id: found.get(user_id, 1) for user_id in user_ids}
+
+
+def record_result(
+    keyword: Keyword,
+    result: dict,
+    credits_used: int,
+    description: str,
+    reservation_id: int = None
+) -> dict:
+    """按项目目标域名匹配排名，生成待写入的追踪结果（由 result_writer 批量落库）
+
+    keyword.project 需已预加载（异步会话不支持懒加载）。
+    """
+    entry = build_entry(keyword, result, credits_used, description, reservation_id)
+    # 如果没匹配到目标域名，不记录排名（不在前100名），但仍记录一次追踪
+    if not entry["rank"]:
+        project = keyword.project
+        logger.info(f"关键词 {keyword.keyword} 未在前100名找到目标域名 {project.subdomain or project.root_domain}")
+    return entry
+
+
+async def track_keyword_group_task(keyword_ids: List[int], ledger: CreditLedger = None) -> dict:
+    """追踪一组相同 (keyword, country, language) 的关键词：只请求一次 Serper，结果分发到各项目
+
+    每个关键词仍按其项目所有者单独计积分、单独记录结果，积分从本轮预留
+    （ledger）中扣除；未传 ledger 时为这组关键词单独预留并在结束时结算。
+    返回 {keyword_id: 结果}。
+    """
+    outcomes = {}
+    credits_used = 1
+    own_ledger = ledger is None
+    if own_ledger:
+        ledger = CreditLedger(settings.CREDIT_RESERVATION_TTL_MINUTES)
+    db = AsyncSessionLocal()
+    # 已占用积分但结果尚未交给 result_writer 的关键词：keyword_id -> 预留 ID
+    held = {}
+    try:
+        keywords = (await db.execute(
+            select(Keyword)
+            .options(selectinload(Keyword.project))
+            .where(Keyword.id.in_(keyword_ids))
+        )).scalars().all()
+        for keyword_id in keyword_ids:
+            outcomes[keyword_id] = {"status": "skipped", "reason": "inactive"}
+
+        now = get_now()
+        if own_ledger:
+            await ledger.reserve(db, Counter(k.project.user_id for k in keywords if k.is_active and is_due(k, now)))
+            await db.commit()
+
+        # 从预留中占用积分（仅内存操作），同一用户的关键词并发追踪时不会超扣
+        charged = []
+        for keyword in keywords:
+            if not keyword.is_active:
+                continue
+            # 重复投递（例如 Celery 租约过期后再次派发）时，已追踪过的关键词不再扣费追踪
+            if not is_due(keyword, now):
+                outcomes[keyword.id] = {"status": "skipped", "reason": "not_due"}
+                continue
+            reservation_id = ledger.consume(keyword.project.user_id, credits_used)
+            if reservation_id is None:
+                outcomes[keyword.id] = {"status": "skipped", "reason": "no_credits"}
+                continue
+            held[keyword.id] = reservation_id
+            charged.append(keyword)
+        no_credits = [k for k, o in outcomes.items() if o.get("reason") == "no_credits"]
+        if no_credits:
+            await defer_keywords(db, no_credits, settings.SCHEDULER_RETRY_MINUTES)
+            await db.commit()
+
+        if not charged:
+            return outcomes
+
+        # 追踪关键词（同组共享一次请求）；缓存结果不能比最短追踪间隔的一半更旧
+        # 整组都积压超过一个周期时走 backfill 通道，让位于常规调度和手动追踪
+        first = charged[0]
+        shortest = min(interval_minutes(k.tracking_interval_hours) for k in charged)
+        lanes = {tracking_lane(k, now) for k in charged}
+        result = await google_tracker.track_keyword(
+            keyword=first.keyword,
+            country=first.country_code,
+            language=first.language,
+            max_age=shortest * 60 / 2,
+            lane=BACKFILL if lanes == {BACKFILL} else SCHEDULED
         )
-        db.add(transaction)
-        db.commit()
 
-        logger.info(f"关键词 {keyword.keyword} 追踪成功，排名: #{rank}")
-        return {"status": "success", "rank": rank, "credits_used": credits_used}
+        if not result:
+            for keyword in charged:
+                outcomes[keyword.id] = {"status": "failed", "reason": "tracking_error"}
+            failed_ids = list(held)
+            for keyword_id in failed_ids:
+                ledger.release(held.pop(keyword_id), credits_used)
+            await defer_keywords(db, failed_ids, settings.SCHEDULER_RETRY_MINUTES)
+            await db.commit()
+            return outcomes
+
+        entries = [
+            record_result(
+                keyword, result, credits_used,
+                description=f"Auto-track: {keyword.keyword}",
+                reservation_id=held[keyword.id]
+            )
+            for keyword in charged
+        ]
+        for entry in entries:
+            # 交给 result_writer 后，预留的使用量随批量写入一起记录
+            held.pop(entry["keyword_id"])
+            await result_writer.add(entry)
+            outcomes[entry["keyword_id"]] = {"status": "success", "rank": entry["rank"], "credits_used": credits_used}
+
+        logger.info(f"关键词 {first.keyword} 追踪成功，共享给 {len(entries)} 个项目关键词")
+        return outcomes
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"关键词追踪失败: {e}")
-        return {"status": "error", "error": str(e)}
+        failed_ids = list(held) or [k for k in keyword_ids if outcomes.get(k, {}).get("status") != "success"]
+        # 结果未交给 result_writer，释放占用的积分
+        for keyword_id, reservation_id in held.items():
+            ledger.release(reservation_id, credits_used)
+        for keyword_id in failed_ids:
+            outcomes[keyword_id] = {"status": "error", "error": str(e)}
+        await defer_keywords(db, failed_ids, settings.SCHEDULER_RETRY_MINUTES)
+        await db.commit()
+        return outcomes
     finally:
-        db.close()
+        if own_ledger:
+            await ledger.settle(db)
+            await db.commit()
+        await db.close()
 
 
-async def process_due_keywords():
-    """处理所有到期的关键词"""
-    db = SessionLocal()
-    try:
-        now = get_now()
+async def track_keyword_task(keyword_id: int):
+    """追踪单个关键词"""
+    outcomes = await track_keyword_group_task([keyword_id])
+    return outcomes[keyword_id]
 
-        # 获取所有活跃关键词
-        keywords = db.query(Keyword).filter(
-            Keyword.is_active == True
-        ).all()
 
-        due_count = 0
+async def group_keywords_by_query(db, keyword_ids: List[int]) -> List[List[int]]:
+    """按 (keyword, country_code, language) 归并到期关键词，每组只需一次 Serper 请求"""
+    groups = {}
+    rows = await db.execute(
+        select(Keyword.id, Keyword.keyword, Keyword.country_code, Keyword.language)
+        .where(Keyword.id.in_(keyword_ids))
+    )
+    for keyword_id, text, country, language in rows:
+        groups.setdefault(query_key(text, country, language), []).append(keyword_id)
+    return list(groups.values())
 
-        for kw in keywords:
-            interval = kw.tracking_interval_hours or 24
-
-            # -1 表示每分钟
-            if interval == -1:
-                interval_minutes = 1
-            else:
-                interval_minutes = interval * 60  # 转换为分钟
-
-            last_result = db.query(RankResult).filter(
-                RankResult.keyword_id == kw.id
-            ).order_by(
-                RankResult.checked_at.desc(),
-                RankResult.id.desc()
-            ).first()
-
-            if last_result and last_result.checked_at:
-                # 处理时区：确保比较的是同一类型
-                if last_result.checked_at.tzinfo:
-                    last_checked = last_result.checked_at.replace(tzinfo=None)
-                else:
-                    last_checked = last_result.checked_at
-                next_check = last_checked + timedelta(minutes=interval_minutes)
-                if now.replace(tzinfo=None) >= next_check:
-                    # 到期，执行追踪
-                    await track_keyword_task(kw.id)
-                    due_count += 1
-            else:
-                # 从未追踪，立即追踪
-                await track_keyword_task(kw.id)
-                due_count += 1
-
-        logger.info(f"处理了 {due_count} 个到期关键词")
-        return {"status": "success", "due_count": due_count}
 
+async def run_worker_pool(queue: FairQueue, concurrency: int, stats: RunStats, ledger: CreditLedger = None):
+    """用有界并发的 worker 池执行一批关键词追踪，单个慢请求不会阻塞整批
+
+    任务按所有者加权轮转（FairQueue）出队，大客户的积压不会让小客户一直等待。
+    """
+    enqueued = time.monotonic()
+
+    async def worker():
+        while True:
+            try:
+                owner_id, keyword_ids = queue.pop()
+            except IndexError:
+                return
+            started = time.monotonic()
+            stats.record_wait(owner_id, started - enqueued)
+            try:
+                outcomes = await track_keyword_group_task(keyword_ids, ledger)
+            except Exception as e:
+                logger.error(f"关键词 {keyword_ids} 追踪异常: {e}")
+                outcomes = {keyword_id: {"status": "error"} for keyword_id in keyword_ids}
+            latency = time.monotonic() - started
+            if any(o.get("status") in ("success", "failed", "error") for o in outcomes.values()):
+                stats.counters["provider_calls"] += 1
+            for outcome in outcomes.values():
+                stats.record(outcome.get("status", "error"), latency)
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(min(concurrency, len(queue))):
+            group.create_task(worker())
+
+
+async def build_fair_queue(db, groups: List[List[int]], owners: dict) -> FairQueue:
+    """把去重后的关键词组放入按所有者划分的公平队列（组归属于其第一个关键词的所有者）"""
+    queue = FairQueue()
+    weights = await owner_weights(db, set(owners.values()))
+    for owner_id, weight in weights.items():
+        queue.set_weight(owner_id, weight)
+    for group in groups:
+        queue.push(owners.get(group[0]), group)
+    return queue
+
+
+async def track_claimed_batch(keyword_ids: List[int], concurrency: int, stats: RunStats, ledger: CreditLedger):
+    """追踪一批已领取的关键词：按查询去重、按所有者公平排队、预留积分后交给 worker 池"""
+    async with AsyncSessionLocal() as db:
+        groups = await group_keywords_by_query(db, keyword_ids)
+        owners = await load_owners(db, keyword_ids)
+        queue = await build_fair_queue(db, groups, owners)
+        # 每批每个所有者只预留一次积分，追踪过程中不再逐个更新订阅行
+        await ledger.reserve(db, Counter(owners.values()))
+        await db.commit()
+    stats.counters["deduplicated"] += len(keyword_ids) - len(groups)
+    await run_worker_pool(queue, concurrency, stats, ledger)
+
+
+async def track_keyword_chunk(keyword_ids: List[int], concurrency: int = None) -> dict:
+    """追踪 Celery 派发的一组已领取关键词（一条 broker 消息），结束时落库并结算积分预留"""
+    concurrency = max(1, concurrency or settings.SCHEDULER_CONCURRENCY)
+    stats = RunStats(concurrency=concurrency)
+    ledger = CreditLedger(settings.CREDIT_RESERVATION_TTL_MINUTES)
+    try:
+        await track_claimed_batch(keyword_ids, concurrency, stats, ledger)
+        await result_writer.flush()
+    finally:
+        async with AsyncSessionLocal() as db:
+            await ledger.settle(db)
+            await db.commit()
+    stats.finish()
+    summary = stats.snapshot()
+    summary["credits"] = ledger.snapshot()
+    return summary
+
+
+async def process_due_keywords(concurrency: int = None, stats: RunStats = None, ledger: CreditLedger = None):
+    """处理所有到期的关键词
+
+    stats / ledger 可由调用方传入，用于在运行过程中读取进度（见 tracking_runs）。
+    """
+    concurrency = max(1, concurrency or settings.SCHEDULER_CONCURRENCY)
+    stats = stats or RunStats(concurrency=concurrency)
+    ledger = ledger or CreditLedger(settings.CREDIT_RESERVATION_TTL_MINUTES)
+    owner = worker_id()
+    seen = set()
+
+    # 退回崩溃的运行遗留的积分预留
+    async with AsyncSessionLocal() as db:
+        expired = await expire_reservations(db)
+        await db.commit()
+    if expired:
+        logger.info(f"退回过期积分预留 {expired} 积分")
+
+    try:
+        # 分批从到期队列领取任务（带租约），直到没有可领取的关键词；
+        # 其他 worker 同时运行时各自领取不重叠的批次
+        while True:
+            async with AsyncSessionLocal() as db:
+                started = time.monotonic()
+                due_ids = await claim_due_keywords(db, limit=settings.SCHEDULER_BATCH_SIZE, owner=owner)
+                await db.commit()
+                dispatch_meter.record(len(due_ids))
+                logger.info(f"领取到期关键词 {len(due_ids)} 个，计划耗时 {(time.monotonic() - started) * 1000:.1f}ms")
+
+            # 同一轮中已处理过的关键词不再重复追踪（例如租约在本轮运行中过期）
+            due_ids = [keyword_id for keyword_id in due_ids if keyword_id not in seen]
+            if not due_ids:
+                break
+
+            seen.update(due_ids)
+            stats.counters["claimed"] += len(due_ids)
+            await track_claimed_batch(due_ids, concurrency, stats, ledger)
+
+        # 本轮结果全部落库后才算完成
+        await result_writer.flush()
     finally:
-        db.close()
+        # 未用完的预留退回订阅
+        async with AsyncSessionLocal() as db:
+            await ledger.settle(db)
+            await db.commit()
+
+    stats.finish()
+    summary = stats.snapshot()
+    summary["credits"] = ledger.snapshot()
+    last_run_stats.clear()
+    last_run_stats.update(summary)
+
+    logger.info(f"处理了 {stats.completed} 个到期关键词: {summary}")
+    return {"status": "success", "due_count": stats.completed, "stats": summary}
 
 
 async def test_track_all_keywords():
     """测试用：每分钟追踪所有活跃关键词（不计入积分）"""
-    db = SessionLocal()
-    try:
-        now = datetime.utcnow()
-
+    async with AsyncSessionLocal() as db:
         # 获取所有活跃关键词
-        keywords = db.query(Keyword).filter(
-            Keyword.is_active == True
-        ).all()
+        keywords = (await db.execute(
+            select(Keyword)
+            .options(selectinload(Keyword.project))
+            .where(Keyword.is_active == True)
+        )).scalars().all()
 
         tracked_count = 0
 
@@ -185,69 +472,43 @@ async def test_track_all_keywords():
                 result = await google_tracker.track_keyword(
                     keyword=kw.keyword,
                     country=kw.country_code,
-                    language=kw.language
+                    language=kw.language,
+                    lane=BACKFILL
                 )
 
                 if not result:
                     continue
 
-                # 查找目标域名排名
-                project = kw.project
-                target_domain = project.subdomain or project.root_domain
-                results_list = result.get("results", [])
-
-                import json
-                serp_top10 = results_list[:10] if results_list else []
-                serp_results_json = json.dumps(serp_top10)
-
-                rank = None
-                url = None
-                title = None
-                snippet = None
-
-                for idx, r in enumerate(results_list, 1):
-                    if target_domain and target_domain in r.get("domain", ""):
-                        rank = idx
-                        url = r.get("link")
-                        title = r.get("title")
-                        snippet = r.get("snippet")
-                        break
-
-                # 保存结果（不计积分）
-                rank_result = RankResult(
-                    keyword_id=kw.id,
-                    rank=rank,
-                    url=url,
-                    title=title,
-                    snippet=snippet,
-                    serp_results=serp_results_json,
-                    credits_used=0  # 测试用，不扣积分
+                # 保存结果（测试用，不扣积分）
+                entry = record_result(
+                    kw, result, credits_used=0,
+                    description=f"Test-track: {kw.keyword}"
                 )
-                db.add(rank_result)
-                db.commit()
+                await result_writer.add(entry)
                 tracked_count += 1
 
-                logger.info(f"测试追踪: {kw.keyword}, 排名: #{rank}")
+                logger.info(f"测试追踪: {kw.keyword}, 排名: #{entry['rank']}")
 
             except Exception as e:
                 logger.error(f"测试追踪失败 {kw.keyword}: {e}")
                 continue
 
+        await result_writer.flush()
+
         logger.info(f"测试追踪完成，共追踪 {tracked_count} 个关键词")
         return {"status": "success", "tracked_count": tracked_count}
 
-    finally:
-        db.close()
-
 
 def start_scheduler():
     """启动定时任务调度器"""
-    # 每小时检查一次到期关键词
+    # 持续轮询到期队列（next_due_at 索引），到期后最多延迟一个轮询周期
     scheduler.add_job(
         process_due_keywords,
-        trigger=IntervalTrigger(hours=1),
+        trigger=IntervalTrigger(seconds=settings.SCHEDULER_POLL_SECONDS),
         id="process_keywords",
         name="处理到期关键词",
+        max_instances=1,
+        coalesce=True,
         replace_existing=True
     )
 
@@ -267,5 +528,6 @@ def start_scheduler():
 
 def stop_scheduler():
     """停止定时任务调度器"""
-    scheduler.shutdown()
+    # 等待正在运行的任务结束，之后才能安全关闭 google_tracker 的连接池
+    scheduler.shutdown(wait=True)
     logger.info("定时任务调度器已停止")
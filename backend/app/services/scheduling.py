@@ -0,0 +1,140 @@
+"""
+关键词调度时间计算
+
+Keyword.next_due_at 是调度队列的唯一依据：每次追踪、修改追踪间隔、
+重新启用关键词时都要更新它，调度器只按 (next_due_at) 部分索引取到期任务。
+领取到期任务时写入租约（leased_until / leased_by），多个调度 worker
+可以并行分摊到期关键词而不重复追踪；结果写入或推迟重试时释放租约。
+
+平滑模式（SCHEDULER_SMOOTHING）下每个关键词在自己的追踪周期内有一个按 ID
+哈希得到的固定相位，下次到期时间对齐到该相位，到期任务均匀分布在整个周期，
+而不是集中在整点。
+"""
+import math
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import select, or_
+from app.core.config import settings
+from app.models.models import Keyword, RankResult
+from app.services.admission import SCHEDULED, BACKFILL
+
+
+def get_now():
+    """获取当前时间（带时区）"""
+    return datetime.now(timezone.utc)
+
+
+def worker_id() -> str:
+    """当前调度 worker 的标识（写入 Keyword.leased_by，便于排查租约归属）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def interval_minutes(interval_hours) -> int:
+    """追踪间隔（分钟）：-1 表示每分钟，空值或 0 按 24 小时处理"""
+    interval = interval_hours or 24
+    if interval == -1:
+        return 1
+    return interval * 60
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def phase_offset(keyword_id: int, period_seconds: int) -> int:
+    """关键词在追踪周期内的固定相位（秒）：按 ID 做乘法哈希，跨进程稳定且分布均匀"""
+    return (keyword_id * 2654435761 % 2 ** 32) * period_seconds // 2 ** 32
+
+
+def compute_next_due(interval_hours, last_checked: Optional[datetime], keyword_id: Optional[int] = None) -> datetime:
+    """根据上次追踪时间计算下次到期时间；从未追踪过则立即到期
+
+    传入 keyword_id 且开启平滑模式时，对齐到该关键词相位上、距上次追踪至少
+    半个周期的第一个时间点（平均间隔仍是一个周期，手动追踪也不会很快再次到期）。
+    """
+    if last_checked is None:
+        return get_now()
+    period = timedelta(minutes=interval_minutes(interval_hours))
+    last_checked = _as_utc(last_checked)
+    if keyword_id is None or not settings.SCHEDULER_SMOOTHING:
+        return last_checked + period
+
+    period_seconds = int(period.total_seconds())
+    phase = phase_offset(keyword_id, period_seconds)
+    earliest = (last_checked + period / 2).timestamp()
+    slot = math.ceil((earliest - phase) / period_seconds)
+    return datetime.fromtimestamp(slot * period_seconds + phase, tz=timezone.utc)
+
+
+def is_due(keyword: Keyword, now: Optional[datetime] = None) -> bool:
+    """关键词是否已到期（next_due_at 为空视为到期）"""
+    if keyword.next_due_at is None:
+        return True
+    return _as_utc(keyword.next_due_at) <= (now or get_now())
+
+
+def tracking_lane(keyword: Keyword, now: Optional[datetime] = None) -> str:
+    """到期超过一个完整周期的关键词属于补追积压（backfill 通道），其余为常规调度"""
+    if keyword.next_due_at is None:
+        return SCHEDULED
+    overdue = (now or get_now()) - _as_utc(keyword.next_due_at)
+    if overdue > timedelta(minutes=interval_minutes(keyword.tracking_interval_hours)):
+        return BACKFILL
+    return SCHEDULED
+
+
+def last_checked_at(db, keyword_id: int) -> Optional[datetime]:
+    """关键词最近一次追踪时间（走 (keyword_id, checked_at DESC) 索引）"""
+    return db.execute(
+        select(RankResult.checked_at)
+        .where(RankResult.keyword_id == keyword_id)
+        .order_by(RankResult.checked_at.desc())
+        .limit(1)
+    ).scalar()
+
+
+def iter_last_checked(db, batch_size: int, now: Optional[datetime] = None) -> Iterator[List[Tuple[int, Optional[datetime], Optional[int]]]]:
+    """按批流式读取活跃关键词的 (keyword_id, 最近追踪时间, 追踪间隔)
+
+    使用服务端游标（yield_per），不加载 RankResult 历史记录，内存占用与关键词数量、
+    历史长短无关；最近追踪时间逐个走 (keyword_id, checked_at DESC) 索引。
+    已被调度 worker 租用的关键词跳过，由结果写入负责更新。
+    """
+    now = now or get_now()
+    latest = (
+        select(RankResult.checked_at)
+        .where(RankResult.keyword_id == Keyword.id)
+        .order_by(RankResult.checked_at.desc())
+        .limit(1)
+        .correlate(Keyword)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(Keyword.id, latest, Keyword.tracking_interval_hours)
+        .where(
+            Keyword.is_active == True,
+            or_(Keyword.leased_until.is_(None), Keyword.leased_until < now)
+        )
+        .order_by(Keyword.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.execute(stmt).partitions():
+        yield [tuple(row) for row in partition]
+
+
+def mark_tracked(keyword: Keyword, checked_at: Optional[datetime] = None):
+    """追踪完成后排入下一个周期"""
+    keyword.next_due_at = compute_next_due(keyword.tracking_interval_hours, checked_at or get_now(), keyword.id)
+
+
+def reschedule_keyword(db, keyword: Keyword):
+    """追踪间隔变更或重新启用时，按最近追踪时间重新计算下次到期时间"""
+    keyword.next_due_at = compute_next_due(
+        keyword.tracking_interval_hours,
+        last_checked_at(db, keyword.id),
+        keyword.id
+    )
@@ -0,0 +1,209 @@
+"""
+SERP response cache
+
+Sits in front of the Serper API so the manual track endpoint, the
+APScheduler job and Celery tasks share results for the same (keyword, gl, hl)
+within a freshness window:
+
+- in-process LRU tier with TTL
+- optional Redis tier (settings.REDIS_URL) shared between processes
+- single-flight: concurrent identical lookups wait on one upstream call
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SerpCache:
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        redis_url: Optional[str] = None,
+        key_prefix: str = "serp:"
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._inflight = {}
+        self._redis = None
+        self._redis_loop = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.redis_hits = 0
+        self.redis_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    # ---------- local LRU tier ----------
+    def _get_local(self, key: tuple, max_age: float) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        if age > max_age:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: tuple, value: dict, stored_at: float = None):
+        self._entries[key] = (stored_at or time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # ---------- Redis tier ----------
+    def _get_redis(self):
+        if not self.redis_url:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._redis_loop is not loop:
+            import redis.asyncio as aioredis
+            self._retire_redis()
+            self._redis = aioredis.from_url(self.redis_url)
+            self._redis_loop = loop
+        return self._redis
+
+    def _retire_redis(self):
+        """Close a Redis client from another loop on that loop if it still runs, else drop it"""
+        client, loop = self._redis, self._redis_loop
+        self._redis, self._redis_loop = None, None
+        if client is None:
+            return
+        if loop is not None and not loop.is_closed() and loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        logger.info("Dropped the SERP cache Redis client of an event loop that no longer runs (it can only be closed there)")
+
+    def _redis_key(self, key: tuple) -> str:
+        return self.key_prefix + "|".join(key)
+
+    async def _get_remote(self, key: tuple, max_age: float) -> Optional[dict]:
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(self._redis_key(key))
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"SERP cache Redis read failed: {e}")
+            return None
+        if not raw:
+            return None
+        payload = json.loads(raw)
+        age = time.time() - payload["stored_at"]
+        if age > min(max_age, self.ttl_seconds):
+            return None
+        # Keep the original age so the local copy expires with the shared one
+        self._set_local(key, payload["value"], time.monotonic() - age)
+        return payload["value"]
+
+    async def _set_remote(self, key: tuple, value: dict):
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            payload = json.dumps({"stored_at": time.time(), "value": value})
+            await client.set(self._redis_key(key), payload, ex=max(1, int(self.ttl_seconds)))
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"SERP cache Redis write failed: {e}")
+
+    # ---------- public API ----------
+    async def get_or_fetch(
+        self,
+        key: tuple,
+        fetch: Callable[[], Awaitable[dict]],
+        max_age: Optional[float] = None
+    ) -> dict:
+        """Return a fresh cached SERP for `key` or fetch it once for all concurrent callers
+
+        `max_age` narrows the freshness window for a single lookup (0 = bypass;
+        the fresh SERP still replaces the cached one). Fetch errors are not
+        cached and propagate to every waiting caller.
+        """
+        max_age = self.ttl_seconds if max_age is None else max_age
+        if not self.enabled:
+            return await fetch()
+        if max_age <= 0:
+            value = await fetch()
+            self._set_local(key, value)
+            await self._set_remote(key, value)
+            return value
+
+        value = self._get_local(key, max_age)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight.get_loop() is loop:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._get_remote(key, max_age)
+            if value is not None:
+                self.hits += 1
+                self.redis_hits += 1
+            else:
+                self.misses += 1
+                value = await fetch()
+                self._set_local(key, value)
+                await self._set_remote(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure doesn't log "never retrieved"
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "redis_enabled": bool(self.redis_url),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "redis_hits": self.redis_hits,
+            "redis_errors": self.redis_errors,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "inflight": len(self._inflight),
+        }
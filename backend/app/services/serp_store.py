@@ -0,0 +1,388 @@
+"""
+Compact SERP storage
+
+A SERP is the full result list Serper returned (up to 100), encoded as
+[domain_id, link, title, snippet] entries: positions are implicit, the
+domain is an id into the shared serp_domains dictionary, and a link on its
+own domain keeps only the path. Full payloads are written column by column
+(all domain ids, then all links, ...), which compresses better than rows;
+payloads are serialized compactly and zlib-compressed behind a one-byte
+format tag.
+
+Snapshots are content-addressed (serp_snapshots.hash is the sha256 of the
+entries): every check that sees the same SERP points at one row. A new SERP
+is stored as a delta against the keyword's previous snapshot (each entry is
+either an index into the base or a new entry) when that is smaller and the
+chain stays under SERP_DELTA_MAX_CHAIN. RankResult.serp_snapshot_id refers
+to the snapshot; keyword_latest remembers each keyword's last one as the
+next delta base.
+
+Readers call `attach_serps` before building responses; RankResult.serp_json
+then yields the same top 10 JSON text serp_results used to hold, while
+`decode_serps` gives the whole list (e.g. for re-ranking). Older rows with
+serp_blob (a single full payload) or serp_results text still read back.
+
+The helpers take a sync Session; async callers go through
+`AsyncSession.run_sync`.
+"""
+import hashlib
+import json
+import logging
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, exists, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.models.models import SerpDomain, SerpSnapshot, RankResult, KeywordLatest
+from app.services.keyword_latest import keyword_layers
+
+logger = logging.getLogger(__name__)
+
+FORMAT_FULL = b"\x01"  # entry rows (serp_blob and early snapshots)
+FORMAT_DELTA = b"\x02"
+FORMAT_COLUMNS = b"\x03"  # full entry list stored as columns
+
+ENTRY_FIELDS = 4  # domain_id, link, title, snippet
+
+# Results shown in API responses (serp_results has always been the top 10)
+RESPONSE_RESULTS = 10
+
+_domain_ids: Dict[str, int] = {}
+_domain_names: Dict[int, str] = {}
+
+# Write-side counters for /api/tracking/stats
+snapshot_stats = Counter()
+
+
+def _remember(rows):
+    for domain_id, domain in rows:
+        _domain_ids[domain] = domain_id
+        _domain_names[domain_id] = domain
+
+
+def intern_domains(db, domains: Iterable[str]) -> Dict[str, int]:
+    """Ids for `domains`, adding new ones to serp_domains (caller commits)"""
+    wanted = set(domains)
+    ids = {domain: _domain_ids[domain] for domain in wanted if domain in _domain_ids}
+    missing = wanted - ids.keys()
+    if missing:
+        existing = db.execute(
+            select(SerpDomain.id, SerpDomain.domain).where(SerpDomain.domain.in_(missing))
+        ).all()
+        _remember(existing)
+        ids.update({domain: domain_id for domain_id, domain in existing})
+    new = wanted - ids.keys()
+    if new:
+        db.execute(
+            upsert_insert(db, SerpDomain.__table__)
+            .values([{"domain": domain} for domain in new])
+            .on_conflict_do_nothing(index_elements=["domain"])
+        )
+        # Not cached yet: this transaction may still roll back
+        ids.update({
+            domain: domain_id
+            for domain_id, domain in db.execute(
+                select(SerpDomain.id, SerpDomain.domain).where(SerpDomain.domain.in_(new))
+            )
+        })
+    return ids
+
+
+def load_domains(db, domain_ids: Iterable[int]):
+    """Make sure the names of `domain_ids` are cached"""
+    missing = [domain_id for domain_id in set(domain_ids) if domain_id not in _domain_names]
+    if missing:
+        _remember(db.execute(
+            select(SerpDomain.id, SerpDomain.domain).where(SerpDomain.id.in_(missing))
+        ).all())
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _pack(tag: bytes, data) -> bytes:
+    return tag + zlib.compress(_dumps(data), 9)
+
+
+def _pack_full(entries: List[list]) -> bytes:
+    columns = [list(column) for column in zip(*entries)] or [[] for _ in range(ENTRY_FIELDS)]
+    return _pack(FORMAT_COLUMNS, columns)
+
+
+def _unpack(blob: bytes) -> Tuple[bytes, list]:
+    """(FORMAT_FULL, entries) or (FORMAT_DELTA, delta) for any stored payload"""
+    tag = blob[:1]
+    if tag not in (FORMAT_FULL, FORMAT_DELTA, FORMAT_COLUMNS):
+        raise ValueError(f"Unknown SERP payload format: {tag!r}")
+    data = json.loads(zlib.decompress(blob[1:]).decode("utf-8"))
+    if tag == FORMAT_COLUMNS:
+        return FORMAT_FULL, [list(entry) for entry in zip(*data)]
+    return tag, data
+
+
+def to_entries(serp: List[dict], domain_ids: Dict[str, int]) -> List[list]:
+    """Compact entries for tracker results (position/title/link/snippet/domain dicts)"""
+    entries = []
+    for result in serp:
+        domain = result.get("domain") or ""
+        link = result.get("link")
+        prefix = f"https://{domain}"
+        if domain and link and link.startswith(prefix):
+            relative = link[len(prefix):]
+            # Only bare paths are stored relative; anything else keeps the full link
+            if relative == "" or relative.startswith("/"):
+                link = relative
+        entries.append([domain_ids[domain], link, result.get("title"), result.get("snippet")])
+    return entries
+
+
+def _expand(entries: List[list]) -> List[dict]:
+    serp = []
+    for position, (domain_id, link, title, snippet) in enumerate(entries, 1):
+        domain = _domain_names[domain_id]
+        if domain and link is not None and (link == "" or link.startswith("/")):
+            link = f"https://{domain}{link}"
+        serp.append({
+            "position": position,
+            "title": title,
+            "link": link,
+            "snippet": snippet,
+            "domain": domain,
+        })
+    return serp
+
+
+def _delta(entries: List[list], base: List[list]) -> list:
+    index = {}
+    for position, entry in enumerate(base):
+        index.setdefault(_dumps(entry), position)
+    return [index.get(_dumps(entry), entry) for entry in entries]
+
+
+def _apply_delta(delta: list, base: List[list]) -> List[list]:
+    return [base[item] if isinstance(item, int) else item for item in delta]
+
+
+def load_snapshots(db, snapshot_ids: Iterable[Optional[int]]) -> Dict[int, Tuple[List[list], int]]:
+    """snapshot_id -> (entries, depth), following delta chains in batched reads"""
+    rows = {}
+    pending = {snapshot_id for snapshot_id in snapshot_ids if snapshot_id is not None}
+    while pending:
+        fetched = db.execute(
+            select(SerpSnapshot.id, SerpSnapshot.base_id, SerpSnapshot.depth, SerpSnapshot.payload)
+            .where(SerpSnapshot.id.in_(pending))
+        ).all()
+        rows.update({row.id: row for row in fetched})
+        pending = {row.base_id for row in fetched if row.base_id is not None and row.base_id not in rows}
+
+    resolved = {}
+    # A delta's base is one level shallower, so resolving by depth always finds it
+    for row in sorted(rows.values(), key=lambda row: row.depth):
+        tag, data = _unpack(row.payload)
+        if tag == FORMAT_FULL:
+            resolved[row.id] = (data, row.depth)
+        elif row.base_id in resolved:
+            resolved[row.id] = (_apply_delta(data, resolved[row.base_id][0]), row.depth)
+    return resolved
+
+
+def _store_layer(db, layer: List[dict], domain_ids: Dict[str, int], previous: Dict[int, Optional[int]]):
+    encoded = {}
+    for entry in layer:
+        entries = to_entries(entry["serp"], domain_ids)
+        digest = hashlib.sha256(_dumps(entries)).hexdigest()
+        entry["_serp_hash"] = digest
+        encoded.setdefault(digest, (entries, entry["keyword_id"]))
+
+    ids = dict(db.execute(
+        select(SerpSnapshot.hash, SerpSnapshot.id).where(SerpSnapshot.hash.in_(list(encoded)))
+    ).all())
+    snapshot_stats["reused"] += sum(1 for entry in layer if entry["_serp_hash"] in ids)
+
+    new = {digest: value for digest, value in encoded.items() if digest not in ids}
+    if new:
+        bases = load_snapshots(db, (previous.get(keyword_id) for _, keyword_id in new.values()))
+        rows = []
+        for digest, (entries, keyword_id) in new.items():
+            row = {"hash": digest, "base_id": None, "depth": 0, "payload": _pack_full(entries)}
+            base_id = previous.get(keyword_id)
+            if base_id in bases and bases[base_id][1] < settings.SERP_DELTA_MAX_CHAIN:
+                base_entries, base_depth = bases[base_id]
+                payload = _pack(FORMAT_DELTA, _delta(entries, base_entries))
+                if len(payload) < len(row["payload"]):
+                    row.update(base_id=base_id, depth=base_depth + 1, payload=payload)
+            snapshot_stats["delta" if row["base_id"] else "full"] += 1
+            snapshot_stats["stored_bytes"] += len(row["payload"])
+            rows.append(row)
+        db.execute(
+            upsert_insert(db, SerpSnapshot.__table__)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+        ids.update(db.execute(
+            select(SerpSnapshot.hash, SerpSnapshot.id).where(SerpSnapshot.hash.in_(list(new)))
+        ).all())
+
+    for entry in layer:
+        entry["serp_snapshot_id"] = ids[entry.pop("_serp_hash")]
+        previous[entry["keyword_id"]] = entry["serp_snapshot_id"]
+        snapshot_stats["raw_bytes"] += len(json.dumps(entry["serp"]))
+
+
+def store_snapshots(db, entries: List[dict], previous: Optional[Dict[int, Optional[int]]] = None):
+    """Set serp_snapshot_id on entries carrying a "serp" list (caller commits)
+
+    `previous` maps keyword_id to its last snapshot (the delta base); by
+    default it is read from keyword_latest. Several entries for one keyword
+    are stored oldest first, each the base of the next.
+    """
+    serp_entries = [entry for entry in entries if entry.get("serp") is not None]
+    if not serp_entries:
+        return
+    domain_ids = intern_domains(db, (
+        result.get("domain") or "" for entry in serp_entries for result in entry["serp"]
+    ))
+    if previous is None:
+        previous = dict(db.execute(
+            select(KeywordLatest.keyword_id, KeywordLatest.serp_snapshot_id)
+            .where(KeywordLatest.keyword_id.in_({entry["keyword_id"] for entry in serp_entries}))
+        ).all())
+    for layer in keyword_layers(serp_entries):
+        _store_layer(db, layer, domain_ids, previous)
+
+
+def decode_serps(db, rows) -> Dict[int, List[dict]]:
+    """Whole stored SERP per row id (rows need id, serp_snapshot_id, serp_blob, serp_results)"""
+    snapshots = load_snapshots(db, (row.serp_snapshot_id for row in rows))
+    encoded = {}
+    serps = {}
+    for row in rows:
+        if row.serp_snapshot_id in snapshots:
+            encoded[row.id] = snapshots[row.serp_snapshot_id][0]
+        elif row.serp_blob is not None:
+            encoded[row.id] = _unpack(row.serp_blob)[1]
+        elif row.serp_results:
+            serps[row.id] = json.loads(row.serp_results)
+    load_domains(db, (entry[0] for entries in encoded.values() for entry in entries))
+    serps.update({row_id: _expand(entries) for row_id, entries in encoded.items()})
+    return serps
+
+
+def attach_serps(db, results: List[RankResult]) -> List[RankResult]:
+    """Decode the SERPs of `results` so RankResult.serp_json can be serialized"""
+    stored = [result for result in results if result.serp_snapshot_id is not None or result.serp_blob is not None]
+    serps = decode_serps(db, stored)
+    for result in stored:
+        if result.id in serps:
+            result.decoded_serp = json.dumps(serps[result.id][:RESPONSE_RESULTS])
+    return results
+
+
+def _unreferenced():
+    """Conditions for a snapshot no result, keyword_latest row or delta refers to"""
+    child = aliased(SerpSnapshot)
+    return (
+        ~exists().where(RankResult.serp_snapshot_id == SerpSnapshot.id),
+        ~exists().where(KeywordLatest.serp_snapshot_id == SerpSnapshot.id),
+        ~exists().where(child.base_id == SerpSnapshot.id)
+    )
+
+
+def delete_unreferenced_snapshots(db, snapshot_ids: Iterable[Optional[int]], batch_size: int = None) -> int:
+    """Delete those of `snapshot_ids` nothing points at any more (caller commits)
+
+    Only the given snapshots are checked, each by index, never the whole
+    table: callers pass the snapshots of the rows they just deleted. Bases
+    of deleted deltas are checked next, so a chain left unused goes with it.
+    """
+    batch_size = max(1, batch_size or settings.RETENTION_BATCH_SIZE)
+    candidates = sorted({snapshot_id for snapshot_id in snapshot_ids if snapshot_id is not None})
+    deleted = 0
+    while candidates:
+        bases = set()
+        for i in range(0, len(candidates), batch_size):
+            rows = db.execute(
+                delete(SerpSnapshot)
+                .where(SerpSnapshot.id.in_(candidates[i:i + batch_size]), *_unreferenced())
+                .returning(SerpSnapshot.base_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            deleted += len(rows)
+            bases.update(base_id for base_id in rows if base_id is not None)
+        candidates = sorted(bases)
+    return deleted
+
+
+def sweep_unreferenced_snapshots(db, batch_size: int) -> int:
+    """Delete up to `batch_size` unreferenced snapshots anywhere in the table and commit
+
+    A full anti-join, for snapshots orphaned outside retention (deleted
+    keywords and projects). Leaves of a delta chain go first; their bases
+    are picked up by a later batch.
+    """
+    orphans = select(SerpSnapshot.id).where(*_unreferenced()).limit(batch_size)
+    try:
+        deleted = db.execute(
+            delete(SerpSnapshot)
+            .where(SerpSnapshot.id.in_(orphans))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+    except IntegrityError:
+        # A writer reused one of them meanwhile; it stays, the rest go next time
+        db.rollback()
+        return 0
+    return deleted
+
+
+def compact_history(db, batch_size: int = None) -> int:
+    """Move legacy serp_results / serp_blob rows onto shared snapshots; returns rows converted
+
+    Walks rank_results in id order, one transaction per batch; rows already
+    converted are skipped, so it can be stopped and rerun.
+    """
+    batch_size = max(1, batch_size or settings.SCHEDULER_BATCH_SIZE)
+    previous: Dict[int, Optional[int]] = {}
+    converted = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(
+                RankResult.id, RankResult.keyword_id, RankResult.checked_at,
+                RankResult.serp_snapshot_id, RankResult.serp_results, RankResult.serp_blob
+            )
+            .where(
+                RankResult.id > last_id,
+                RankResult.serp_snapshot_id.is_(None),
+                or_(RankResult.serp_results.isnot(None), RankResult.serp_blob.isnot(None))
+            )
+            .order_by(RankResult.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        serps = decode_serps(db, rows)
+        entries = [
+            {"id": row.id, "keyword_id": row.keyword_id, "checked_at": row.checked_at, "serp": serps[row.id]}
+            for row in rows
+        ]
+        store_snapshots(db, entries, previous)
+        db.execute(
+            update(RankResult),
+            [
+                {"id": entry["id"], "serp_snapshot_id": entry["serp_snapshot_id"], "serp_results": None, "serp_blob": None}
+                for entry in entries
+            ]
+        )
+        db.commit()
+        converted += len(entries)
+    logger.info(f"Moved {converted} rank results onto shared SERP snapshots")
+    return converted
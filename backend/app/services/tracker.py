@@ -5,23 +5,183 @@ Uses Serper.dev API to track keyword rankings
 Docs: https://serper.dev/docs/search
 """
 import httpx
-from typing import Optional, List
+from typing import Optional, List, Iterable, AsyncIterator
 from app.core.config import settings
+from app.services.rate_limiter import TokenBucket
+from app.services.admission import PriorityAdmission, SCHEDULED
+from app.services.serp_cache import SerpCache
 import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401 - only needed to enable HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class PoolStats:
+    """Connection pool counters used to measure keep-alive reuse"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_responses = 0
+        self.errors = 0
+        self.clients_created = 0
+        self.clients_dropped = 0
+
+    async def trace(self, event_name: str, info: dict):
+        """httpcore trace hook: counts TCP connects and TLS handshakes"""
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def snapshot(self) -> dict:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_requests": reused,
+            "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+            "http2_responses": self.http2_responses,
+            "errors": self.errors,
+            "clients_created": self.clients_created,
+            "clients_dropped": self.clients_dropped,
+        }
 
 
 class GoogleTracker:
     def __init__(self, api_key: str = None):
         self.api_key = (api_key or settings.SERPER_API_KEY or "").strip()
         self.base_url = "https://google.serper.dev/search"
+        self.stats = PoolStats()
+        self.rate_limiter = TokenBucket(settings.SERPER_RATE_PER_SEC, settings.SERPER_RATE_BURST)
+        self.admission = PriorityAdmission(
+            capacity=settings.SERPER_MAX_CONCURRENCY,
+            reserved_interactive=settings.SERPER_INTERACTIVE_RESERVED,
+            interactive_slo_seconds=settings.SERPER_INTERACTIVE_SLO_SECONDS
+        )
+        self.cache = SerpCache(
+            ttl_seconds=settings.SERP_CACHE_TTL_SECONDS,
+            max_entries=settings.SERP_CACHE_MAX_ENTRIES,
+            redis_url=settings.REDIS_URL if settings.SERP_CACHE_REDIS else None
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Create the long-lived pooled client used for every Serper request"""
+        http2 = settings.SERPER_HTTP2 and HTTP2_AVAILABLE
+        if settings.SERPER_HTTP2 and not HTTP2_AVAILABLE:
+            logger.warning("SERPER_HTTP2 is enabled but 'h2' is not installed, falling back to HTTP/1.1")
+
+        limits = httpx.Limits(
+            max_connections=settings.SERPER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SERPER_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SERPER_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            connect=settings.SERPER_CONNECT_TIMEOUT,
+            read=settings.SERPER_READ_TIMEOUT,
+            write=settings.SERPER_WRITE_TIMEOUT,
+            pool=settings.SERPER_POOL_TIMEOUT,
+        )
+        self.stats.clients_created += 1
+        return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, rebuilding it if it belongs to another event loop
+
+        Connections are bound to the loop that opened them, so a client created
+        under one loop (e.g. a previous asyncio.run) cannot be reused in another.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._retire_client()
+            self._client = self._build_client()
+            self._client_loop = loop
+        return self._client
+
+    def _retire_client(self):
+        """Let go of a client that belongs to another event loop
+
+        Its connections can only be closed on the loop that opened them: when
+        that loop still runs (another thread) the close is scheduled there,
+        otherwise the client is dropped and its sockets go with it.
+        """
+        client, loop = self._client, self._client_loop
+        self._client, self._client_loop = None, None
+        if client is None or client.is_closed:
+            return
+        if loop is not None and not loop.is_closed() and loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        self.stats.clients_dropped += 1
+        logger.info("Dropped the Serper client of an event loop that no longer runs (it can only be closed there)")
+
+    async def startup(self):
+        """Open the connection pool (FastAPI lifespan / worker startup)"""
+        self._get_client()
+        logger.info("Serper connection pool ready")
+
+    async def aclose(self):
+        """Close the connection pool (FastAPI lifespan / worker shutdown)"""
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+            logger.info(f"Serper connection pool closed: {self.stats.snapshot()}")
+
+    def pool_stats(self) -> dict:
+        """Connection reuse counters plus current pool occupancy"""
+        stats = self.stats.snapshot()
+        stats["http2_enabled"] = settings.SERPER_HTTP2 and HTTP2_AVAILABLE
+        stats["max_connections"] = settings.SERPER_MAX_CONNECTIONS
+        stats["max_keepalive"] = settings.SERPER_MAX_KEEPALIVE
+
+        # httpx does not expose the pool publicly, so occupancy is best-effort
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        stats["open_connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        return stats
     
-    async def track_keyword(
+    async def search(
         self, 
         keyword: str, 
         country: str = "com",
-        language: str = "en"
-    ) -> Optional[dict]:
-        """Track a keyword and return ranking results"""
+        language: str = "en",
+        max_age: Optional[float] = None,
+        lane: str = SCHEDULED
+    ) -> dict:
+        """Return parsed results, served from the SERP cache when fresh; raises on failure
+
+        `max_age` (seconds) tightens the cache freshness window; 0 forces an upstream call.
+        `lane` is the admission priority of the upstream call (see services.admission).
+        """
+        return await self.cache.get_or_fetch(
+            query_key(keyword, country, language),
+            lambda: self._search_upstream(keyword, country, language, lane),
+            max_age=max_age
+        )
+
+    async def _search_upstream(
+        self, 
+        keyword: str, 
+        country: str = "com",
+        language: str = "en",
+        lane: str = SCHEDULED
+    ) -> dict:
+        """Query Serper once and return parsed results; raises on failure"""
         
         if not self.api_key:
             raise ValueError("SERPER_API_KEY not configured")
@@ -39,40 +199,63 @@ class GoogleTracker:
             "num": 100  # Get top 100 results
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        # Every upstream call, from any tracking path, is admitted by priority
+        # lane and then draws from the same quota
+        async with self.admission.slot(lane):
+            await self.rate_limiter.acquire()
+
+            client = self._get_client()
+            self.stats.requests += 1
             try:
                 response = await client.get(
                     self.base_url, 
                     headers=headers, 
-                    params=params
+                    params=params,
+                    extensions={"trace": self.stats.trace}
                 )
+                if response.http_version == "HTTP/2":
+                    self.stats.http2_responses += 1
                 response.raise_for_status()
-                data = response.json()
-                
-                # Parse organic results
-                results = data.get("organic", [])
-                
-                # Extract position and details for each result
-                ranked_results = []
-                for idx, result in enumerate(results, 1):
-                    ranked_results.append({
-                        "position": idx,
-                        "title": result.get("title"),
-                        "link": result.get("link"),
-                        "snippet": result.get("snippet"),
-                        "domain": self._extract_domain(result.get("link", "")),
-                    })
-                
-                return {
-                    "results": ranked_results,
-                    "count": len(ranked_results),
-                    "keyword": keyword,
-                    "country": country,
-                }
-                
-            except httpx.HTTPError as e:
-                print(f"HTTP error tracking keyword {keyword}: {e}")
-                return None
+            except httpx.HTTPError:
+                self.stats.errors += 1
+                raise
+        data = response.json()
+        
+        # Parse organic results
+        results = data.get("organic", [])
+        
+        # Extract position and details for each result
+        ranked_results = []
+        for idx, result in enumerate(results, 1):
+            ranked_results.append({
+                "position": idx,
+                "title": result.get("title"),
+                "link": result.get("link"),
+                "snippet": result.get("snippet"),
+                "domain": self._extract_domain(result.get("link", "")),
+            })
+        
+        return {
+            "results": ranked_results,
+            "count": len(ranked_results),
+            "keyword": keyword,
+            "country": country,
+        }
+
+    async def track_keyword(
+        self, 
+        keyword: str, 
+        country: str = "com",
+        language: str = "en",
+        max_age: Optional[float] = None,
+        lane: str = SCHEDULED
+    ) -> Optional[dict]:
+        """Track a keyword and return ranking results (None on HTTP errors)"""
+        try:
+            return await self.search(keyword, country, language, max_age=max_age, lane=lane)
+        except httpx.HTTPError as e:
+            logger.warning(f"HTTP error tracking keyword {keyword}: {e}")
+            return None
     
     def _extract_domain(self, url: str) -> str:
         """Extract domain from URL"""
@@ -92,40 +275,103 @@ class GoogleTracker:
             return 10  # Top 100 costs 10x
         return 1
     
-    async def track_multiple(
-        self, 
-        keywords: List[dict],
-        delay: float = 1.0  # Delay between requests to avoid rate limiting
-    ) -> List[dict]:
-        """Track multiple keywords with rate limiting"""
-        
-        results = []
-        
-        for kw_info in keywords:
-            result = await self.track_keyword(
+    @staticmethod
+    def describe_error(exc: Exception) -> dict:
+        """Per-item error details for batch results"""
+        status_code = None
+        if isinstance(exc, httpx.HTTPStatusError):
+            status_code = exc.response.status_code
+        return {
+            "type": type(exc).__name__,
+            "message": str(exc),
+            "status_code": status_code,
+            # Timeouts, connection errors, 429 and 5xx are worth retrying
+            "retryable": isinstance(exc, httpx.TransportError)
+                or status_code == 429
+                or (status_code is not None and status_code >= 500),
+        }
+
+    async def _track_item(self, kw_info: dict) -> dict:
+        started = time.monotonic()
+        item = {"keyword_id": kw_info.get("id"), "keyword": kw_info.get("keyword")}
+        try:
+            item["data"] = await self.search(
                 keyword=kw_info.get("keyword"),
                 country=kw_info.get("country", "com"),
                 language=kw_info.get("language", "en")
             )
-            
-            if result:
-                results.append({
-                    "keyword_id": kw_info.get("id"),
-                    "success": True,
-                    "data": result
-                })
-            else:
-                results.append({
-                    "keyword_id": kw_info.get("id"),
-                    "success": False,
-                    "error": "Tracking failed"
-                })
-            
-            # Rate limiting
-            if delay > 0:
-                await asyncio.sleep(delay)
-        
-        return results
+            item["success"] = True
+        except Exception as e:
+            item["success"] = False
+            item["error"] = self.describe_error(e)
+        item["elapsed"] = round(time.monotonic() - started, 3)
+        return item
+
+    async def iter_track_multiple(
+        self,
+        keywords: Iterable[dict],
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[dict]:
+        """Track keywords concurrently, yielding results in completion order
+
+        At most `concurrency` requests are in flight; the shared token bucket
+        keeps the overall request rate within the provider quota.
+        """
+        concurrency = max(1, concurrency or settings.SERPER_MAX_CONCURRENCY)
+        pending = set()
+        keywords = iter(keywords)
+
+        def refill():
+            for kw_info in keywords:
+                pending.add(asyncio.ensure_future(self._track_item(kw_info)))
+                if len(pending) >= concurrency:
+                    break
+
+        refill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                refill()
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def track_multiple(
+        self, 
+        keywords: List[dict],
+        concurrency: Optional[int] = None
+    ) -> List[dict]:
+        """Track multiple keywords concurrently with rate limiting"""
+        return [item async for item in self.iter_track_multiple(keywords, concurrency)]
+
+
+def find_target(results: List[dict], target_domain: Optional[str]) -> dict:
+    """Locate the first result whose domain contains the project's target domain
+
+    Returns rank/url/title/snippet (all None when the domain is not in the list).
+    """
+    for idx, r in enumerate(results or [], 1):
+        if target_domain and target_domain in r.get("domain", ""):
+            return {
+                "rank": idx,
+                "url": r.get("link"),
+                "title": r.get("title"),
+                "snippet": r.get("snippet"),
+            }
+    return {"rank": None, "url": None, "title": None, "snippet": None}
+
+
+def query_key(keyword: str, country: str, language: str) -> tuple:
+    """Normalized (keyword, gl, hl) identifying one upstream Serper query"""
+    return (
+        " ".join((keyword or "").lower().split()),
+        (country or "com").lower(),
+        (language or "en").lower(),
+    )
 
 
 # Singleton instance
@@ -143,12 +389,17 @@ result = await google_tracker.track_keyword(
     language="en"
 )
 
-# Multiple keywords
+# Multiple keywords (concurrent, rate limited)
 results = await google_tracker.track_multiple([
     {"id": 1, "keyword": "SEO services", "country": "com"},
     {"id": 2, "keyword": "SEO agency", "country": "co.uk"},
 ])
 
+# Stream results as they complete; failed items carry error details
+async for item in google_tracker.iter_track_multiple(keywords, concurrency=20):
+    if not item["success"]:
+        print(item["keyword_id"], item["error"]["type"], item["error"]["status_code"])
+
 # Calculate credits
 credits = google_tracker.calculate_credits(rank=5)  # Returns 10 for top 100
 """
@@ -0,0 +1,188 @@
+"""
+Background runs of the due-keyword scheduler
+
+`POST /api/tracking/process` only records a TrackingRun and starts it as a
+task on the API event loop, so Railway Cron gets a job id back immediately
+instead of waiting for the whole run. A unique `lock_key` held while a run
+is queued or running makes enqueueing idempotent across retries and API
+processes; a run whose heartbeat stops (process died) is marked failed so
+the next call can start a fresh one.
+"""
+import asyncio
+import logging
+from datetime import timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import TrackingRun, RunStatus
+from app.services.credits import CreditLedger
+from app.services.metrics import RunStats
+from app.services.scheduling import get_now
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_LOCK = "process_due_keywords"
+
+# Keep references so running jobs aren't garbage collected
+_jobs = set()
+
+
+async def _expire_stale_run(db):
+    """Release the lock of an active run that stopped sending heartbeats"""
+    now = get_now()
+    cutoff = now - timedelta(seconds=settings.TRACKING_RUN_STALE_SECONDS)
+    await db.execute(
+        update(TrackingRun)
+        .where(
+            TrackingRun.lock_key == ACTIVE_LOCK,
+            or_(
+                TrackingRun.heartbeat_at < cutoff,
+                and_(TrackingRun.heartbeat_at.is_(None), TrackingRun.created_at < cutoff)
+            )
+        )
+        .values(
+            status=RunStatus.FAILED.value,
+            lock_key=None,
+            error="abandoned: no heartbeat",
+            finished_at=now
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def enqueue_run(db) -> Tuple[TrackingRun, bool]:
+    """Start a run unless one is already active; returns (run, created)"""
+    await _expire_stale_run(db)
+
+    run = TrackingRun(status=RunStatus.QUEUED.value, lock_key=ACTIVE_LOCK, created_at=get_now())
+    db.add(run)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        active = (await db.execute(
+            select(TrackingRun).where(TrackingRun.lock_key == ACTIVE_LOCK)
+        )).scalar_one_or_none()
+        if active is not None:
+            return active, False
+        # The active run finished in between; try once more
+        return await enqueue_run(db)
+
+    job = asyncio.create_task(run_job(run.id))
+    _jobs.add(job)
+    job.add_done_callback(_jobs.discard)
+    return run, True
+
+
+async def get_run(db, run_id: int) -> Optional[TrackingRun]:
+    return await db.get(TrackingRun, run_id)
+
+
+def _progress(stats: RunStats, ledger: CreditLedger, planned: int) -> dict:
+    return {
+        "planned": max(planned, stats.counters["claimed"]),
+        "done": stats.completed,
+        "failed": stats.failed,
+        "credits_used": ledger.consumed,
+    }
+
+
+async def _save(run_id: int, **values):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(TrackingRun)
+            .where(TrackingRun.id == run_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def _report_progress(run_id: int, stats: RunStats, ledger: CreditLedger, planned: int):
+    while True:
+        await asyncio.sleep(settings.TRACKING_RUN_PROGRESS_SECONDS)
+        try:
+            await _save(run_id, heartbeat_at=get_now(), **_progress(stats, ledger, planned))
+        except Exception as e:
+            logger.warning(f"Tracking run {run_id} progress update failed: {e}")
+
+
+async def run_job(run_id: int):
+    """Execute process_due_keywords for a TrackingRun, writing progress as it goes"""
+    from app.services.scheduler import process_due_keywords, count_due_keywords
+
+    stats = RunStats(concurrency=max(1, settings.SCHEDULER_CONCURRENCY))
+    ledger = CreditLedger(settings.CREDIT_RESERVATION_TTL_MINUTES)
+    planned = 0
+    reporter = None
+    final = {}
+    try:
+        async with AsyncSessionLocal() as db:
+            planned = await count_due_keywords(db)
+        now = get_now()
+        await _save(
+            run_id,
+            status=RunStatus.RUNNING.value,
+            started_at=now,
+            heartbeat_at=now,
+            planned=planned
+        )
+        reporter = asyncio.create_task(_report_progress(run_id, stats, ledger, planned))
+
+        result = await process_due_keywords(stats=stats, ledger=ledger)
+        final = {"status": RunStatus.SUCCEEDED.value, "stats": result["stats"]}
+    except asyncio.CancelledError:
+        final = {"status": RunStatus.FAILED.value, "error": "cancelled (shutdown)"}
+        raise
+    except Exception as e:
+        logger.error(f"Tracking run {run_id} failed: {e}")
+        final = {"status": RunStatus.FAILED.value, "error": str(e)}
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await _save(
+            run_id,
+            lock_key=None,
+            finished_at=get_now(),
+            **_progress(stats, ledger, planned),
+            **final
+        )
+
+
+def describe_run(run: TrackingRun) -> dict:
+    """Progress payload for the API, with an ETA from the run's throughput so far"""
+    eta_seconds = None
+    if run.status == RunStatus.RUNNING.value and run.started_at and run.done:
+        started_at = run.started_at if run.started_at.tzinfo else run.started_at.replace(tzinfo=timezone.utc)
+        elapsed = (get_now() - started_at).total_seconds()
+        remaining = max(0, (run.planned or 0) - run.done)
+        if elapsed > 0:
+            eta_seconds = round(remaining / (run.done / elapsed), 1)
+    return {
+        "job_id": run.id,
+        "status": run.status,
+        "planned": run.planned or 0,
+        "done": run.done or 0,
+        "failed": run.failed or 0,
+        "credits_used": run.credits_used or 0,
+        "eta_seconds": eta_seconds,
+        "error": run.error,
+        "created_at": run.created_at,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+        "stats": run.stats,
+    }
+
+
+async def cancel_running_jobs():
+    """Stop in-process runs on shutdown (their rows are marked failed)"""
+    jobs = list(_jobs)
+    for job in jobs:
+        job.cancel()
+    if jobs:
+        await asyncio.gather(*jobs, return_exceptions=True)
@@ -1,14 +1,20 @@
 """
 Celery Tasks for scheduled keyword tracking
 """
-from celery import Celery
+from celery import Celery, group
 from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.core.config import settings
-from app.core.database import SessionLocal
-from app.models.models import Keyword, RankResult, Subscription, CreditTransaction, SubscriptionStatus
+from app.core.database import SessionLocal, AsyncSessionLocal, async_engine
 from app.services.tracker import google_tracker
-from datetime import datetime, timedelta, timezone
+from app.services.result_writer import result_writer
+from app.services.metrics import RateMeter
+from typing import List
 import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 # Initialize Celery
 celery_app = Celery(
@@ -22,6 +28,50 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
+# Broker messages published by the planner in this process (messages/sec over 15 minutes)
+broker_meter = RateMeter(window_seconds=900)
+
+# One event loop per worker process, so the Serper connection pool held by
+# google_tracker survives across tasks instead of dying with asyncio.run()
+_worker_loop = None
+
+
+def _get_worker_loop():
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop
+
+
+def run_async(coro):
+    """Run a coroutine on this worker's persistent event loop"""
+    return _get_worker_loop().run_until_complete(coro)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Open the Serper connection pool when a worker process starts"""
+    global _worker_loop
+    # A loop and DB connections inherited from the parent process (prefork) must not be reused
+    _worker_loop = None
+    async_engine.sync_engine.dispose(close=False)
+    run_async(google_tracker.startup())
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Flush buffered results, then close the Serper connection pool and the worker loop"""
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        return
+    run_async(result_writer.stop())
+    run_async(google_tracker.aclose())
+    run_async(async_engine.dispose())
+    _worker_loop.close()
+    _worker_loop = None
+
+
 # Tracking intervals in hours
 TRACKING_INTERVALS = {
     1: "每天1次",
@@ -33,148 +83,250 @@ TRACKING_INTERVALS = {
 
 @celery_app.task(name="track_keyword")
 def track_keyword_task(keyword_id: int):
-    """Track a single keyword"""
+    """Track a single keyword
+
+    Runs the shared async tracking pipeline (async DB session + pooled Serper
+    client) on this worker's persistent event loop.
+    """
+    from app.services.scheduler import track_keyword_task as track_keyword_async
+
+    async def track_and_flush():
+        outcome = await track_keyword_async(keyword_id)
+        # The worker loop only runs while a task does, so flush before returning
+        await result_writer.flush()
+        return outcome
+
+    return run_async(track_and_flush())
+
+
+@celery_app.task(name="track_keyword_chunk")
+def track_keyword_chunk_task(keyword_ids: List[int]):
+    """Track a chunk of claimed keywords concurrently
+
+    One broker message per chunk; the chunk runs through the scheduler's
+    worker pool (query dedup, fair queueing, credit reservation) on this
+    worker's persistent event loop and pooled Serper client.
+    """
+    from app.services.scheduler import track_keyword_chunk
+
+    started = time.monotonic()
+    summary = run_async(track_keyword_chunk(keyword_ids))
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Chunk of {len(keyword_ids)} keywords tracked in {elapsed:.2f}s "
+        f"({len(keyword_ids) / elapsed if elapsed else 0:.1f}/s): {summary['outcomes']}"
+    )
+    return {"keywords": len(keyword_ids), "elapsed_seconds": round(elapsed, 3), "stats": summary}
+
+
+@celery_app.task(name="process_all_keywords")
+def process_all_keywords_task():
+    """Claim due keywords and dispatch them to workers in chunks
+
+    Claims take a lease on each keyword (see scheduler.claim_due_keywords), so
+    overlapping planners, the API-process scheduler and /api/tracking/process
+    never dispatch the same keyword twice. Each claimed batch is published as
+    one group of track_keyword_chunk messages, so broker traffic scales with
+    chunks rather than keywords.
+
+    Chunk tasks settle their own credit reservations; reservations left
+    behind by a chunk whose worker was killed are refunded here first.
+    """
+    from app.services.credits import expire_reservations
+    from app.services.scheduler import claim_due_keywords, dispatch_meter
+
+    async def refund_expired():
+        async with AsyncSessionLocal() as db:
+            refunded = await expire_reservations(db)
+            await db.commit()
+        return refunded
+
+    async def claim_batch():
+        async with AsyncSessionLocal() as db:
+            keyword_ids = await claim_due_keywords(db, limit=settings.SCHEDULER_BATCH_SIZE)
+            await db.commit()
+        return keyword_ids
+
+    refunded = run_async(refund_expired())
+    if refunded:
+        logger.info(f"Refunded {refunded} credits of expired reservations")
+
+    chunk_size = max(1, settings.CELERY_CHUNK_SIZE)
+    started = time.monotonic()
+    due_count = 0
+    messages = 0
+    while True:
+        keyword_ids = run_async(claim_batch())
+        if not keyword_ids:
+            break
+        due_count += len(keyword_ids)
+        dispatch_meter.record(len(keyword_ids))
+
+        chunks = [keyword_ids[i:i + chunk_size] for i in range(0, len(keyword_ids), chunk_size)]
+        group(track_keyword_chunk_task.s(chunk) for chunk in chunks).apply_async()
+        messages += len(chunks)
+        broker_meter.record(len(chunks))
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "status": "success",
+        "due_count": due_count,
+        "messages": messages,
+        "keywords_per_message": round(due_count / messages, 2) if messages else 0.0,
+        "dispatch_seconds": round(elapsed, 3),
+        "messages_per_sec": round(broker_meter.rate(), 3),
+        "credits_refunded": refunded,
+    }
+    logger.info(f"Dispatched due keywords: {summary}")
+    return summary
+
+
+@celery_app.task(name="resync_next_due")
+def resync_next_due_task():
+    """Recompute next_due_at for every active keyword from its latest result
+
+    Repairs the due queue after imports or manual edits. Keywords are streamed
+    in SCHEDULER_BATCH_SIZE partitions over a server-side cursor and each
+    partition is written back in one bulk UPDATE on a separate session, so
+    memory stays flat however many keywords and results there are.
+    """
+    from sqlalchemy import update
+    from app.models.models import Keyword
+    from app.services.scheduling import iter_last_checked, compute_next_due
+
+    started = time.monotonic()
+    updated = 0
+    reader = SessionLocal()
+    writer = SessionLocal()
+    try:
+        for partition in iter_last_checked(reader, settings.SCHEDULER_BATCH_SIZE):
+            writer.execute(
+                update(Keyword),
+                [
+                    {"id": keyword_id, "next_due_at": compute_next_due(interval, last_checked, keyword_id)}
+                    for keyword_id, last_checked, interval in partition
+                ]
+            )
+            writer.commit()
+            updated += len(partition)
+    finally:
+        writer.close()
+        reader.close()
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Resynced next_due_at for {updated} keywords in {elapsed:.2f}s")
+    return {"status": "success", "updated": updated, "elapsed_seconds": round(elapsed, 3)}
+
+
+@celery_app.task(name="rebuild_keyword_latest")
+def rebuild_keyword_latest_task():
+    """Rebuild the keyword_latest read model from rank_results"""
+    from app.services.keyword_latest import rebuild
+
     db = SessionLocal()
     try:
-        keyword = db.query(Keyword).filter(Keyword.id == keyword_id).first()
-        if not keyword or not keyword.is_active:
-            return {"status": "skipped", "reason": "inactive"}
-        
-        # Check user credits
-        subscription = db.query(Subscription).filter(
-            Subscription.user_id == keyword.project.user_id,
-            Subscription.status == SubscriptionStatus.ACTIVE.value
-        ).first()
-        
-        if not subscription or subscription.credits <= 0:
-            return {"status": "skipped", "reason": "no_credits"}
-        
-        # Track keyword
-        result = asyncio.run(google_tracker.track_keyword(
-            keyword=keyword.keyword,
-            country=keyword.country_code,
-            language=keyword.language
-        ))
-        
-        if not result:
-            return {"status": "failed", "reason": "tracking_error"}
-        
-        # Calculate credits
-        results = result.get("results", [])
-        rank = None
-        if results:
-            # Find first result (position 1)
-            rank = results[0].get("position", 1)
-        
-        credits_used = google_tracker.calculate_credits(rank) if rank else 1
-        
-        # Deduct credits
-        subscription.credits -= credits_used
-        
-        # Save result
-        first_result = results[0] if results else {}
-        rank_result = RankResult(
-            keyword_id=keyword_id,
-            rank=rank,
-            url=first_result.get("link"),
-            title=first_result.get("title"),
-            snippet=first_result.get("snippet"),
-            credits_used=credits_used
-        )
-        db.add(rank_result)
-        
-        # Record transaction
-        transaction = CreditTransaction(
-            user_id=keyword.project.user_id,
-            amount=-credits_used,
-            transaction_type="consume",
-            description=f"Auto-track: {keyword.keyword}"
-        )
-        db.add(transaction)
-        db.commit()
-        
-        return {"status": "success", "rank": rank, "credits_used": credits_used}
-        
-    except Exception as e:
-        db.rollback()
-        return {"status": "error", "error": str(e)}
+        return {"status": "success", "keywords": rebuild(db)}
     finally:
         db.close()
 
 
-@celery_app.task(name="process_all_keywords")
-def process_all_keywords_task():
-    """Process all due keywords based on their tracking interval"""
-    
+@celery_app.task(name="rebuild_rank_rollups")
+def rebuild_rank_rollups_task():
+    """Rebuild the daily / weekly rank_rollups from rank_results"""
+    from app.services.rollups import rebuild
+
+    db = SessionLocal()
+    try:
+        return {"status": "success", "rows": rebuild(db)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="compact_serp_history")
+def compact_serp_history_task():
+    """Move legacy serp_results / serp_blob rows onto shared SERP snapshots"""
+    from app.services.serp_store import compact_history
+
+    db = SessionLocal()
+    try:
+        return {"status": "success", "converted": compact_history(db)}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="sweep_serp_snapshots")
+def sweep_serp_snapshots_task():
+    """Delete SERP snapshots nothing refers to (e.g. after keywords or projects were deleted)"""
+    from app.services.serp_store import sweep_unreferenced_snapshots
+
     db = SessionLocal()
     try:
-        now = datetime.now(timezone.utc)
-        
-        # Get all active keywords
-        keywords = db.query(Keyword).filter(
-            Keyword.is_active == True
-        ).all()
-        
-        due_keywords = []
-        
-        for kw in keywords:
-            interval = kw.tracking_interval_hours or 24  # Default to 24 hours
-            
-            if kw.results:
-                # Get last result
-                last_result = kw.results[0]
-                if last_result.checked_at:
-                    next_check = last_result.checked_at + timedelta(hours=interval)
-                    if now >= next_check:
-                        due_keywords.append(kw.id)
-            else:
-                # Never tracked, track now
-                due_keywords.append(kw.id)
-        
-        # Dispatch tasks
-        for keyword_id in due_keywords:
-            track_keyword_task.delay(keyword_id)
-        
-        return {"status": "success", "due_count": len(due_keywords)}
-        
+        deleted = 0
+        while True:
+            batch = sweep_unreferenced_snapshots(db, settings.RETENTION_BATCH_SIZE)
+            deleted += batch
+            if not batch:
+                break
+        return {"status": "success", "deleted": deleted}
+    finally:
+        db.close()
+
+
+@celery_app.task(name="rerank_project")
+def rerank_project_task(project_id: int):
+    """Recompute a project's stored ranks from saved SERPs (no provider calls)"""
+    from app.services.rerank import rerank_project
+
+    db = SessionLocal()
+    try:
+        return {"status": "success", **rerank_project(db, project_id)}
     finally:
         db.close()
 
 
 @celery_app.task(name="cleanup_old_results")
 def cleanup_old_results_task():
-    """Clean up old rank results (default: keep 365 days, configurable)"""
-    
+    """Delete rank history past each project's retention policy
+
+    Batched and time-boxed (see app.services.retention); an interrupted run
+    is resumed by the next one.
+    """
+    from app.services.retention import apply_retention
+
     db = SessionLocal()
     try:
-        # Get retention days from settings (default 365)
-        retention_days = getattr(settings, 'DATA_RETENTION_DAYS', 365)
-        
-        if retention_days <= 0:
-            # 0 means keep forever
-            return {"status": "skipped", "reason": "retention disabled"}
-        
-        cutoff = datetime.utcnow() - timedelta(days=retention_days)
-        
-        old_results = db.query(RankResult).filter(
-            RankResult.checked_at < cutoff
-        ).delete()
-        
-        db.commit()
-        
-        return {"status": "success", "deleted": old_results, "retention_days": retention_days}
+        return apply_retention(db)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="ensure_rank_result_partitions")
+def ensure_rank_result_partitions_task():
+    """Create upcoming monthly rank_results partitions (no-op unless partitioned)"""
+    from app.services.partitions import ensure_partitions
+
+    db = SessionLocal()
+    try:
+        return {"status": "success", "created": ensure_partitions(db)}
     finally:
         db.close()
 
 
 # Celery Beat Schedule
-# Run every hour to check for due keywords
+# Poll the due queue continuously; keyword phase offsets spread due times
+# across each interval, so every tick dispatches a small, steady slice
 celery_app.conf.beat_schedule = {
-    'process-keywords-hourly': {
+    'process-due-keywords': {
         'task': 'process_all_keywords',
-        'schedule': crontab(minute=0),  # Every hour at :00
+        'schedule': float(settings.SCHEDULER_POLL_SECONDS),
     },
     
+    # Create next months' rank_results partitions before they are needed
+    'ensure-rank-result-partitions': {
+        'task': 'ensure_rank_result_partitions',
+        'schedule': crontab(hour=2, minute=30),
+    },
+
     # Daily cleanup at 3 AM UTC
     'cleanup-old-results': {
         'task': 'cleanup_old_results',
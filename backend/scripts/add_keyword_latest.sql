@@ -0,0 +1,35 @@
+-- 创建 keyword_latest 读模型：每个关键词一行，保存最新排名、URL、追踪时间、上一次排名、排名变化和结果数
+-- 结果写入时在同一事务中 upsert；也可以用 python -m app.services.keyword_latest 从历史记录重建
+CREATE TABLE IF NOT EXISTS keyword_latest (
+    keyword_id INTEGER PRIMARY KEY REFERENCES keywords(id) ON DELETE CASCADE,
+    rank INTEGER,
+    url TEXT,
+    checked_at TIMESTAMPTZ,
+    previous_rank INTEGER,
+    rank_delta INTEGER,
+    results_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- 按已有历史回填（rank_delta = 上一次排名 - 最新排名，正数表示排名上升）
+INSERT INTO keyword_latest (keyword_id, rank, url, checked_at, previous_rank, rank_delta, results_count)
+SELECT
+    latest.keyword_id,
+    latest.rank,
+    latest.url,
+    latest.checked_at,
+    previous.rank,
+    previous.rank - latest.rank,
+    latest.results_count
+FROM (
+    SELECT keyword_id, rank, url, checked_at,
+           row_number() OVER (PARTITION BY keyword_id ORDER BY checked_at DESC, id DESC) AS recency,
+           count(*) OVER (PARTITION BY keyword_id) AS results_count
+    FROM rank_results
+) latest
+LEFT JOIN (
+    SELECT keyword_id, rank,
+           row_number() OVER (PARTITION BY keyword_id ORDER BY checked_at DESC, id DESC) AS recency
+    FROM rank_results
+) previous ON previous.keyword_id = latest.keyword_id AND previous.recency = 2
+WHERE latest.recency = 1
+ON CONFLICT (keyword_id) DO NOTHING;
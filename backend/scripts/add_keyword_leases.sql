@@ -0,0 +1,4 @@
+-- 为 keywords 添加调度租约列：多个调度 worker 通过 FOR UPDATE SKIP LOCKED 领取到期关键词，
+-- 租约过期（worker 崩溃）后关键词可被重新领取
+ALTER TABLE keywords ADD COLUMN IF NOT EXISTS leased_until TIMESTAMPTZ;
+ALTER TABLE keywords ADD COLUMN IF NOT EXISTS leased_by VARCHAR(100);
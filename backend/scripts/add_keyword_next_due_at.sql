@@ -0,0 +1,22 @@
+-- 为 keywords 添加 next_due_at（下次到期追踪时间）及活跃关键词的部分索引
+ALTER TABLE keywords ADD COLUMN IF NOT EXISTS next_due_at TIMESTAMPTZ DEFAULT now();
+
+-- 按最近一次追踪时间回填；从未追踪过的关键词立即到期
+UPDATE keywords k
+SET next_due_at = COALESCE(
+    (
+        SELECT r.checked_at
+        FROM rank_results r
+        WHERE r.keyword_id = k.id
+        ORDER BY r.checked_at DESC
+        LIMIT 1
+    ) + CASE
+        WHEN k.tracking_interval_hours = -1 THEN INTERVAL '1 minute'
+        ELSE make_interval(hours => COALESCE(NULLIF(k.tracking_interval_hours, 0), 24))
+    END,
+    now()
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_keywords_next_due_active
+    ON keywords (next_due_at)
+    WHERE is_active = true;
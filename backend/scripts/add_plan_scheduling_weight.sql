@@ -0,0 +1,2 @@
+-- 套餐调度权重：到期关键词积压时按权重在所有者之间轮转领取与追踪
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS scheduling_weight INTEGER DEFAULT 1;
@@ -0,0 +1,16 @@
+-- 创建 project_settings（项目级数据保留策略等设置），清理任务按 data_retention 删除过期排名记录
+-- 没有设置行的项目使用 DATA_RETENTION_DAYS（默认 365 天）
+CREATE TABLE IF NOT EXISTS project_settings (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER NOT NULL UNIQUE REFERENCES projects(id),
+    data_retention VARCHAR(20) DEFAULT '365_days',
+    default_tracking_interval INTEGER DEFAULT 24,
+    notify_on_rank_change BOOLEAN DEFAULT true,
+    rank_change_threshold INTEGER DEFAULT 5,
+    daily_report BOOLEAN DEFAULT false,
+    weekly_report BOOLEAN DEFAULT true,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS ix_project_settings_id ON project_settings (id);
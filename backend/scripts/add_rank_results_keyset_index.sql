@@ -0,0 +1,14 @@
+-- 将 rank_results 的 (keyword_id, checked_at DESC) 索引替换为 (keyword_id, checked_at DESC, id DESC)
+-- 历史记录按 (checked_at, id) 游标分页，每一页都是一次索引范围扫描，与翻页深度无关
+-- 原索引是新索引的前缀，调度器按关键词取最近一次追踪时间的查询同样可以使用新索引
+
+-- 未分区的表：CONCURRENTLY 不锁表，不能在事务块中执行
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_rank_results_keyword_checked_id
+    ON rank_results (keyword_id, checked_at DESC, id DESC);
+
+-- 已按月分区的表（scripts/partition_rank_results.sql）不支持 CONCURRENTLY，改为执行：
+-- CREATE INDEX IF NOT EXISTS ix_rank_results_keyword_checked_id
+--     ON rank_results (keyword_id, checked_at DESC, id DESC);
+
+-- 新索引建好后删除旧索引
+DROP INDEX IF EXISTS ix_rank_results_keyword_checked;
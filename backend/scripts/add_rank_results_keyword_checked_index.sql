@@ -0,0 +1,5 @@
+-- 为 rank_results 添加 (keyword_id, checked_at DESC) 索引
+-- 用于调度器按关键词取最近一次追踪时间，以及历史记录分页查询
+-- CONCURRENTLY 不锁表，不能在事务块中执行
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_rank_results_keyword_checked
+    ON rank_results (keyword_id, checked_at DESC);
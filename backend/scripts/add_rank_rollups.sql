@@ -0,0 +1,41 @@
+-- 创建 rank_rollups 汇总表：每个关键词按天 / 按周（UTC，周一开始）一行，保存检查次数、找到次数、最小 / 最大 / 总和排名和最后一次排名
+-- 结果写入时在同一事务中 upsert；保留策略不删除汇总，长周期图表在原始记录过期后仍可用
+-- 也可以用 python -m app.services.rollups 从历史记录重建
+CREATE TABLE IF NOT EXISTS rank_rollups (
+    keyword_id INTEGER NOT NULL REFERENCES keywords(id) ON DELETE CASCADE,
+    resolution VARCHAR(10) NOT NULL,
+    period_start TIMESTAMPTZ NOT NULL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    found INTEGER NOT NULL DEFAULT 0,
+    rank_min INTEGER,
+    rank_max INTEGER,
+    rank_sum INTEGER NOT NULL DEFAULT 0,
+    last_rank INTEGER,
+    last_checked_at TIMESTAMPTZ,
+    PRIMARY KEY (keyword_id, resolution, period_start)
+);
+
+-- 按已有历史回填（last_rank 取每个周期内最新的一条）
+INSERT INTO rank_rollups (keyword_id, resolution, period_start, checks, found, rank_min, rank_max, rank_sum, last_rank, last_checked_at)
+SELECT
+    keyword_id,
+    resolution,
+    period_start,
+    count(*),
+    count(rank),
+    min(rank),
+    max(rank),
+    coalesce(sum(rank), 0),
+    (array_agg(rank ORDER BY checked_at DESC, id DESC))[1],
+    max(checked_at)
+FROM (
+    SELECT id, keyword_id, rank, checked_at, 'day' AS resolution,
+           date_trunc('day', checked_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS period_start
+    FROM rank_results
+    UNION ALL
+    SELECT id, keyword_id, rank, checked_at, 'week' AS resolution,
+           date_trunc('week', checked_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS period_start
+    FROM rank_results
+) periods
+GROUP BY keyword_id, resolution, period_start
+ON CONFLICT (keyword_id, resolution, period_start) DO NOTHING;
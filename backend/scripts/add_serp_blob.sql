@@ -0,0 +1,8 @@
+-- 紧凑 SERP 存储：域名字典表 + rank_results.serp_blob（压缩的二进制快照，域名以 ID 编码）
+-- 新记录只写 serp_blob，旧记录的 serp_results JSON 文本仍可读取
+CREATE TABLE IF NOT EXISTS serp_domains (
+    id SERIAL PRIMARY KEY,
+    domain VARCHAR(255) NOT NULL UNIQUE
+);
+
+ALTER TABLE rank_results ADD COLUMN IF NOT EXISTS serp_blob BYTEA;
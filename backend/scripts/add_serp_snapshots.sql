@@ -0,0 +1,18 @@
+-- 内容寻址的 SERP 快照：相同的 SERP 只存一份，相近的 SERP 存为相对上一次快照的增量
+-- 旧记录可用 Celery 任务 compact_serp_history 迁移到快照（可中断后重跑）
+CREATE TABLE IF NOT EXISTS serp_snapshots (
+    id SERIAL PRIMARY KEY,
+    hash VARCHAR(64) NOT NULL UNIQUE,
+    base_id INTEGER REFERENCES serp_snapshots(id),
+    depth INTEGER NOT NULL DEFAULT 0,
+    payload BYTEA NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_serp_snapshots_base_id ON serp_snapshots (base_id);
+
+ALTER TABLE rank_results ADD COLUMN IF NOT EXISTS serp_snapshot_id INTEGER REFERENCES serp_snapshots(id);
+-- 保留期清理后回收无引用快照时使用
+CREATE INDEX IF NOT EXISTS ix_rank_results_serp_snapshot ON rank_results (serp_snapshot_id);
+
+-- 每个关键词最近一次快照，作为下一次增量的基准
+ALTER TABLE keyword_latest ADD COLUMN IF NOT EXISTS serp_snapshot_id INTEGER;
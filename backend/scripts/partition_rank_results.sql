@@ -0,0 +1,67 @@
+-- 将 rank_results 改为按 checked_at 按月范围分区（每个 UTC 月份一个分区 rank_results_yYYYYmMM）
+-- 近期历史查询只访问最近几个分区；过期数据按整月 DETACH / DROP 分区清理，无需大批量 DELETE
+-- 应用启动和 Celery 任务 ensure_rank_result_partitions 会自动创建未来月份的分区
+-- 复制数据期间 rank_results 被锁定，请在维护窗口执行
+
+BEGIN;
+
+LOCK TABLE rank_results IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE rank_results RENAME TO rank_results_unpartitioned;
+ALTER INDEX IF EXISTS rank_results_pkey RENAME TO rank_results_unpartitioned_pkey;
+ALTER INDEX IF EXISTS ix_rank_results_id RENAME TO ix_rank_results_unpartitioned_id;
+ALTER INDEX IF EXISTS ix_rank_results_keyword_checked RENAME TO ix_rank_results_unpartitioned_keyword_checked;
+
+-- 分区表的主键必须包含分区键；id 仍由原序列生成，保持唯一
+CREATE TABLE rank_results (
+    id INTEGER NOT NULL DEFAULT nextval('rank_results_id_seq'),
+    keyword_id INTEGER NOT NULL REFERENCES keywords(id),
+    rank INTEGER,
+    url TEXT,
+    title TEXT,
+    snippet TEXT,
+    serp_results TEXT,
+    credits_used INTEGER DEFAULT 1,
+    checked_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, checked_at)
+) PARTITION BY RANGE (checked_at);
+
+ALTER SEQUENCE rank_results_id_seq OWNED BY rank_results.id;
+
+-- 分区表上的索引会自动建到每个分区
+CREATE INDEX ix_rank_results_keyword_checked ON rank_results (keyword_id, checked_at DESC);
+
+-- 兜底分区：未预先创建月份分区时写入也不会失败
+CREATE TABLE rank_results_default PARTITION OF rank_results DEFAULT;
+
+-- 为已有数据覆盖的每个月份以及未来 3 个月创建分区
+DO $$
+DECLARE
+    m TIMESTAMP;
+BEGIN
+    FOR m IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT min(checked_at) FROM rank_results_unpartitioned), now()) AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC') + INTERVAL '3 months',
+            INTERVAL '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF rank_results FOR VALUES FROM (%L) TO (%L)',
+            'rank_results_y' || to_char(m, 'YYYY') || 'm' || to_char(m, 'MM'),
+            to_char(m, 'YYYY-MM-DD') || ' 00:00:00+00',
+            to_char(m + INTERVAL '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO rank_results (id, keyword_id, rank, url, title, snippet, serp_results, credits_used, checked_at)
+SELECT id, keyword_id, rank, url, title, snippet, serp_results, credits_used, COALESCE(checked_at, now())
+FROM rank_results_unpartitioned;
+
+COMMIT;
+
+ANALYZE rank_results;
+
+-- 确认数据无误后删除旧表：
+-- DROP TABLE rank_results_unpartitioned;
@@ -0,0 +1,64 @@
+"""
+Shared test fixtures: a temporary SQLite database and seed data
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app.core.database import Base
+from app.models.models import User, Project, Keyword, Plan, Subscription
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def engine(db_path):
+    """Sync engine on a fresh SQLite file with every table created"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def async_sessions(engine, db_path):
+    """AsyncSession factory on the same file (no pooling, so nothing outlives the test's event loop)"""
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    return async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def make_project(db):
+    """Create a user, a project and `keywords` keywords; returns (project, keywords)
+
+    With `credits` the owner also gets an active subscription holding them.
+    """
+    def make(keywords=0, name="p", root_domain="x.com", credits=None, **keyword_fields):
+        user = User(email=f"{name}@x.com", username=name, hashed_password="x")
+        db.add(user)
+        db.flush()
+        if credits is not None:
+            plan = Plan(name=name, price=0, credits=credits, duration_days=30)
+            db.add(plan)
+            db.flush()
+            db.add(Subscription(user_id=user.id, plan_id=plan.id, credits=credits))
+        project = Project(user_id=user.id, name=name, root_domain=root_domain)
+        db.add(project)
+        db.flush()
+        rows = [Keyword(project_id=project.id, keyword=f"{name}-kw{i}", **keyword_fields) for i in range(keywords)]
+        db.add_all(rows)
+        db.commit()
+        return project, rows
+
+    return make
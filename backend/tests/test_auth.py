@@ -0,0 +1,28 @@
+"""
+Authentication Dependency Tests
+"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.api.auth import get_current_user, get_current_user_async
+from app.core.security import create_access_token
+
+
+def test_sync_and_async_current_user(db, async_sessions, make_project):
+    """Sync routes resolve the user on their own session, async routes on the AsyncSession"""
+    project, _ = make_project()
+    token = create_access_token({"sub": str(project.user_id)})
+
+    assert get_current_user(token=token, db=db).id == project.user_id
+
+    async def run():
+        async with async_sessions() as session:
+            return (await get_current_user_async(token=token, db=session)).id
+
+    assert asyncio.run(run()) == project.user_id
+
+    with pytest.raises(HTTPException) as error:
+        get_current_user(token=create_access_token({"sub": "999"}), db=db)
+    assert error.value.status_code == 401
+    with pytest.raises(HTTPException):
+        get_current_user(token="not-a-token", db=db)
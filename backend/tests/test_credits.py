@@ -0,0 +1,92 @@
+"""
+Credit Ledger Tests
+"""
+import asyncio
+from datetime import timedelta
+from sqlalchemy import select
+from app.models.models import Subscription, CreditReservation, ReservationStatus
+from app.services.credits import (
+    CreditLedger, deduct_credits, reserve_credits, settle_reservation, expire_reservations, record_consumption
+)
+from app.services.scheduling import get_now
+
+
+def _balance(db, user_id):
+    db.expire_all()
+    return db.query(Subscription.credits).filter(Subscription.user_id == user_id).scalar()
+
+
+def test_deductions_never_overdraw(db, async_sessions, make_project):
+    """Concurrent deductions stop at zero; the ones that don't fit get None"""
+    project, _ = make_project(credits=3)
+
+    async def deduct():
+        async with async_sessions() as session:
+            balance = await deduct_credits(session, project.user_id, 1)
+            await session.commit()
+            return balance
+
+    async def run():
+        return await asyncio.gather(*(deduct() for _ in range(5)))
+
+    balances = asyncio.run(run())
+    assert sorted(balance for balance in balances if balance is not None) == [0, 1, 2]
+    assert balances.count(None) == 2
+    assert _balance(db, project.user_id) == 0
+
+
+def test_reservations_grant_partially_settle_and_expire(db, async_sessions, make_project):
+    """Reservations take what the owner has; settle refunds the unused part, expiry keeps only stored usage"""
+    project, _ = make_project(credits=5)
+    user_id = project.user_id
+
+    async def run():
+        async with async_sessions() as session:
+            # Asked for 8, only 5 there
+            first_id, granted = await reserve_credits(session, user_id, 8, ttl_minutes=60)
+            assert granted == 5
+            assert await reserve_credits(session, user_id, 1, ttl_minutes=60) is None
+            assert await settle_reservation(session, first_id, 2) == 2
+            # Already settled: no second refund
+            assert await settle_reservation(session, first_id, 2) == 0
+
+            second_id, granted = await reserve_credits(session, user_id, 2, ttl_minutes=60)
+            await record_consumption(session, {second_id: 1})
+            await session.commit()
+            assert await expire_reservations(session) == 0
+            assert await expire_reservations(session, now=get_now() + timedelta(hours=2)) == 1
+            await session.commit()
+            return (await session.execute(
+                select(CreditReservation).order_by(CreditReservation.id)
+            )).scalars().all()
+
+    first, second = asyncio.run(run())
+    assert (first.amount, first.refunded, first.status) == (5, 2, ReservationStatus.SETTLED.value)
+    assert (second.amount, second.consumed, second.refunded, second.status) == (2, 1, 1, ReservationStatus.SETTLED.value)
+    # 5 - 5 + 2 - 2 + 1
+    assert _balance(db, user_id) == 1
+
+
+def test_ledger_consumes_reserved_credits(db, async_sessions, make_project):
+    """Checks draw on the run's reservation in memory; unused credits are refunded on settle"""
+    project, _ = make_project(credits=3)
+    user_id = project.user_id
+    ledger = CreditLedger(ttl_minutes=60)
+
+    async def run():
+        async with async_sessions() as session:
+            # Partial grant: asked for 5, owner only has 3
+            await ledger.reserve(session, {user_id: 5})
+            await session.commit()
+            taken = [ledger.consume(user_id, 1) for _ in range(4)]
+            assert taken[3] is None and len(set(taken[:3])) == 1
+            ledger.release(taken[0], 1)
+            # Still covered by what is left, no new reservation
+            await ledger.reserve(session, {user_id: 1})
+            await ledger.settle(session)
+            await session.commit()
+
+    asyncio.run(run())
+    assert ledger.snapshot() == {"reserved": 3, "consumed": 2, "refunded": 1, "denied": 1}
+    assert _balance(db, user_id) == 1
+    assert db.query(CreditReservation).count() == 1
@@ -0,0 +1,15 @@
+"""
+Database Setup Tests
+"""
+from app.core.database import get_async_database_url
+
+
+def test_async_database_url_maps_drivers():
+    """Sync URLs are mapped onto asyncpg / aiosqlite; anything else is left alone"""
+    assert get_async_database_url("postgres://u:p@h:5432/db") == "postgresql+asyncpg://u:p@h:5432/db"
+    assert get_async_database_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert get_async_database_url("postgresql+psycopg2://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    # asyncpg spells libpq's sslmode as ssl
+    assert get_async_database_url("postgresql://u:p@h/db?sslmode=require") == "postgresql+asyncpg://u:p@h/db?ssl=require"
+    assert get_async_database_url("sqlite:///./dev.db") == "sqlite+aiosqlite:///./dev.db"
+    assert get_async_database_url("postgresql+asyncpg://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
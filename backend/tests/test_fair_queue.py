@@ -0,0 +1,31 @@
+"""
+Fair Queue Tests
+"""
+from app.services.fair_queue import FairQueue
+
+
+def test_small_owner_is_not_starved_by_backlog():
+    """A small owner's work is interleaved with a large backlog instead of queued behind it"""
+    queue = FairQueue()
+    for i in range(1000):
+        queue.push("enterprise", i)
+    for i in range(3):
+        queue.push("starter", f"s{i}")
+
+    order = [queue.pop()[0] for _ in range(8)]
+    assert order.count("starter") == 3
+    assert order.index("starter") <= 1
+
+
+def test_weights_set_the_share():
+    """An owner with weight 3 gets three items per round to a weight-1 owner's one"""
+    queue = FairQueue()
+    queue.set_weight("pro", 3)
+    for i in range(30):
+        queue.push("pro", i)
+        queue.push("basic", i)
+
+    served = [queue.pop()[0] for _ in range(20)]
+    assert served.count("pro") == 15
+    assert served.count("basic") == 5
+    assert len(queue) == 40
@@ -0,0 +1,80 @@
+"""
+Rank History Paging Tests
+"""
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import event
+from fastapi.middleware.cors import CORSMiddleware
+from app.models.models import RankResult
+from app.services import rollups
+from app.services.history import page_results
+
+
+def test_keyset_pages_cover_history_once(db, make_project):
+    """Pages walk (checked_at, id) newest first without gaps or repeats, honour the range and skip SERPs"""
+    make_project(keywords=1)
+    start = datetime(2025, 1, 1)
+    # Two results per check time, spread over a year (most of it outside the hot window)
+    db.add_all([
+        RankResult(keyword_id=1, rank=day % 10 + 1, checked_at=start + timedelta(days=day), serp_results="[]")
+        for day in range(0, 365, 7) for _ in range(2)
+    ])
+    db.commit()
+    expected = [
+        row.id for row in db.query(RankResult).order_by(RankResult.checked_at.desc(), RankResult.id.desc())
+    ]
+
+    seen, cursor = [], None
+    while True:
+        results, cursor = page_results(db, 1, limit=7, cursor=cursor)
+        seen += [result.id for result in results]
+        if cursor is None:
+            break
+    assert seen == expected
+
+    ranged, cursor = page_results(db, 1, limit=100, start=start + timedelta(days=30), end=start + timedelta(days=60))
+    assert cursor is None
+    assert all(start + timedelta(days=30) <= result.checked_at <= start + timedelta(days=60) for result in ranged)
+    assert len(ranged) == 8
+    assert ranged[0].serp_json is None
+    assert page_results(db, 1, limit=1, include_serp=True)[0][0].serp_json == "[]"
+
+    with pytest.raises(ValueError):
+        page_results(db, 1, limit=10, cursor="not-a-cursor")
+
+
+def test_naive_to_is_utc(db, make_project):
+    """?from=...Z&to=... (no offset): the naive bound is read as UTC for raw pages and rollups"""
+    make_project(keywords=1)
+    now = datetime(2026, 10, 14, 12, 0, tzinfo=timezone.utc)
+    db.add_all([
+        RankResult(keyword_id=1, rank=hours, checked_at=now - timedelta(hours=hours)) for hours in (1, 3, 30, 80)
+    ])
+    db.commit()
+    rollups.rebuild(db)
+    start, to = now - timedelta(days=2), now - timedelta(hours=2)
+
+    # SQLite compares either form the same; PostgreSQL would shift a naive bound by the session time zone
+    bounds = []
+
+    @event.listens_for(db, "do_orm_execute")
+    def capture(state):
+        bounds.extend(value for value in state.statement.compile().params.values() if isinstance(value, datetime))
+
+    results, _ = page_results(db, 1, limit=10, start=start, end=to.replace(tzinfo=None))
+    assert [result.rank for result in results] == [3, 30]
+    assert [result.id for result in page_results(db, 1, limit=10, start=start, end=to)[0]] == [result.id for result in results]
+
+    points = rollups.load_rollups(db, 1, rollups.DAY, start, to.replace(tzinfo=None))
+    assert points == rollups.load_rollups(db, 1, rollups.DAY, start, to)
+    assert [point["checks"] for point in points] == [1, 2]
+    assert rollups.pick_resolution(start, to.replace(tzinfo=None)) == rollups.RAW
+    event.remove(db, "do_orm_execute", capture)
+    assert bounds and all(bound.tzinfo is not None for bound in bounds)
+
+
+def test_cursor_header_is_exposed_to_browsers():
+    """Cross-origin clients can read X-Next-Cursor"""
+    from app.main import app
+    cors = next(middleware for middleware in app.user_middleware if middleware.cls is CORSMiddleware)
+    assert "X-Next-Cursor" in cors.kwargs["expose_headers"]
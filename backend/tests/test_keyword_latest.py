@@ -0,0 +1,41 @@
+"""
+keyword_latest Read Model Tests
+"""
+import asyncio
+from datetime import timedelta
+from sqlalchemy import select
+from app.models.models import KeywordLatest
+from app.services.keyword_latest import rebuild
+from app.services.result_writer import store_results
+from app.services.scheduling import get_now
+
+
+def _entry(keyword_id, rank, checked_at):
+    return {
+        "keyword_id": keyword_id, "rank": rank, "url": f"https://x.com/{rank}",
+        "checked_at": checked_at, "user_id": 1, "credits_used": 0,
+    }
+
+
+def test_store_results_maintains_latest_and_rebuild_matches(db, async_sessions, make_project):
+    """Upserts track latest/previous rank and counts, including out-of-order writes; rebuild agrees"""
+    make_project(keywords=2)
+    now = get_now().replace(microsecond=0, tzinfo=None)
+
+    async def run():
+        async with async_sessions() as session:
+            # Two results for keyword 1 in one batch, applied oldest first
+            await store_results(session, [_entry(1, 8, now - timedelta(hours=2)), _entry(1, 5, now - timedelta(hours=1))])
+            await store_results(session, [_entry(1, 3, now), _entry(2, None, now)])
+            # Older result flushed late: counted, but latest stays
+            await store_results(session, [_entry(1, 9, now - timedelta(hours=3))])
+            await session.commit()
+            return {row.keyword_id: row for row in (await session.execute(select(KeywordLatest))).scalars()}
+
+    rows = asyncio.run(run())
+    assert (rows[1].rank, rows[1].previous_rank, rows[1].rank_delta, rows[1].results_count) == (3, 5, 2, 4)
+    assert (rows[2].rank, rows[2].previous_rank, rows[2].rank_delta, rows[2].results_count) == (None, None, None, 1)
+
+    assert rebuild(db, batch_size=1) == 2
+    rebuilt = {row.keyword_id: row for row in db.query(KeywordLatest)}
+    assert (rebuilt[1].rank, rebuilt[1].previous_rank, rebuilt[1].rank_delta, rebuilt[1].results_count) == (3, 5, 2, 4)
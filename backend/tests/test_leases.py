@@ -0,0 +1,50 @@
+"""
+Keyword Lease Tests
+"""
+import asyncio
+from datetime import timedelta
+from sqlalchemy import select
+from app.models.models import Keyword
+from app.services.scheduler import claim_due_keywords
+from app.services.scheduling import get_now
+
+
+def test_claims_do_not_overlap_and_expired_leases_are_reclaimed(async_sessions, make_project):
+    """Two workers split due keywords; a dead worker's lease can be claimed after it expires"""
+    make_project(keywords=5)
+
+    async def run():
+        async with async_sessions() as db:
+            first = await claim_due_keywords(db, limit=3, owner="a")
+            second = await claim_due_keywords(db, limit=3, owner="b")
+            third = await claim_due_keywords(db, limit=3, owner="c")
+            await db.commit()
+        assert len(first) == 3 and len(second) == 2 and third == []
+        assert not set(first) & set(second)
+
+        # Worker "a" died; once its lease runs out the keywords are claimable again
+        later = get_now() + timedelta(hours=1)
+        async with async_sessions() as db:
+            reclaimed = await claim_due_keywords(db, limit=10, owner="d", lease_seconds=60, now=later)
+            await db.commit()
+            owners = set((await db.execute(select(Keyword.leased_by))).scalars())
+        assert sorted(reclaimed) == sorted(first + second)
+        assert owners == {"d"}
+
+    asyncio.run(run())
+
+
+def test_fair_claim_interleaves_owners(async_sessions, make_project):
+    """A large owner's older backlog doesn't fill the whole batch"""
+    make_project(keywords=20, name="big", next_due_at=get_now() - timedelta(days=1))
+    _, small = make_project(keywords=2, name="small")
+
+    async def run():
+        async with async_sessions() as db:
+            fair = await claim_due_keywords(db, limit=4, owner="a", fair=True)
+            await db.commit()
+        return fair
+
+    fair = asyncio.run(run())
+    assert len(fair) == 4
+    assert {keyword.id for keyword in small} <= set(fair)
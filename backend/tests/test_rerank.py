@@ -0,0 +1,44 @@
+"""
+Re-rank Tests
+"""
+import json
+from datetime import timedelta
+from app.models.models import RankResult, KeywordLatest
+from app.services import serp_store
+from app.services.rerank import rerank_project
+from app.services.scheduling import get_now
+
+
+def _serp(size):
+    return [
+        {"title": f"Result {position}", "link": f"https://site{position}.com/page", "snippet": f"s{position}", "domain": f"site{position}.com"}
+        for position in range(1, size + 1)
+    ]
+
+
+def test_rerank_uses_stored_serps(db, make_project):
+    """A new target found deep in the stored list is ranked; top-10-only misses are left alone"""
+    project, (keyword,) = make_project(keywords=1, root_domain="site3.com")
+
+    now = get_now()
+    entries = [{"keyword_id": keyword.id, "checked_at": now, "serp": _serp(40)}]
+    serp_store.store_snapshots(db, entries)
+    db.add_all([
+        # Legacy row that only kept the top 10
+        RankResult(keyword_id=keyword.id, checked_at=now - timedelta(days=1), rank=3, url="https://site3.com/page",
+                   serp_results=json.dumps(_serp(10))),
+        RankResult(keyword_id=keyword.id, checked_at=now, rank=3, url="https://site3.com/page",
+                   serp_snapshot_id=entries[0]["serp_snapshot_id"]),
+    ])
+    db.commit()
+
+    project.root_domain = "site25.com"
+    db.commit()
+    report = rerank_project(db, project.id, batch_size=1)
+
+    assert (report["results"], report["changed"], report["unresolved"]) == (2, 1, 1)
+    legacy, current = db.query(RankResult).order_by(RankResult.checked_at).all()
+    assert (legacy.rank, current.rank, current.url) == (3, 25, "https://site25.com/page")
+    latest = db.get(KeywordLatest, keyword.id)
+    assert (latest.rank, latest.previous_rank) == (25, 3)
+    assert rerank_project(db, project.id)["changed"] == 0
@@ -0,0 +1,109 @@
+"""
+Result Writer Tests
+"""
+import asyncio
+from sqlalchemy import func
+from app.models.models import Keyword, RankResult, CreditTransaction
+from app.services import result_writer as writer_module
+from app.services.result_writer import ResultWriter, build_entry
+
+
+def test_failed_flush_keeps_entries(monkeypatch):
+    """Entries survive a failed flush and are written by the next one"""
+    written = []
+
+    async def store(db, entries):
+        if not written:
+            written.append(None)
+            raise RuntimeError("db down")
+        written.extend(entries)
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def commit(self):
+            pass
+
+    monkeypatch.setattr(writer_module, "store_results", store)
+    monkeypatch.setattr(writer_module, "AsyncSessionLocal", Session)
+    writer = ResultWriter(max_batch=2, flush_interval=1)
+    entry = {"keyword_id": 1, "user_id": 1, "credits_used": 1, "reservation_id": 7}
+
+    async def run():
+        await writer.add(dict(entry))
+        await writer.add(dict(entry))  # full batch: flush fails, entries kept
+        assert writer.pending == 2
+        assert await writer.flush() == 2
+
+    asyncio.run(run())
+    assert writer.flush_failures == 1
+    assert writer.snapshot()["rows_flushed"] == 2
+    assert len(written) == 3
+
+
+def test_deleted_keyword_does_not_wedge_the_writer(db, async_sessions, make_project, monkeypatch):
+    """A keyword deleted while its result is buffered is skipped; the rest of the batch is written"""
+    project, (kept, deleted) = make_project(keywords=2)
+    serp = {"results": [{"position": 1, "domain": "x.com", "link": "https://x.com/", "title": "x", "snippet": ""}]}
+    entries = [build_entry(keyword, serp, 1, description="Tracked") for keyword in (kept, deleted)]
+    db.delete(deleted)
+    db.commit()
+
+    monkeypatch.setattr(writer_module, "AsyncSessionLocal", async_sessions)
+    writer = ResultWriter(max_batch=10, flush_interval=1)
+
+    async def run():
+        for entry in entries:
+            await writer.add(entry)
+        return await writer.flush()
+
+    assert asyncio.run(run()) == 2
+    assert (writer.pending, writer.flush_failures) == (0, 0)
+    assert [row.keyword_id for row in db.query(RankResult)] == [kept.id]
+    db.expire_all()
+    assert db.get(Keyword, kept.id).next_due_at is not None
+    # Both provider calls were paid for
+    assert db.query(func.count(CreditTransaction.id)).scalar() == 2
+
+
+def test_unwritable_entry_is_dead_lettered(monkeypatch):
+    """After max_attempts failed flushes the batch is bisected and only the bad entry is dropped"""
+    written = []
+
+    async def store(db, entries):
+        if any(entry["keyword_id"] == 2 for entry in entries):
+            raise RuntimeError("bad row")
+        written.extend(entries)
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def commit(self):
+            pass
+
+    monkeypatch.setattr(writer_module, "store_results", store)
+    monkeypatch.setattr(writer_module, "AsyncSessionLocal", Session)
+    writer = ResultWriter(max_batch=10, flush_interval=1, max_attempts=2)
+
+    async def run():
+        for keyword_id in (1, 2, 3):
+            await writer.add({"keyword_id": keyword_id})
+        try:
+            await writer.flush()
+        except RuntimeError:
+            pass
+        assert writer.pending == 3
+        return await writer.flush()
+
+    assert asyncio.run(run()) == 3
+    assert sorted(entry["keyword_id"] for entry in written) == [1, 3]
+    assert [entry["keyword_id"] for entry in writer.dead_letters] == [2]
+    assert (writer.pending, writer.snapshot()["dead_lettered"]) == (0, 1)
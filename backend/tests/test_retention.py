@@ -0,0 +1,98 @@
+"""
+Retention Tests
+"""
+from datetime import timedelta
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.models.models import RankResult, SerpSnapshot
+from app.models.settings import ProjectSettings, DataRetention
+from app.services import serp_store
+from app.services.retention import apply_retention
+from app.services.scheduling import get_now
+
+
+def _seed(db, make_project, now):
+    projects = {}
+    for policy in (DataRetention.RETAIN_90_DAYS.value, DataRetention.KEEP_FOREVER.value, None):
+        project, (keyword,) = make_project(keywords=1, name=str(policy))
+        if policy:
+            db.add(ProjectSettings(project_id=project.id, data_retention=policy))
+        # 5 results older than a year, 2 between 90 and 365 days, 1 recent
+        for days in (400, 401, 402, 403, 404, 100, 120, 1):
+            db.add(RankResult(keyword_id=keyword.id, checked_at=now - timedelta(days=days)))
+        projects[policy] = project.id
+    db.commit()
+    return projects
+
+
+def test_retention_applies_project_policies_in_batches(db, make_project):
+    """Each project keeps its own window; deletes run in bounded batches"""
+    now = get_now().replace(tzinfo=None)
+    projects = _seed(db, make_project, now)
+
+    pauses = []
+    report = apply_retention(db, batch_size=2, pause_seconds=0.1, max_seconds=60, now=now, sleep=pauses.append)
+    by_project = {row["project_id"]: row for row in report["projects"]}
+
+    assert report["status"] == "success"
+    assert by_project[projects["90_days"]]["deleted"] == 7
+    assert by_project[projects["90_days"]]["batches"] == 4
+    assert by_project[projects[None]]["deleted"] == 5  # DATA_RETENTION_DAYS default
+    assert projects["keep_forever"] not in by_project
+    assert pauses and all(pause == 0.1 for pause in pauses)
+    assert db.execute(select(func.count(RankResult.id))).scalar() == 1 + 8 + 3
+
+    # Out of time: stops before the next batch and reports partial so the next run resumes
+    assert apply_retention(db, max_seconds=0, now=now)["status"] == "partial"
+
+
+def _seed_snapshots(db, make_project, now, name):
+    """Two expired results on a delta chain for one keyword, a recent one for another"""
+    project, (old, recent) = make_project(keywords=2, name=name)
+    db.add(ProjectSettings(project_id=project.id, data_retention=DataRetention.RETAIN_90_DAYS.value))
+    serp = [{"title": name, "link": f"https://s{position}.com/", "snippet": "", "domain": f"s{position}.com"} for position in range(10)]
+    entries = [
+        {"keyword_id": old.id, "checked_at": now - timedelta(days=200), "serp": serp},
+        {"keyword_id": old.id, "checked_at": now - timedelta(days=150), "serp": serp[1:]},
+        {"keyword_id": recent.id, "checked_at": now - timedelta(days=1), "serp": serp[::-1]},
+    ]
+    serp_store.store_snapshots(db, entries)
+    for entry in entries:
+        db.add(RankResult(keyword_id=entry["keyword_id"], checked_at=entry["checked_at"], serp_snapshot_id=entry["serp_snapshot_id"]))
+    db.commit()
+
+
+def test_retention_deletes_snapshots_only_expired_results_used(db, make_project, monkeypatch):
+    """A delta chain used only by expired results goes with them; other snapshots are not looked at"""
+    now = get_now().replace(tzinfo=None)
+
+    # Detached partitions may still use snapshots: none are deleted then
+    monkeypatch.setattr(settings, "RETENTION_DETACH_PARTITIONS", True)
+    _seed_snapshots(db, make_project, now, "detached")
+    report = apply_retention(db, batch_size=1, now=now, sleep=lambda seconds: None)
+    assert (report["deleted"], report["snapshots_deleted"]) == (2, 0)
+
+    monkeypatch.setattr(settings, "RETENTION_DETACH_PARTITIONS", False)
+    _seed_snapshots(db, make_project, now, "dropped")
+    report = apply_retention(db, batch_size=1, now=now, sleep=lambda seconds: None)
+    assert (report["deleted"], report["snapshots_deleted"]) == (2, 2)
+    # The first project's orphans are left to the full sweep; both recent snapshots stay
+    assert db.query(SerpSnapshot).count() == 4
+    assert serp_store.sweep_unreferenced_snapshots(db, batch_size=10) == 1
+
+
+def test_partition_helpers():
+    """Month arithmetic and the horizon past which whole partitions can go"""
+    from datetime import datetime, timezone
+    from app.services.partitions import month_start, add_months, partition_name
+    from app.services.retention import partition_horizon
+
+    month = month_start(datetime(2024, 11, 17, 8, 30, tzinfo=timezone.utc))
+    assert month == datetime(2024, 11, 1, tzinfo=timezone.utc)
+    assert add_months(month, 2) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert add_months(month, -11) == datetime(2023, 12, 1, tzinfo=timezone.utc)
+    assert partition_name(add_months(month, 2)) == "rank_results_y2025m01"
+
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert partition_horizon(["90_days", None, "2_years"], now) == now - timedelta(days=730)
+    assert partition_horizon(["90_days", "keep_forever"], now) is None
@@ -0,0 +1,51 @@
+"""
+Rank Rollup Tests
+"""
+import asyncio
+from datetime import datetime, timedelta
+from app.models.models import RankRollup
+from app.services import rollups
+from app.services.result_writer import store_results
+
+
+def _entry(rank, checked_at):
+    return {"keyword_id": 1, "rank": rank, "url": None, "checked_at": checked_at, "user_id": 1, "credits_used": 0}
+
+
+def _snapshot(db):
+    return {
+        (row.resolution, row.period_start.date().isoformat()): (
+            row.checks, row.found, row.rank_min, row.rank_max, row.rank_sum, row.last_rank
+        )
+        for row in db.query(RankRollup)
+    }
+
+
+def test_rollups_follow_writes_and_rebuild(db, async_sessions, make_project):
+    """Daily and weekly aggregates are upserted incrementally, agree with a rebuild and pick a resolution"""
+    make_project(keywords=1)
+    wednesday = datetime(2026, 10, 14, 10, 0)
+
+    async def run():
+        async with async_sessions() as session:
+            await store_results(session, [_entry(8, wednesday), _entry(4, wednesday + timedelta(hours=5))])
+            await store_results(session, [_entry(None, wednesday + timedelta(days=1))])
+            # Late write of an older check: counted, last_rank stays
+            await store_results(session, [_entry(6, wednesday + timedelta(hours=1))])
+            await session.commit()
+
+    asyncio.run(run())
+    incremental = _snapshot(db)
+    assert incremental == {
+        ("day", "2026-10-14"): (3, 3, 4, 8, 18, 4),
+        ("day", "2026-10-15"): (1, 0, None, None, 0, None),
+        ("week", "2026-10-12"): (4, 3, 4, 8, 18, None),
+    }
+    assert rollups.rebuild(db, batch_size=1) == 3
+    assert _snapshot(db) == incremental
+
+    points = rollups.load_rollups(db, 1, rollups.DAY, wednesday - timedelta(days=30), wednesday + timedelta(days=2))
+    assert [(point["checks"], point["found_ratio"], point["rank_avg"]) for point in points] == [(3, 1.0, 6.0), (1, 0.0, None)]
+    assert rollups.pick_resolution(wednesday - timedelta(days=3), wednesday) == rollups.RAW
+    assert rollups.pick_resolution(wednesday - timedelta(days=90), wednesday) == rollups.DAY
+    assert rollups.pick_resolution(wednesday - timedelta(days=365), wednesday) == rollups.WEEK
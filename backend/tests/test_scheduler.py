@@ -0,0 +1,84 @@
+"""
+Scheduler Tracking Tests
+"""
+import asyncio
+from app.models.models import Keyword, RankResult, Subscription
+from app.services import scheduler
+from app.services import result_writer as writer_module
+from app.services.result_writer import ResultWriter
+from app.services.tracker import google_tracker
+
+
+class _Writer:
+    """Stands in for result_writer: keeps the entries handed to it"""
+
+    def __init__(self):
+        self.entries = []
+
+    async def add(self, entry):
+        self.entries.append(entry)
+
+
+def _serp(*domains):
+    return {"results": [
+        {"position": position, "domain": domain, "link": f"https://{domain}/", "title": domain, "snippet": ""}
+        for position, domain in enumerate(domains, 1)
+    ]}
+
+
+def test_one_provider_call_is_shared_and_each_owner_charged_once(db, async_sessions, make_project, monkeypatch):
+    """Keywords with the same normalized query share a Serper call; every owner pays for their own keyword"""
+    _, (first,) = make_project(keywords=1, name="a", root_domain="a.com", credits=5)
+    _, (second,) = make_project(keywords=1, name="b", root_domain="b.com", credits=5)
+    _, (other,) = make_project(keywords=1, name="c", root_domain="c.com", credits=5)
+    first.keyword, second.keyword, other.keyword = "Running Shoes", "running  shoes", "trail shoes"
+    db.commit()
+
+    calls = []
+
+    async def track_keyword(keyword, country="com", language="en", max_age=None, lane=None):
+        calls.append(keyword)
+        return _serp("b.com", "a.com")
+
+    writer = _Writer()
+    monkeypatch.setattr(scheduler, "AsyncSessionLocal", async_sessions)
+    monkeypatch.setattr(scheduler, "result_writer", writer)
+    monkeypatch.setattr(google_tracker, "track_keyword", track_keyword)
+
+    async def run():
+        async with async_sessions() as session:
+            groups = await scheduler.group_keywords_by_query(session, [first.id, second.id, other.id])
+        shared = next(group for group in groups if first.id in group)
+        return groups, await scheduler.track_keyword_group_task(shared)
+
+    groups, outcomes = asyncio.run(run())
+    assert sorted(map(sorted, groups)) == [sorted([first.id, second.id]), [other.id]]
+    assert len(calls) == 1
+    assert {keyword_id: outcome["rank"] for keyword_id, outcome in outcomes.items()} == {first.id: 2, second.id: 1}
+    assert sorted(entry["credits_used"] for entry in writer.entries) == [1, 1]
+    db.expire_all()
+    balances = {row.user_id: row.credits for row in db.query(Subscription)}
+    assert balances == {first.project.user_id: 4, second.project.user_id: 4, other.project.user_id: 5}
+
+
+def test_chunk_tracks_only_its_keywords_and_settles(db, async_sessions, make_project, monkeypatch):
+    """A Celery chunk writes its own results, reschedules its keywords and refunds the unused reservation"""
+    _, keywords = make_project(keywords=4, credits=10)
+    chunk = [keyword.id for keyword in keywords[:2]]
+
+    async def track_keyword(keyword, country="com", language="en", max_age=None, lane=None):
+        return _serp("x.com")
+
+    monkeypatch.setattr(scheduler, "AsyncSessionLocal", async_sessions)
+    monkeypatch.setattr(writer_module, "AsyncSessionLocal", async_sessions)
+    monkeypatch.setattr(scheduler, "result_writer", ResultWriter(max_batch=100, flush_interval=60))
+    monkeypatch.setattr(google_tracker, "track_keyword", track_keyword)
+
+    summary = asyncio.run(scheduler.track_keyword_chunk(chunk, concurrency=2))
+    assert summary["credits"]["consumed"] == 2
+    assert sorted(row.keyword_id for row in db.query(RankResult)) == chunk
+    db.expire_all()
+    # Tracked keywords were rescheduled, the rest are still due
+    due = {keyword.id: keyword.next_due_at for keyword in db.query(Keyword)}
+    assert min(due[keyword_id] for keyword_id in chunk) > max(due[keyword.id] for keyword in keywords[2:])
+    assert db.query(Subscription.credits).scalar() == 8
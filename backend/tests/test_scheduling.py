@@ -0,0 +1,157 @@
+"""
+Scheduling Tests
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from app.services.scheduling import interval_minutes, compute_next_due, phase_offset
+from app.services.metrics import RunStats, RateMeter, percentile
+
+
+def test_interval_minutes():
+    """-1 means every minute; empty or zero intervals default to 24 hours"""
+    assert interval_minutes(-1) == 1
+    assert interval_minutes(6) == 360
+    assert interval_minutes(None) == 24 * 60
+    assert interval_minutes(0) == 24 * 60
+
+
+def test_compute_next_due():
+    """Next due time is last check plus interval; never-tracked is due now"""
+    checked = datetime(2024, 1, 1, 12, 5, tzinfo=timezone.utc)
+    assert compute_next_due(1, checked) == checked + timedelta(hours=1)
+
+    # Naive timestamps (e.g. from SQLite) are treated as UTC
+    assert compute_next_due(1, checked.replace(tzinfo=None)) == checked + timedelta(hours=1)
+
+    before = datetime.now(timezone.utc)
+    assert compute_next_due(24, None) >= before
+
+
+def test_compute_next_due_keeps_keyword_phase():
+    """With a keyword id, due times land on the keyword's own phase within the interval"""
+    period = timedelta(hours=24)
+    phase = phase_offset(42, int(period.total_seconds()))
+    for hour in (0, 5, 13, 23):
+        checked = datetime(2024, 1, 1, hour, 30, tzinfo=timezone.utc)
+        due = compute_next_due(24, checked, keyword_id=42)
+        assert checked + period / 2 <= due < checked + period * 3 / 2
+        assert int(due.timestamp()) % int(period.total_seconds()) == phase
+
+    # Keywords checked at the same instant are spread across the interval
+    checked = datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)
+    slots = {compute_next_due(1, checked, keyword_id=i).minute // 10 for i in range(1, 200)}
+    assert slots == set(range(6))
+
+
+def test_rate_meter():
+    """Rate meter reports events per second over its window"""
+    meter = RateMeter(window_seconds=60)
+    meter.started -= 60
+    meter.record(30)
+    meter.record(30)
+    assert meter.total == 60
+    assert abs(meter.rate() - 1.0) < 0.01
+
+
+def test_run_stats_snapshot():
+    """Run stats report outcomes, failures and tail latency"""
+    stats = RunStats(concurrency=4)
+    for i in range(1, 101):
+        stats.record("success" if i % 10 else "failed", i / 100)
+    stats.record("error", 2.0)
+    stats.finish()
+
+    summary = stats.snapshot()
+    assert summary["completed"] == 101
+    assert summary["failed"] == 11
+    assert summary["latency_max"] == 2.0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([], 95) is None
+
+
+def test_iter_last_checked_streams_latest_result(db, make_project):
+    """Partitions carry each keyword's latest check time without loading its history"""
+    from app.models.models import RankResult
+    from app.services.scheduling import iter_last_checked, get_now
+
+    _, keywords = make_project(keywords=5, tracking_interval_hours=24)
+    now = get_now().replace(microsecond=0, tzinfo=None)
+    for days in (3, 1, 2):
+        db.add(RankResult(keyword_id=keywords[0].id, checked_at=now - timedelta(days=days)))
+    keywords[4].leased_until = now + timedelta(minutes=5)
+    db.commit()
+
+    partitions = list(iter_last_checked(db, batch_size=2))
+    rows = [row for partition in partitions for row in partition]
+    assert [len(partition) for partition in partitions] == [2, 2]
+    assert rows[0] == (keywords[0].id, now - timedelta(days=1), 24)
+    assert all(last is None for _, last, _ in rows[1:])
+
+
+def test_due_selection_is_one_set_based_filter(db, async_sessions, make_project):
+    """Only active keywords that are due (or never scheduled) and not under a live lease are selected"""
+    from app.services.scheduler import count_due_keywords, claim_due_keywords
+    from app.services.scheduling import get_now
+
+    now = get_now()
+    _, keywords = make_project(keywords=6)
+    keywords[0].next_due_at = now - timedelta(hours=2)
+    keywords[1].next_due_at = None
+    keywords[2].next_due_at = now + timedelta(hours=1)  # not due yet
+    keywords[3].is_active = False
+    keywords[4].leased_until = now + timedelta(minutes=5)  # held by another worker
+    keywords[5].leased_until = now - timedelta(minutes=5)  # lease ran out
+    keywords[5].next_due_at = now - timedelta(hours=1)
+    db.commit()
+
+    async def run():
+        async with async_sessions() as session:
+            due = await count_due_keywords(session, now=now)
+            claimed = await claim_due_keywords(session, limit=10, owner="a", now=now, fair=False)
+            await session.commit()
+            return due, claimed
+
+    due, claimed = asyncio.run(run())
+    assert due == 3
+    assert claimed == sorted([keywords[0].id, keywords[1].id, keywords[5].id])
+
+
+def test_next_due_at_follows_keyword_changes(db, make_project):
+    """New keywords are due now; interval changes and reactivation reschedule from the last check"""
+    from app.api.projects import create_keyword, update_keyword
+    from app.models.models import Keyword, RankResult
+    from app.schemas.schemas import KeywordCreate, KeywordUpdate
+    from app.services.scheduling import get_now, reschedule_keyword
+
+    project, _ = make_project()
+    user = project.owner
+    before = get_now().replace(tzinfo=None)
+    created = create_keyword(project.id, KeywordCreate(keyword="shoes", tracking_interval_hours=24), current_user=user, db=db)
+    keyword = db.get(Keyword, created.id)
+    assert before <= keyword.next_due_at.replace(tzinfo=None) <= get_now().replace(tzinfo=None)
+
+    checked = datetime(2024, 1, 1, 12, 0)
+    db.add(RankResult(keyword_id=keyword.id, checked_at=checked))
+    db.commit()
+
+    def next_due():
+        db.refresh(keyword)
+        return keyword.next_due_at.replace(tzinfo=timezone.utc)
+
+    update_keyword(keyword.id, KeywordUpdate(tracking_interval_hours=6), current_user=user, db=db)
+    six_hourly = next_due()
+    assert six_hourly == compute_next_due(6, checked, keyword.id)
+
+    # Unrelated edits and pausing keep the schedule
+    update_keyword(keyword.id, KeywordUpdate(keyword="running shoes", is_active=False), current_user=user, db=db)
+    assert next_due() == six_hourly
+
+    keyword.next_due_at = None
+    db.commit()
+    update_keyword(keyword.id, KeywordUpdate(is_active=True), current_user=user, db=db)
+    assert next_due() == six_hourly
+
+    # Without history the keyword is due right away
+    db.query(RankResult).delete()
+    reschedule_keyword(db, keyword)
+    assert keyword.next_due_at <= get_now()
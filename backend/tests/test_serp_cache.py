@@ -0,0 +1,91 @@
+"""
+SERP Cache Tests
+"""
+import asyncio
+import threading
+import pytest
+from app.services.serp_cache import SerpCache
+
+
+def test_single_flight_coalesces_concurrent_lookups():
+    """Concurrent identical lookups share one upstream fetch"""
+    cache = SerpCache(ttl_seconds=60, max_entries=10)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"results": []}
+
+    async def run():
+        return await asyncio.gather(*[
+            cache.get_or_fetch(("seo", "com", "en"), fetch) for _ in range(5)
+        ])
+
+    values = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(v == {"results": []} for v in values)
+    assert cache.coalesced == 4
+
+    asyncio.run(cache.get_or_fetch(("seo", "com", "en"), fetch))
+    assert len(calls) == 1
+    assert cache.hits == 1
+
+
+def test_max_age_and_lru_eviction():
+    """max_age=0 bypasses the cache and refreshes it; oldest entries are evicted first"""
+    cache = SerpCache(ttl_seconds=60, max_entries=2)
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.get_or_fetch((key, "com", "en"), lambda: asyncio.sleep(0, {"k": key}))
+        fresh = await cache.get_or_fetch(("c", "com", "en"), lambda: asyncio.sleep(0, {"k": "new"}), max_age=0)
+        cached = await cache.get_or_fetch(("c", "com", "en"), lambda: asyncio.sleep(0, {"k": "stale"}))
+        return fresh, cached
+
+    assert asyncio.run(run()) == ({"k": "new"}, {"k": "new"})
+    assert cache.evictions == 1
+    assert ("a", "com", "en") not in cache._entries
+
+
+def test_fetch_errors_are_not_cached():
+    """A failed fetch propagates and the next lookup retries upstream"""
+    cache = SerpCache(ttl_seconds=60, max_entries=10)
+
+    async def boom():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_fetch(("x", "com", "en"), boom))
+    assert cache.snapshot()["entries"] == 0
+    assert cache.snapshot()["inflight"] == 0
+
+
+def test_redis_client_of_another_loop_is_closed_there():
+    """A Redis client from a loop still running elsewhere is closed on that loop before it is replaced"""
+    cache = SerpCache(ttl_seconds=60, max_entries=10, redis_url="redis://localhost:1/0")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    closed_on = []
+
+    async def grab():
+        return cache._get_redis()
+
+    try:
+        first = asyncio.run_coroutine_threadsafe(grab(), loop).result()
+
+        async def aclose():
+            closed_on.append(asyncio.get_running_loop())
+
+        first.aclose = aclose
+        second = asyncio.run(grab())
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    assert second is not first
+    assert closed_on == [loop]
+    # That loop is gone now: the next loop's client simply replaces it
+    assert asyncio.run(grab()) is not second
@@ -0,0 +1,71 @@
+"""
+SERP Storage Tests
+"""
+import json
+from datetime import timedelta
+from app.models.models import RankResult, SerpSnapshot
+from app.services import serp_store
+from app.services.scheduling import get_now
+
+
+def _serp(variant=0):
+    serp = []
+    for position in range(1, 11):
+        domain = f"www.site{position}.com"
+        serp.append({
+            "position": position,
+            "title": f"Best running shoes {position} - Site {position}",
+            "link": f"https://{domain}/reviews/running-shoes-{position}?ref=serp",
+            "snippet": f"Compare the best running shoes of the year, tested by our editors ({position}).",
+            "domain": domain,
+        })
+    if variant:
+        # One result swaps places, another is replaced
+        serp[2], serp[3] = serp[3], serp[2]
+        serp[9] = {"title": "Plain http", "link": "http://old.example.org/", "snippet": None, "domain": "old.example.org"}
+        serp.append({"title": "No link", "link": None, "snippet": "x", "domain": ""})
+        for position, result in enumerate(serp, 1):
+            result["position"] = position
+    return serp
+
+
+def test_snapshots_are_shared_and_delta_encoded(db, make_project):
+    """Identical SERPs share one snapshot, a changed one is a small delta, both read back"""
+    make_project(keywords=2)
+    now = get_now()
+    entries = [
+        {"keyword_id": 1, "checked_at": now - timedelta(days=1), "serp": _serp()},
+        {"keyword_id": 2, "checked_at": now - timedelta(days=1), "serp": _serp()},
+        {"keyword_id": 1, "checked_at": now, "serp": _serp(variant=1)},
+    ]
+    serp_store.store_snapshots(db, entries)
+    for entry in entries:
+        db.add(RankResult(keyword_id=entry["keyword_id"], checked_at=entry["checked_at"], serp_snapshot_id=entry["serp_snapshot_id"]))
+    db.commit()
+
+    assert entries[0]["serp_snapshot_id"] == entries[1]["serp_snapshot_id"]
+    full, delta = db.query(SerpSnapshot).order_by(SerpSnapshot.id).all()
+    assert (delta.base_id, delta.depth) == (full.id, 1)
+    assert len(delta.payload) * 2 < len(full.payload)
+    assert len(full.payload) * 3 < len(json.dumps(_serp()))
+
+    serp_store._domain_ids.clear()
+    serp_store._domain_names.clear()
+    results = serp_store.attach_serps(db, db.query(RankResult).order_by(RankResult.id).all())
+    # Responses keep the top 10; the whole list is stored
+    assert [json.loads(result.serp_json) for result in results] == [_serp(), _serp(), _serp(variant=1)[:10]]
+    assert serp_store.decode_serps(db, results)[results[2].id] == _serp(variant=1)
+
+    # The delta goes with its last result; the base is still used by the other results
+    delta_result = db.query(RankResult).filter(RankResult.serp_snapshot_id == delta.id).one()
+    db.delete(delta_result)
+    db.flush()
+    assert serp_store.delete_unreferenced_snapshots(db, [delta.id, full.id]) == 1
+    db.commit()
+
+    # Only the given snapshots are checked; the full sweep finds the rest without being told
+    db.query(RankResult).delete()
+    db.commit()
+    assert serp_store.delete_unreferenced_snapshots(db, []) == 0
+    assert serp_store.sweep_unreferenced_snapshots(db, batch_size=10) == 1
+    assert db.query(SerpSnapshot).count() == 0
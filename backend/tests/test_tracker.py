@@ -0,0 +1,172 @@
+"""
+GoogleTracker Tests
+"""
+import asyncio
+import threading
+from app.services.tracker import GoogleTracker
+from app.services.admission import PriorityAdmission, INTERACTIVE, SCHEDULED
+
+
+def test_client_is_reused_within_loop():
+    """The pooled client is shared by every call on the same event loop"""
+    tracker = GoogleTracker(api_key="test")
+
+    async def run():
+        first = tracker._get_client()
+        second = tracker._get_client()
+        await tracker.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert tracker.stats.clients_created == 1
+
+
+def test_client_is_rebuilt_for_new_loop():
+    """A client bound to a finished loop is never reused"""
+    tracker = GoogleTracker(api_key="test")
+
+    async def grab():
+        return tracker._get_client()
+
+    first = asyncio.run(grab())
+    second = asyncio.run(grab())
+    assert first is not second
+    assert tracker.stats.clients_created == 2
+    # Its loop is gone, so it can only be dropped
+    assert tracker.stats.clients_dropped == 1
+
+
+def test_client_of_a_running_loop_is_closed_there():
+    """A client whose loop still runs in another thread is closed on that loop, not leaked"""
+    tracker = GoogleTracker(api_key="test")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+
+    async def grab():
+        return tracker._get_client()
+
+    try:
+        first = asyncio.run_coroutine_threadsafe(grab(), loop).result()
+        second = asyncio.run(grab())
+        # Let the scheduled close run
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    assert first.is_closed and not second.is_closed
+    assert tracker.stats.clients_dropped == 0
+
+
+def test_pool_stats_reuse_rate():
+    """Reuse rate is requests that did not open a new connection"""
+    tracker = GoogleTracker(api_key="test")
+    tracker.stats.requests = 10
+    tracker.stats.new_connections = 2
+
+    stats = tracker.pool_stats()
+    assert stats["reused_requests"] == 8
+    assert stats["reuse_rate"] == 0.8
+
+
+def test_token_bucket_burst_then_rate():
+    """Burst tokens are free; the rest are paced at `rate` per second"""
+    from app.services.rate_limiter import TokenBucket
+    bucket = TokenBucket(rate=100, burst=5)
+
+    async def run():
+        waits = [await bucket.acquire() for _ in range(7)]
+        return waits
+
+    waits = asyncio.run(run())
+    assert waits[:5] == [0.0] * 5
+    assert all(w > 0 for w in waits[5:])
+    assert not bucket.try_acquire()
+
+
+def test_cancelled_waiter_returns_its_token():
+    """The next caller only waits for calls that actually happened"""
+    from app.services.rate_limiter import TokenBucket
+    bucket = TokenBucket(rate=10, burst=1)
+
+    async def run():
+        await bucket.acquire()
+        waiter = asyncio.ensure_future(bucket.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        return await bucket.acquire()
+
+    # One token short (0.1s), not two (0.2s)
+    assert asyncio.run(run()) <= 0.1
+    assert bucket.acquired == 2
+
+
+def test_iter_track_multiple_completion_order_and_errors():
+    """Results stream back as they finish and failures carry error details"""
+    tracker = GoogleTracker(api_key="test")
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_search(keyword, country="com", language="en"):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep({"slow": 0.05, "fast": 0.0, "bad": 0.01}[keyword])
+        in_flight["now"] -= 1
+        if keyword == "bad":
+            raise ValueError("boom")
+        return {"results": [], "count": 0, "keyword": keyword, "country": country}
+
+    tracker.search = fake_search
+    keywords = [
+        {"id": 1, "keyword": "slow"},
+        {"id": 2, "keyword": "fast"},
+        {"id": 3, "keyword": "bad"},
+    ]
+
+    async def run():
+        return [item async for item in tracker.iter_track_multiple(keywords, concurrency=2)]
+
+    items = asyncio.run(run())
+    assert [i["keyword_id"] for i in items] == [2, 3, 1]
+    assert in_flight["max"] == 2
+    failed = items[1]
+    assert failed["success"] is False
+    assert failed["error"]["type"] == "ValueError"
+    assert failed["error"]["retryable"] is False
+
+
+def test_priority_admission_reserves_interactive_capacity():
+    """Background lanes can't use the reserved slot and yield to waiting interactive work"""
+    admission = PriorityAdmission(capacity=3, reserved_interactive=1, interactive_slo_seconds=1)
+    order = []
+
+    async def request(lane, name):
+        async with admission.slot(lane):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await admission.acquire(SCHEDULED)
+        await admission.acquire(SCHEDULED)
+        # Background limit reached, but the reserved slot still serves "track now"
+        background = asyncio.create_task(request(SCHEDULED, "scheduled"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(admission.acquire(INTERACTIVE), timeout=0.1)
+        assert admission.snapshot()["lanes"][SCHEDULED]["queued"] == 1
+
+        # All slots busy: when one frees up, the interactive waiter goes first
+        waiting = asyncio.create_task(request(INTERACTIVE, "interactive"))
+        await asyncio.sleep(0)
+        admission.release(SCHEDULED)
+        admission.release(INTERACTIVE)
+        await asyncio.gather(background, waiting)
+        admission.release(SCHEDULED)
+
+    asyncio.run(run())
+    assert order == ["interactive", "scheduled"]
+    assert admission.snapshot()["in_flight"] == 0
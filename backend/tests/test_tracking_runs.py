@@ -0,0 +1,48 @@
+"""
+Tracking Run Tests
+"""
+import asyncio
+from datetime import timedelta
+from app.models.models import TrackingRun, RunStatus
+from app.services import tracking_runs
+from app.services.scheduling import get_now
+
+
+def test_enqueue_is_idempotent_while_a_run_is_active(async_sessions, monkeypatch):
+    """A retried cron call gets the active run back; a dead run's lock is released"""
+    started = []
+
+    async def fake_job(run_id):
+        started.append(run_id)
+
+    monkeypatch.setattr(tracking_runs, "run_job", fake_job)
+
+    async def run():
+        async with async_sessions() as db:
+            first, created = await tracking_runs.enqueue_run(db)
+            assert created
+            again, created = await tracking_runs.enqueue_run(db)
+            assert not created and again.id == first.id
+
+            # No heartbeat for longer than the stale window: the next call starts over
+            first.heartbeat_at = get_now() - timedelta(hours=1)
+            await db.commit()
+            fresh, created = await tracking_runs.enqueue_run(db)
+            assert created and fresh.id != first.id
+            await db.refresh(first)
+            assert first.status == RunStatus.FAILED.value and first.lock_key is None
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(started) == 2
+
+
+def test_describe_run_estimates_remaining_time():
+    """ETA extrapolates the run's throughput over the remaining planned keywords"""
+    run = TrackingRun(
+        id=1, status=RunStatus.RUNNING.value, planned=100, done=25, failed=1, credits_used=24,
+        started_at=get_now() - timedelta(seconds=50)
+    )
+    progress = tracking_runs.describe_run(run)
+    assert progress["job_id"] == 1
+    assert 140 <= progress["eta_seconds"] <= 160
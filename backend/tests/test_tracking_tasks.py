@@ -0,0 +1,53 @@
+"""
+Celery Tracking Task Tests
+"""
+from datetime import timedelta
+from app.core.config import settings
+from app.models.models import CreditReservation, ReservationStatus, Subscription
+from app.services.scheduling import get_now
+from app.tasks import tracking_tasks
+
+
+def test_due_keywords_are_dispatched_in_chunks(async_sessions, make_project, monkeypatch):
+    """Every claimed batch becomes one group of CELERY_CHUNK_SIZE messages; claimed keywords are not dispatched twice"""
+    _, keywords = make_project(keywords=7)
+    dispatched = []
+
+    class Group:
+        def __init__(self, signatures):
+            self.signatures = list(signatures)
+
+        def apply_async(self):
+            dispatched.append([signature.args[0] for signature in self.signatures])
+
+    monkeypatch.setattr(tracking_tasks, "AsyncSessionLocal", async_sessions)
+    monkeypatch.setattr(tracking_tasks, "group", Group)
+    monkeypatch.setattr(settings, "SCHEDULER_BATCH_SIZE", 5)
+    monkeypatch.setattr(settings, "CELERY_CHUNK_SIZE", 2)
+
+    summary = tracking_tasks.process_all_keywords_task()
+    assert [list(map(len, chunks)) for chunks in dispatched] == [[2, 2, 1], [2]]
+    assert sorted(keyword_id for chunks in dispatched for chunk in chunks for keyword_id in chunk) == \
+        sorted(keyword.id for keyword in keywords)
+    assert (summary["due_count"], summary["messages"]) == (7, 4)
+    assert tracking_tasks.process_all_keywords_task()["messages"] == 0
+
+
+def test_planner_refunds_reservations_of_killed_chunks(db, async_sessions, make_project, monkeypatch):
+    """A chunk that died before settling leaves an ACTIVE reservation; the next planner run refunds its unused part"""
+    project, _ = make_project(credits=2)
+    # 3 reserved by the dead chunk, 1 of them already stored as used
+    db.add(CreditReservation(
+        user_id=project.user_id, amount=3, consumed=1, refunded=0,
+        status=ReservationStatus.ACTIVE.value, expires_at=get_now() - timedelta(minutes=1)
+    ))
+    db.commit()
+    monkeypatch.setattr(tracking_tasks, "AsyncSessionLocal", async_sessions)
+
+    summary = tracking_tasks.process_all_keywords_task()
+    assert summary["credits_refunded"] == 2
+    db.expire_all()
+    assert db.query(Subscription.credits).scalar() == 4
+    reservation = db.query(CreditReservation).one()
+    assert (reservation.status, reservation.refunded) == (ReservationStatus.SETTLED.value, 2)
+    assert tracking_tasks.process_all_keywords_task()["credits_refunded"] == 0